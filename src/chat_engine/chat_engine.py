@@ -1,3 +1,4 @@
+import asyncio
 import os
 import uuid
 from typing import Optional, Dict
@@ -8,7 +9,9 @@ from chat_engine.common.client_handler_base import ClientHandlerBase
 from chat_engine.contexts.session_context import SessionContext
 from chat_engine.core.chat_session import ChatSession
 from chat_engine.core.handler_manager import HandlerManager
-from chat_engine.data_models.chat_engine_config_data import ChatEngineConfigModel, EngineChannelType
+from chat_engine.core.session_event_loop import SessionEventLoop
+from chat_engine.data_models.chat_engine_config_data import ChatEngineConfigModel, EngineChannelType, \
+    SessionPumpMode
 from chat_engine.data_models.session_info_data import SessionInfoData, IOQueueType
 from engine_utils.directory_info import DirectoryInfo
 from dotenv import load_dotenv
@@ -21,6 +24,7 @@ class ChatEngine(object):
         self.handler_manager: HandlerManager = HandlerManager(self)
 
         self.sessions: Dict[str, ChatSession] = {}
+        self.session_event_loop: Optional[SessionEventLoop] = None
 
     def initialize(self, engine_config: ChatEngineConfigModel, app=None, ui=None, parent_block=None):
         if self.inited:
@@ -33,6 +37,9 @@ class ChatEngine(object):
             engine_config.model_root = os.path.join(DirectoryInfo.get_project_dir(), engine_config.model_root)
         self.handler_manager.initialize(engine_config)
         self.handler_manager.load_handlers(engine_config, app, ui, parent_block)
+        if engine_config.pump_mode == SessionPumpMode.ASYNCIO:
+            self.session_event_loop = SessionEventLoop(engine_config.async_executor_workers)
+            self.session_event_loop.start()
         self.inited = True
 
     def _create_session(self, session_info: SessionInfoData,
@@ -43,18 +50,24 @@ class ChatEngine(object):
         if session_info.session_id in self.sessions:
             raise RuntimeError(f"session {session_info.session_id} already exists")
 
+        try:
+            output_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            output_loop = None
         session_context = SessionContext(session_info=session_info,
                                          input_queues=input_queues,
-                                         output_queues=output_queues)
+                                         output_queues=output_queues,
+                                         output_loop=output_loop)
 
-        session = ChatSession(session_context, self.engine_config)
+        session = ChatSession(session_context, self.engine_config, self.session_event_loop)
         handlers = self.handler_manager.get_enabled_handler_registries()
         for registry in handlers:
             if isinstance(registry.handler, ClientHandlerBase):
                 # client create_context and data_sink creation of handler is not called here,
                 # they are created by its internal logic after every other handlers are ready.
                 continue
-            session.prepare_handler(registry.handler, registry.base_info, registry.handler_config)
+            session.prepare_handler(registry.handler, registry.base_info, registry.handler_config,
+                                    registry.worker_pool)
         self.sessions[session_info.session_id] = session
         return session
 
@@ -70,7 +83,8 @@ class ChatEngine(object):
         if registry is None:
             raise RuntimeError(f"client handler {client_handler} not found")
 
-        handler_env = session.prepare_handler(client_handler, registry.base_info, registry.handler_config)
+        handler_env = session.prepare_handler(client_handler, registry.base_info, registry.handler_config,
+                                              registry.worker_pool)
         return session, handler_env
 
     def stop_session(self, session_id: str):
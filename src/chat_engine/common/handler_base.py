@@ -2,13 +2,14 @@ import weakref
 from abc import ABC, abstractmethod
 from dataclasses import dataclass, field
 from enum import Enum
-from typing import Optional, Dict
+from typing import Any, Callable, Optional, Dict
 
 from chat_engine.data_models.chat_data_type import ChatDataType
 from chat_engine.contexts.handler_context import HandlerContext
 from chat_engine.contexts.session_context import SessionContext
 from chat_engine.data_models.chat_data.chat_data_model import ChatData
 from chat_engine.data_models.chat_engine_config_data import ChatEngineConfigModel, HandlerBaseConfigModel
+from chat_engine.data_models.chat_signal import ChatSignal
 from chat_engine.data_models.runtime_data.data_bundle import DataBundleDefinition
 
 
@@ -32,6 +33,15 @@ class HandlerDataInfo:
     definition: Optional[DataBundleDefinition] = None
     input_priority: int = 0
     input_consume_mode: ChatDataConsumeMode = ChatDataConsumeMode.DEFAULT
+    # delivery policies applied by session router before inputs are queued to the handler
+    # deliver at most this many inputs per second to the handler, the rest are dropped, 0 for no limit
+    max_rate: float = 0
+    # deliver one of every decimation inputs
+    decimation: int = 1
+    # keep only the latest undelivered input, it replaces the older one waiting in handler queue
+    latest_only: bool = False
+    # deliver only inputs whose data bundle metadata satisfies the predicate
+    meta_predicate: Optional[Callable[[Dict[str, Any]], bool]] = None
 
     def __lt__(self, other):
         if self.input_priority == other.input_priority:
@@ -84,3 +94,9 @@ class HandlerBase(ABC):
     @abstractmethod
     def destroy_context(self, context: HandlerContext):
         pass
+
+    def on_signal(self, context: HandlerContext, signal: ChatSignal):
+        """
+        Called with signals emitted to the session, from the thread emitting them.
+        """
+        pass
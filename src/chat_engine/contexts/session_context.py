@@ -1,10 +1,12 @@
+import asyncio
 import time
 from dataclasses import dataclass
-from typing import Dict, List, Tuple
+from typing import Callable, Dict, List, Tuple, Optional
 
 from loguru import logger
 
 from chat_engine.data_models.chat_engine_config_data import EngineChannelType
+from chat_engine.data_models.chat_signal import ChatSignal
 from chat_engine.data_models.runtime_data.data_bundle import DataBundleDefinition, DataBundleEntry
 from chat_engine.data_models.session_info_data import SessionInfoData, IOQueueType
 
@@ -18,11 +20,16 @@ class SharedStates:
 class SessionContext(object):
     def __init__(self, session_info: SessionInfoData,
                  input_queues: Dict[EngineChannelType, IOQueueType],
-                 output_queues: Dict[EngineChannelType, IOQueueType]):
+                 output_queues: Dict[EngineChannelType, IOQueueType],
+                 output_loop: Optional[asyncio.AbstractEventLoop] = None):
         self.session_info = session_info
         self.input_queues = input_queues
         self.output_queues = output_queues
+        # event loop which owns asyncio output queues, data from other threads are delivered through it
+        self.output_loop = output_loop
         self.shared_states = SharedStates()
+        # emits a signal to the session, set by the chat session owning the context
+        self.signal_emitter: Optional[Callable[[ChatSignal], None]] = None
         self.input_definitions: Dict[EngineChannelType, DataBundleDefinition] = {}
         self.input_start_time: float = -1.0
 
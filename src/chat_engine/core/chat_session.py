@@ -1,7 +1,9 @@
 import asyncio
+import functools
 import queue
 import threading
 import time
+from concurrent.futures import Future
 from dataclasses import dataclass
 from typing import Optional, Dict, List, Tuple, Iterable
 from uuid import uuid4
@@ -14,8 +16,11 @@ from chat_engine.common.engine_channel_type import EngineChannelType
 from chat_engine.common.handler_base import HandlerBase, HandlerBaseInfo, HandlerDataInfo, ChatDataConsumeMode
 from chat_engine.contexts.handler_context import HandlerContext, HandlerResultType
 from chat_engine.contexts.session_context import SessionContext
+from chat_engine.core.handler_worker_pool import HandlerWorkerPool, HandlerLane
+from chat_engine.core.session_event_loop import SessionEventLoop
 from chat_engine.data_models.chat_data.chat_data_model import ChatData
-from chat_engine.data_models.chat_engine_config_data import HandlerBaseConfigModel, ChatEngineConfigModel
+from chat_engine.data_models.chat_engine_config_data import HandlerBaseConfigModel, ChatEngineConfigModel, \
+    SessionPumpMode
 from chat_engine.data_models.chat_signal import ChatSignal
 from chat_engine.data_models.chat_signal_type import ChatSignalSourceType, ChatSignalType
 from chat_engine.data_models.runtime_data.data_bundle import DataBundle
@@ -28,7 +33,7 @@ class HandlerEnv:
     handler: HandlerBase
     config: HandlerBaseConfigModel
     context: Optional[HandlerContext] = None
-    input_queue: Optional[queue.Queue] = None
+    input_queue: Optional[IOQueueType] = None
     output_info: Optional[Dict[ChatDataType, HandlerDataInfo]] = None
 
 
@@ -36,6 +41,7 @@ class HandlerEnv:
 class HandlerRecord:
     env: HandlerEnv
     pump_thread: Optional[threading.Thread] = None
+    pump_future: Optional[Future] = None
 
 
 @dataclass
@@ -45,11 +51,70 @@ class DataSource:
     target_types: List[ChatDataType] = None
 
 
+class LatestInputSlot:
+    """
+    Queued in place of latest only inputs, newer input replaces the one held while the slot waits in queue.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.data: Optional[ChatData] = None
+
+    def replace(self, data: ChatData) -> bool:
+        # returns whether the slot is already waiting in queue
+        with self.lock:
+            queued = self.data is not None
+            self.data = data
+            return queued
+
+    def take(self) -> Optional[ChatData]:
+        with self.lock:
+            data = self.data
+            self.data = None
+            return data
+
+
 @dataclass
 class DataSink:
     owner: str = ""
-    sink_queue: queue.Queue = None
+    sink_queue: IOQueueType = None
     consume_info: Optional[HandlerDataInfo] = None
+    # event loop owning sink_queue, if set data is put through call_soon_threadsafe
+    loop: Optional[asyncio.AbstractEventLoop] = None
+    last_delivery_time: float = 0.0
+    received_num: int = 0
+    latest_slot: Optional[LatestInputSlot] = None
+
+    def accept(self, data: ChatData) -> bool:
+        consume_info = self.consume_info
+        if consume_info is None:
+            return True
+        if consume_info.meta_predicate is not None:
+            metadata = data.data.metadata if data.data is not None else {}
+            if not consume_info.meta_predicate(metadata):
+                return False
+        if consume_info.decimation > 1:
+            self.received_num += 1
+            if (self.received_num - 1) % consume_info.decimation != 0:
+                return False
+        if consume_info.max_rate > 0:
+            now = time.monotonic()
+            if now - self.last_delivery_time < 1 / consume_info.max_rate:
+                return False
+            self.last_delivery_time = now
+        return True
+
+    def put(self, data: ChatData):
+        if self.consume_info is not None and self.consume_info.latest_only:
+            if self.latest_slot is None:
+                self.latest_slot = LatestInputSlot()
+            if self.latest_slot.replace(data):
+                return
+            data = self.latest_slot
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.sink_queue.put_nowait, data)
+        else:
+            self.sink_queue.put_nowait(data)
 
 
 class ChatDataSubmitter:
@@ -97,8 +162,19 @@ class ChatSession:
         EngineChannelType.TEXT: [ChatDataType.HUMAN_TEXT]
     }
 
-    def __init__(self, session_context: SessionContext, engine_config: ChatEngineConfigModel):
+    # sleep time of polling pump mode when queue is empty
+    polling_interval = 0.03
+    # max blocking time of blocking pump mode, pumps check session active state at least this often
+    blocking_timeout = 0.1
+
+    def __init__(self, session_context: SessionContext, engine_config: ChatEngineConfigModel,
+                 event_loop: Optional[SessionEventLoop] = None):
         self.session_context = session_context
+        session_context.signal_emitter = self.emit_signal
+        self.pump_mode = engine_config.pump_mode
+        self.event_loop = event_loop
+        if self.pump_mode == SessionPumpMode.ASYNCIO and self.event_loop is None:
+            raise ValueError("Asyncio pump mode requires a session event loop.")
 
         self.data_sinks: Dict[ChatDataType, List[DataSink]] = {}
         self.inputs: List[DataSource] = []
@@ -138,6 +214,7 @@ class ChatSession:
                     owner="",
                     sink_queue=output_queue,
                     consume_info = HandlerDataInfo(type=output_info.type),
+                    loop=session_context.output_loop if isinstance(output_queue, asyncio.Queue) else None,
                 )
 
     @classmethod
@@ -203,6 +280,8 @@ class ChatSession:
     def inputs_pumper(cls, session_context: SessionContext, inputs: List[DataSource],
                     sinks: Dict[ChatDataType, List[DataSink]],
                     outputs: Dict[Tuple[str, ChatDataType], DataSink]):
+        # external input queues may be asyncio queues of the client loop, which can not be waited on from this
+        # thread, so they are polled whatever the pump mode is. Client handlers submit their inputs directly.
         shared_states = session_context.shared_states
         while shared_states.active:
             input_data_list = []
@@ -216,7 +295,7 @@ class ChatSession:
                 except (queue.Empty, asyncio.QueueEmpty):
                     continue
             if len(input_data_list) == 0:
-                time.sleep(0.03)
+                time.sleep(cls.polling_interval)
                 continue
             for input_source, input_data in input_data_list:
                 for target_type in input_source.target_types:
@@ -278,12 +357,14 @@ class ChatSession:
         source_key = (data.source, data.type)
         data_sink = outputs.get(source_key, None)
         if data_sink is not None:
-            data_sink.sink_queue.put_nowait(data)
+            data_sink.put(data)
         sink_list = sinks.get(data.type, [])
         for sink in sink_list:
             if sink.owner == data.source:
                 continue
-            sink.sink_queue.put_nowait(data)
+            if not sink.accept(data):
+                continue
+            sink.put(data)
             if sink.consume_info.input_consume_mode == ChatDataConsumeMode.ONCE:
                 break
 
@@ -294,49 +375,102 @@ class ChatSession:
         if chat_data is not None:
             cls.distribute_data(chat_data, sinks, outputs)
 
+    @classmethod
+    def fetch_input(cls, input_queue: queue.Queue, pump_mode: SessionPumpMode):
+        if pump_mode == SessionPumpMode.POLLING:
+            try:
+                return input_queue.get_nowait()
+            except queue.Empty:
+                time.sleep(cls.polling_interval)
+                return None
+        try:
+            return input_queue.get(timeout=cls.blocking_timeout)
+        except queue.Empty:
+            return None
+
+    @classmethod
+    def process_input(cls, session_context: SessionContext, handler_env: HandlerEnv, input_data: ChatData,
+                      sinks: Dict[ChatDataType, List[DataSink]],
+                      outputs: Dict[Tuple[str, ChatDataType], DataSink]):
+        if isinstance(input_data, LatestInputSlot):
+            input_data = input_data.take()
+            if input_data is None:
+                return
+        output_info = handler_env.output_info
+        if output_info is None:
+            output_info = {}
+        handler_result = handler_env.handler.handle(handler_env.context, input_data, output_info)
+        if not isinstance(handler_result, Iterable):
+            handler_result = [handler_result]
+        for handler_output in handler_result:
+            if handler_result is None:
+                continue
+            chat_data = cls._packet_chat_data(
+                handler_env.handler_info.name,
+                output_info,
+                session_context,
+                handler_output
+            )
+            if chat_data is None:
+                continue
+            cls.distribute_data(chat_data, sinks, outputs)
+
     @classmethod
     def handler_pumper(cls, session_context: SessionContext, handler_env: HandlerEnv,
                        sinks: Dict[ChatDataType, List[DataSink]],
-                       outputs: Dict[Tuple[str, ChatDataType], DataSink]):
+                       outputs: Dict[Tuple[str, ChatDataType], DataSink],
+                       pump_mode: SessionPumpMode = SessionPumpMode.BLOCKING):
+        shared_states = session_context.shared_states
+        input_queue = handler_env.input_queue
+        while shared_states.active:
+            input_data = cls.fetch_input(input_queue, pump_mode)
+            if input_data is None:
+                continue
+            cls.process_input(session_context, handler_env, input_data, sinks, outputs)
+
+    @classmethod
+    async def async_handler_pumper(cls, session_context: SessionContext, handler_env: HandlerEnv,
+                                   sinks: Dict[ChatDataType, List[DataSink]],
+                                   outputs: Dict[Tuple[str, ChatDataType], DataSink],
+                                   event_loop: SessionEventLoop):
         shared_states = session_context.shared_states
         input_queue = handler_env.input_queue
-        handler = handler_env.handler
-        output_info = handler_env.output_info
-        if output_info is None:
-            output_info = {}
         while shared_states.active:
             try:
-                input_data = input_queue.get_nowait()
-            except (queue.Empty, asyncio.QueueEmpty):
-                time.sleep(0.03)
+                input_data = await asyncio.wait_for(input_queue.get(), cls.blocking_timeout)
+            except asyncio.TimeoutError:
                 continue
-            handler_result = handler.handle(handler_env.context, input_data, output_info)
-            if not isinstance(handler_result, Iterable):
-                handler_result = [handler_result]
-            for handler_output in handler_result:
-                if handler_result is None:
-                    continue
-                chat_data = cls._packet_chat_data(
-                    handler_env.handler_info.name,
-                    output_info,
-                    session_context,
-                    handler_output
-                )
-                if chat_data is None:
-                    continue
-                cls.distribute_data(chat_data, sinks, outputs)
+            try:
+                await event_loop.run_blocking(cls.process_input, session_context, handler_env, input_data,
+                                              sinks, outputs)
+            except Exception as e:
+                logger.opt(exception=e).error(f"Handler {handler_env.handler_info.name} failed to handle input.")
 
     def prepare_handler(self, handler: HandlerBase, handler_info: HandlerBaseInfo,
-                        handler_config: HandlerBaseConfigModel):
+                        handler_config: HandlerBaseConfigModel, worker_pool: Optional[HandlerWorkerPool] = None):
         handler_env = HandlerEnv(handler_info=handler_info, handler=handler, config=handler_config)
         handler_env.context = handler.create_context(self.session_context, handler_env.config)
         handler_env.context.owner = handler_info.name
-        handler_env.input_queue = queue.Queue()
+        sink_loop = None
+        if self.pump_mode == SessionPumpMode.ASYNCIO:
+            handler_env.input_queue = asyncio.Queue()
+            sink_loop = self.event_loop.loop
+        elif self.pump_mode == SessionPumpMode.WORKER_POOL:
+            if worker_pool is None:
+                raise ValueError(f"Worker pool pump mode requires a worker pool for handler {handler_info.name}.")
+            handler_env.input_queue = worker_pool.create_lane(
+                functools.partial(self.process_input, self.session_context, handler_env,
+                                  sinks=self.data_sinks, outputs=self.outputs),
+                name=f"{handler_info.name}@{self.session_context.session_info.session_id}"
+            )
+        else:
+            handler_env.input_queue = queue.Queue()
         io_detail = handler.get_handler_detail(self.session_context, handler_env.context)
         inputs = io_detail.inputs
         for input_type, input_info in inputs.items():
             sink_list = self.data_sinks.setdefault(input_type, [])
-            data_sink = DataSink(owner=handler_info.name, sink_queue=handler_env.input_queue, consume_info=input_info)
+            data_sink = DataSink(owner=handler_info.name, sink_queue=handler_env.input_queue, consume_info=input_info,
+                                 loop=sink_loop)
             sink_list.append(data_sink)
         handler_env.output_info = io_detail.outputs
 
@@ -354,7 +488,7 @@ class ChatSession:
         self.sort_sinks()
         for handler_name, handler_record in self.handlers.items():
             start_args = (self.session_context, handler_record.env,
-                          self.data_sinks, self.outputs)
+                          self.data_sinks, self.outputs, self.pump_mode)
             handler_submitter = ChatDataSubmitter(
                 handler_name,
                 handler_record.env.output_info,
@@ -364,11 +498,20 @@ class ChatSession:
             )
             handler_record.env.context.data_submitter = handler_submitter
             handler_record.env.handler.start_context(self.session_context, handler_record.env.context)
-            handler_record.pump_thread = threading.Thread(target=self.handler_pumper, args=start_args)
-            handler_record.pump_thread.start()
-        input_pumper_args = (self.session_context, self.inputs, self.data_sinks, self.outputs)
-        self.input_pump_thread = threading.Thread(target=self.inputs_pumper, args=input_pumper_args)
-        self.input_pump_thread.start()
+            if self.pump_mode == SessionPumpMode.WORKER_POOL:
+                # inputs are scheduled to the shared worker pool of the handler by its lane, no pump is needed
+                continue
+            if self.pump_mode == SessionPumpMode.ASYNCIO:
+                handler_record.pump_future = self.event_loop.submit(self.async_handler_pumper(
+                    self.session_context, handler_record.env, self.data_sinks, self.outputs, self.event_loop))
+            else:
+                handler_record.pump_thread = threading.Thread(target=self.handler_pumper, args=start_args)
+                handler_record.pump_thread.start()
+        # external input queues are not owned by the session loop, they are always served by a pump thread
+        if len(self.inputs) > 0:
+            input_pumper_args = (self.session_context, self.inputs, self.data_sinks, self.outputs)
+            self.input_pump_thread = threading.Thread(target=self.inputs_pumper, args=input_pumper_args)
+            self.input_pump_thread.start()
         self.session_context.set_input_start()
 
     def stop(self):
@@ -380,6 +523,11 @@ class ChatSession:
             if handler_record.pump_thread:
                 handler_record.pump_thread.join()
                 handler_record.pump_thread = None
+            if handler_record.pump_future:
+                handler_record.pump_future.result()
+                handler_record.pump_future = None
+            if isinstance(handler_record.env.input_queue, HandlerLane):
+                handler_record.env.input_queue.close()
             handler_record.env.handler.destroy_context(handler_record.env.context)
         self.handlers.clear()
         self.session_context.cleanup()
@@ -392,3 +540,8 @@ class ChatSession:
         # TODO this is temp implementation a full signal infrastructure is needed.
         if signal.source_type == ChatSignalSourceType.CLIENT and signal.type == ChatSignalType.END:
             self.session_context.shared_states.enable_vad = True
+        for handler_name, handler_record in list(self.handlers.items()):
+            try:
+                handler_record.env.handler.on_signal(handler_record.env.context, signal)
+            except Exception as e:
+                logger.opt(exception=e).error(f"Handler {handler_name} failed to handle signal {signal.type}.")
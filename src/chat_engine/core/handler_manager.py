@@ -15,7 +15,9 @@ from loguru import logger
 
 from chat_engine.common.client_handler_base import ClientHandlerBase
 from chat_engine.common.handler_base import HandlerBaseInfo, HandlerBase
-from chat_engine.data_models.chat_engine_config_data import HandlerBaseConfigModel, ChatEngineConfigModel
+from chat_engine.core.handler_worker_pool import HandlerWorkerPool
+from chat_engine.data_models.chat_engine_config_data import HandlerBaseConfigModel, ChatEngineConfigModel, \
+    SessionPumpMode
 from engine_utils.directory_info import DirectoryInfo
 
 
@@ -24,6 +26,7 @@ class HandlerRegistry:
     base_info: Optional[HandlerBaseInfo] = field(default=None)
     handler: Optional[HandlerBase] = field(default=None)
     handler_config: Optional[HandlerBaseConfigModel] = field(default=None)
+    worker_pool: Optional[HandlerWorkerPool] = field(default=None)
 
 
 class HandlerManager:
@@ -140,6 +143,8 @@ class HandlerManager:
             registry.handler.load(engine_config, registry.handler_config)
             dur_load = time.monotonic() - load_start
             logger.info(f"Handler {registry.base_info.name} loaded in {round(dur_load * 1e3)} milliseconds")
+        if engine_config.pump_mode == SessionPumpMode.WORKER_POOL:
+            self.create_worker_pools(engine_config)
         if app is not None or ui is not None:
             for registry in client_handlers:
                 setup_start = time.monotonic()
@@ -147,6 +152,16 @@ class HandlerManager:
                 dur_setup = time.monotonic() - setup_start
                 logger.info(f"Setup client handler {registry.base_info.name} loaded in {round(dur_setup * 1e3)} milliseconds")
 
+    def create_worker_pools(self, engine_config: ChatEngineConfigModel):
+        for registry in self.get_enabled_handler_registries():
+            if registry.worker_pool is not None:
+                continue
+            max_concurrency = registry.handler_config.max_concurrency
+            if max_concurrency is None:
+                max_concurrency = engine_config.handler_max_concurrency
+            registry.worker_pool = HandlerWorkerPool(registry.base_info.name, max_concurrency)
+            logger.info(f"Handler {registry.base_info.name} uses worker pool with {max_concurrency} workers")
+
     def get_enabled_handler_registries(self, order_by_priority=True):
         result = []
         for handler_name, registry in self.handler_registries.items():
@@ -0,0 +1,94 @@
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from loguru import logger
+
+
+class HandlerLane:
+    """
+    Serial lane of one handler in one session. Inputs put into the lane are handled in order by the worker pool,
+    at most one worker runs a lane at any time, so per session ordering is preserved.
+    The lane implements put_nowait, so it can be used as input queue of data sinks.
+    """
+
+    def __init__(self, pool: "HandlerWorkerPool", process_func: Callable, name: str = ""):
+        self.pool = pool
+        self.process_func = process_func
+        self.name = name
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._scheduled = False
+        self._closed = False
+        self._idle = threading.Event()
+        self._idle.set()
+
+    def put_nowait(self, data):
+        with self._lock:
+            if self._closed:
+                return
+            self._pending.append(data)
+            if self._scheduled:
+                return
+            self._scheduled = True
+            self._idle.clear()
+        self.pool.schedule(self)
+
+    def qsize(self) -> int:
+        return len(self._pending)
+
+    def empty(self) -> bool:
+        return len(self._pending) == 0
+
+    def run(self):
+        # handle a bounded number of inputs and then yield the worker, a busy session can not starve the others
+        for _ in range(self.pool.lane_batch_size):
+            with self._lock:
+                if self._closed or len(self._pending) == 0:
+                    self._scheduled = False
+                    self._idle.set()
+                    return
+                data = self._pending.popleft()
+            try:
+                self.process_func(data)
+            except Exception as e:
+                logger.opt(exception=e).error(f"Handler lane {self.name} failed to handle input.")
+        with self._lock:
+            if self._closed or len(self._pending) == 0:
+                self._scheduled = False
+                self._idle.set()
+                return
+        self.pool.schedule(self)
+
+    def close(self, timeout: Optional[float] = None):
+        """
+        Drop pending inputs and wait for the running input to finish, so the handler context can be destroyed safely.
+        """
+        with self._lock:
+            self._closed = True
+            self._pending.clear()
+        if not self._idle.wait(timeout):
+            logger.warning(f"Handler lane {self.name} is still running after {timeout} seconds.")
+
+
+class HandlerWorkerPool:
+    """
+    Fixed size pool of workers shared by all sessions of one handler, max_workers bounds the concurrency of the handler
+    on the node no matter how many sessions are running.
+    """
+
+    def __init__(self, name: str, max_workers: int, lane_batch_size: int = 8):
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self.lane_batch_size = max(1, lane_batch_size)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"{name}_worker")
+
+    def create_lane(self, process_func: Callable, name: Optional[str] = None) -> HandlerLane:
+        return HandlerLane(self, process_func, self.name if name is None else name)
+
+    def schedule(self, lane: HandlerLane):
+        self.executor.submit(lane.run)
+
+    def shutdown(self, wait: bool = True):
+        self.executor.shutdown(wait=wait)
@@ -0,0 +1,57 @@
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional, Coroutine, Callable
+
+from loguru import logger
+
+
+class SessionEventLoop:
+    """
+    A single event loop running in its own thread, it hosts pumps of all sessions in asyncio pump mode.
+    Blocking handler calls are offloaded to a bounded thread pool shared by all sessions.
+    """
+
+    def __init__(self, max_workers: int = 16):
+        self.max_workers = max_workers
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.loop_thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self.loop is not None and self.loop.is_running()
+
+    def start(self):
+        if self.loop_thread is not None:
+            return
+        self.loop = asyncio.new_event_loop()
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="handler_worker")
+        loop_started = threading.Event()
+
+        def run_loop():
+            asyncio.set_event_loop(self.loop)
+            self.loop.call_soon(loop_started.set)
+            self.loop.run_forever()
+            self.loop.close()
+
+        self.loop_thread = threading.Thread(target=run_loop, name="session_event_loop", daemon=True)
+        self.loop_thread.start()
+        loop_started.wait()
+        logger.info(f"Session event loop started with {self.max_workers} handler workers.")
+
+    def stop(self):
+        if self.loop_thread is None:
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.loop_thread.join()
+        self.loop_thread = None
+        self.executor.shutdown(wait=True)
+        self.executor = None
+        self.loop = None
+
+    def submit(self, coroutine: Coroutine) -> Future:
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def run_blocking(self, func: Callable, *args) -> asyncio.Future:
+        return self.loop.run_in_executor(self.executor, func, *args)
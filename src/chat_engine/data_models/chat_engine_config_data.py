@@ -1,3 +1,4 @@
+from enum import Enum
 from typing import Dict, Optional, List, Union
 
 from pydantic import BaseModel, Field
@@ -9,6 +10,19 @@ from chat_engine.common.engine_channel_type import EngineChannelType
 class HandlerBaseConfigModel(BaseModel):
     enabled: bool = Field(default=True)
     module: Optional[str] = Field(default=None)
+    # max number of sessions handled concurrently in worker pool pump mode, use engine default if not set
+    max_concurrency: Optional[int] = Field(default=None)
+
+
+class SessionPumpMode(str, Enum):
+    # original behaviour, queues are polled with a fixed sleep when empty
+    POLLING = "polling"
+    # handler pumps block on their queues and wake up as soon as data arrives
+    BLOCKING = "blocking"
+    # pumps of all sessions run as asyncio tasks on one event loop, handlers are called in a bounded executor
+    ASYNCIO = "asyncio"
+    # each handler owns a fixed worker pool shared by all sessions, every session has a serial lane in the pool
+    WORKER_POOL = "worker_pool"
 
 
 class ChatEngineOutputSource(BaseModel):
@@ -22,3 +36,8 @@ class ChatEngineConfigModel(BaseModel):
     handler_configs: Optional[Dict[str, Dict]] = None
     outputs: Dict[EngineChannelType, ChatEngineOutputSource] = Field(default_factory=dict)
     turn_config: Optional[Dict] = Field(default=None)
+    pump_mode: SessionPumpMode = Field(default=SessionPumpMode.BLOCKING)
+    # max number of handler calls running concurrently in asyncio pump mode
+    async_executor_workers: int = Field(default=16)
+    # worker pool size of handlers which do not declare max_concurrency in worker pool pump mode
+    handler_max_concurrency: int = Field(default=4)
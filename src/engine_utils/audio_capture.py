@@ -0,0 +1,150 @@
+import os
+import queue
+import threading
+import time
+from typing import Dict, Optional
+
+import numpy as np
+from loguru import logger
+from pydantic import BaseModel, Field
+
+from engine_utils.directory_info import DirectoryInfo
+from engine_utils.singleton import SingletonMeta
+from engine_utils.stream_resampler import StreamResampler
+
+
+class AudioCaptureConfig(BaseModel):
+    enabled: bool = Field(default=False)
+    # write captured audio to raw float32 pcm files, one file per session
+    write_file: bool = Field(default=True)
+    # directory of capture files, relative to project root if not absolute
+    dump_dir: str = Field(default="dump_audio")
+    # keep the latest audio of this length in memory, 0 to disable
+    ring_buffer_seconds: float = Field(default=0)
+    # audio of other sample rate is resampled to this one before it is captured
+    sample_rate: int = Field(default=16000)
+    # max pending captures, audio is dropped instead of blocking the caller when writer falls behind
+    max_pending: int = Field(default=256)
+
+
+class AudioCaptureWriter(metaclass=SingletonMeta):
+    """
+    Background writer shared by all audio captures, file io and resampling never happen on the caller thread.
+    """
+
+    def __init__(self, max_pending: int = 256):
+        self.task_queue = queue.Queue(maxsize=max_pending)
+        self.dropped_num = 0
+        self.thread = threading.Thread(target=self._run, name="audio_capture_writer", daemon=True)
+        self.thread.start()
+
+    def submit(self, capture: "AudioCapture", audio: Optional[np.ndarray], sample_rate: int = 0, block=False):
+        try:
+            self.task_queue.put((capture, audio, sample_rate), block=block)
+        except queue.Full:
+            self.dropped_num += 1
+            if self.dropped_num % 100 == 1:
+                logger.warning(f"Audio capture writer is falling behind, {self.dropped_num} captures dropped.")
+
+    def flush(self):
+        self.task_queue.join()
+
+    def _run(self):
+        while True:
+            capture, audio, sample_rate = self.task_queue.get()
+            try:
+                if audio is None:
+                    capture.close_file()
+                else:
+                    capture.process(audio, sample_rate)
+            except Exception as e:
+                logger.opt(exception=e).error(f"Failed to capture audio of {capture.name}")
+            finally:
+                self.task_queue.task_done()
+
+
+class AudioCapture:
+    """
+    Capture audio of a session for debugging. Callers only enqueue audio, it is written to file and kept in
+    an optional in-memory ring buffer by the shared background writer.
+    """
+
+    def __init__(self, config: AudioCaptureConfig, name: str):
+        self.config = config
+        self.name = name
+        self.writer = AudioCaptureWriter(config.max_pending)
+        self.file_path = None
+        self.file = None
+        if config.write_file:
+            dump_dir = config.dump_dir
+            if not os.path.isabs(dump_dir):
+                dump_dir = os.path.join(DirectoryInfo.get_project_dir(), dump_dir)
+            self.file_path = os.path.join(dump_dir, f"{name}_{time.strftime('%Y%m%d_%H%M%S')}.pcm")
+        self.ring_lock = threading.Lock()
+        self.ring_buffer: Optional[np.ndarray] = None
+        self.ring_head = 0
+        self.ring_size = 0
+        ring_length = int(config.ring_buffer_seconds * config.sample_rate)
+        if ring_length > 0:
+            self.ring_buffer = np.zeros(ring_length, dtype=np.float32)
+        # one stream per source sample rate, audio of a session comes in chunks of e.g. input and output rate
+        self.resamplers: Dict[int, StreamResampler] = {}
+
+    @classmethod
+    def create(cls, config: Optional[AudioCaptureConfig], name: str) -> Optional["AudioCapture"]:
+        if config is None or not config.enabled:
+            return None
+        return cls(config, name)
+
+    def capture(self, audio: np.ndarray, sample_rate: Optional[int] = None):
+        self.writer.submit(self, audio, sample_rate or self.config.sample_rate)
+
+    def close(self):
+        self.writer.submit(self, None, block=True)
+
+    def get_recent(self) -> np.ndarray:
+        if self.ring_buffer is None:
+            return np.zeros(0, dtype=np.float32)
+        with self.ring_lock:
+            start = (self.ring_head - self.ring_size) % self.ring_buffer.shape[0]
+            return np.roll(self.ring_buffer, -start)[:self.ring_size]
+
+    def process(self, audio: np.ndarray, sample_rate: int):
+        audio = np.asarray(audio, dtype=np.float32).reshape(-1)
+        if sample_rate != self.config.sample_rate:
+            resampler = self.resamplers.get(sample_rate)
+            if resampler is None:
+                resampler = StreamResampler(sample_rate, self.config.sample_rate)
+                self.resamplers[sample_rate] = resampler
+            audio = resampler.process(audio)
+        self._write(audio)
+
+    def _write(self, audio: np.ndarray):
+        if audio.shape[0] == 0:
+            return
+        if self.file_path is not None:
+            if self.file is None:
+                os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+                self.file = open(self.file_path, "wb")
+                logger.info(f"Capture audio of {self.name} to {self.file_path}")
+            self.file.write(audio.tobytes())
+        if self.ring_buffer is not None:
+            self._write_ring(audio)
+
+    def close_file(self):
+        for resampler in self.resamplers.values():
+            self._write(resampler.flush())
+        self.resamplers.clear()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def _write_ring(self, audio: np.ndarray):
+        ring_length = self.ring_buffer.shape[0]
+        audio = audio[-ring_length:]
+        with self.ring_lock:
+            first_num = min(audio.shape[0], ring_length - self.ring_head)
+            self.ring_buffer[self.ring_head:self.ring_head + first_num] = audio[:first_num]
+            self.ring_buffer[:audio.shape[0] - first_num] = audio[first_num:]
+            self.ring_head = (self.ring_head + audio.shape[0]) % ring_length
+            self.ring_size = min(self.ring_size + audio.shape[0], ring_length)
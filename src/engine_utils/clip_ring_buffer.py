@@ -0,0 +1,53 @@
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+class ClipRingBuffer:
+    """
+    Preallocated ring buffer of equal sized clips, with a parallel array holding timestamp of every clip.
+    Appending copies the clip into its slot, no allocation happens per clip.
+    """
+
+    no_timestamp = -1
+
+    def __init__(self, capacity: int, clip_size: int, dtype=np.float32):
+        self.capacity = max(1, capacity)
+        self.clip_size = clip_size
+        self.clips = np.zeros((self.capacity, clip_size), dtype=dtype)
+        self.timestamps = np.full(self.capacity, self.no_timestamp, dtype=np.int64)
+        # slot of next append
+        self.head = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def clear(self):
+        self.head = 0
+        self.size = 0
+
+    def append(self, clip: np.ndarray, timestamp: Optional[int] = None):
+        self.clips[self.head] = clip
+        self.timestamps[self.head] = self.no_timestamp if timestamp is None else timestamp
+        self.head = (self.head + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def get_latest(self, clip_num: int, pre_padding: int = 0) -> Tuple[np.ndarray, Optional[int]]:
+        """
+        Return the latest clip_num clips as one flat array led by pre_padding zeros, with timestamp of its first clip.
+        The result is assembled with a single copy of at most two segments, it never aliases the buffer.
+        """
+        clip_num = min(clip_num, self.size)
+        output = np.empty(pre_padding + clip_num * self.clip_size, dtype=self.clips.dtype)
+        output[:pre_padding] = 0
+        if clip_num == 0:
+            return output, None
+        start = (self.head - clip_num) % self.capacity
+        first_num = min(clip_num, self.capacity - start)
+        first_end = pre_padding + first_num * self.clip_size
+        output[pre_padding:first_end] = self.clips[start:start + first_num].reshape(-1)
+        if first_num < clip_num:
+            output[first_end:] = self.clips[:clip_num - first_num].reshape(-1)
+        timestamp = int(self.timestamps[start])
+        return output, None if timestamp == self.no_timestamp else timestamp
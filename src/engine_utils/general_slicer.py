@@ -106,3 +106,24 @@ def slice_data(context: SliceContext, data):
         context.last_remainder = context.data_manipulator.concat_func(remainders)
     elif len(remainders) == 1:
         context.last_remainder = remainders[0]
+
+
+def slice_data_stacked(context: SliceContext, data: np.ndarray) -> np.ndarray:
+    """
+    Numpy fast path of slice_data for 1-dim data along axis 0. All complete slices are returned at once
+    as rows of a (slice_num, slice_size) array, which is a view of the input unless a remainder has to be prepended.
+    Start index of row i is context.get_next_slice_start_index() before the call + i * slice_size.
+    """
+    remainder_data = context.last_remainder
+    context.last_remainder = None
+    context.sliced_sample_num += data.shape[0]
+    if remainder_data is not None and remainder_data.shape[0] > 0:
+        data = np.concatenate([remainder_data, data], axis=0)
+    slice_num = data.shape[0] // context.slice_size
+    sliced_size = slice_num * context.slice_size
+    if sliced_size < data.shape[0]:
+        context.last_remainder = data[sliced_size:]
+    if slice_num > 0:
+        context.last_slice_size = context.slice_size
+        context.next_slice_start_id += sliced_size
+    return data[:sliced_size].reshape(slice_num, context.slice_size)
@@ -0,0 +1,69 @@
+import re
+from typing import List, Optional
+
+filter_pattern = re.compile(r"[^a-zA-Z0-9\u4e00-\u9fff,.\~!?，。！？ ]")  # 匹配不在范围内的字符
+
+
+def filter_text(text: str) -> str:
+    return filter_pattern.sub("", text)
+
+
+class SentenceSegmenter:
+    """
+    Split streamed text into segments at punctuation for tts. Only characters pushed since last call are scanned.
+    The first segment is cut at the first punctuation, or after first_max_chars characters when it is positive,
+    to start audio early. Later segments shorter than min_chars are merged with the following ones.
+    """
+
+    delimiter_pattern = re.compile(r"[,.~!?，。！？]")
+    content_pattern = re.compile(r"[^\s,.~!?，。！？]")
+
+    def __init__(self, min_chars: int = 0, first_max_chars: int = 0):
+        self.min_chars = min_chars
+        self.first_max_chars = first_max_chars
+        # text not emitted yet, and index in it where scanning resumes
+        self.pending = ""
+        self.scan_pos = 0
+        self.segment_num = 0
+
+    def reset(self):
+        self.pending = ""
+        self.scan_pos = 0
+        self.segment_num = 0
+
+    def push(self, text: str) -> List[str]:
+        self.pending += text
+        segments = []
+        segment_start = 0
+        pending = self.pending
+        for match in self.delimiter_pattern.finditer(pending, self.scan_pos):
+            segment = pending[segment_start:match.end()]
+            if self._is_long_enough(segment):
+                segments.append(segment)
+                segment_start = match.end()
+                self.segment_num += 1
+        if self.segment_num == 0 and self.first_max_chars > 0 and len(pending) >= self.first_max_chars:
+            cut = pending.rfind(" ", 1, self.first_max_chars + 1)
+            cut = cut + 1 if cut > 0 else self.first_max_chars
+            if len(pending[:cut].strip()) > 0:
+                segments.append(pending[:cut])
+                segment_start = cut
+                self.segment_num += 1
+        self.pending = pending[segment_start:]
+        self.scan_pos = len(self.pending)
+        return segments
+
+    def flush(self, text: str = "") -> Optional[str]:
+        # rest of the text, together with text of the last push
+        segment = self.pending + text
+        self.reset()
+        if len(segment.strip()) == 0:
+            return None
+        return segment
+
+    def _is_long_enough(self, segment: str) -> bool:
+        if self.content_pattern.search(segment) is None:
+            return False
+        if self.segment_num == 0:
+            return True
+        return len(segment.strip()) >= self.min_chars
@@ -0,0 +1,147 @@
+from functools import lru_cache
+from math import gcd
+from typing import Optional, Tuple, Union
+
+import numpy as np
+from scipy.signal import firwin
+
+INT16_SCALE = 32767
+# with at least this many outputs per filter phase in a call, phases are computed one at a time
+GROUPED_PHASE_OUTPUTS = 128
+
+
+@lru_cache(maxsize=None)
+def _design_filter_bank(up: int, down: int, half_len: int) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    max_rate = max(up, down)
+    # same kaiser windowed low pass resample_poly uses
+    taps = firwin(2 * half_len + 1, 1.0 / max_rate, window=("kaiser", 5.0)) * up
+    phase_taps = (len(taps) + up - 1) // up
+    taps = np.pad(taps, (0, phase_taps * up - len(taps)))
+    # row p holds taps of output phase p, applied to the input window ending at the newest sample it needs
+    filter_bank = np.ascontiguousarray(taps.reshape(phase_taps, up).T[:, ::-1], dtype=np.float32)
+    # outputs of one phase have windows down samples apart, splitting its taps by input position modulo down turns
+    # them into a few products over the input reshaped to rows of down samples
+    split_bank = None
+    if down <= phase_taps:
+        split_taps = -(-phase_taps // down)
+        split_bank = np.zeros((up, split_taps * down), dtype=np.float32)
+        split_bank[:, :phase_taps] = filter_bank
+        split_bank = split_bank.reshape(up, split_taps, down)
+        split_bank.flags.writeable = False
+    # shared by all resamplers of the same rates
+    filter_bank.flags.writeable = False
+    return filter_bank, split_bank
+
+
+class StreamResampler:
+    """
+    Polyphase resampler of mono audio streamed in chunks. Filter state is kept across chunks, so the concatenated
+    output equals scipy.signal.resample_poly on the whole input, without the edge artifacts of resampling every
+    chunk by itself. Output is delayed by a few input samples, which are returned by flush. Filters are designed
+    once per rate pair.
+    """
+
+    def __init__(self, orig_sr: int, target_sr: int, half_taps: int = 10):
+        factor = gcd(orig_sr, target_sr)
+        self.up = target_sr // factor
+        self.down = orig_sr // factor
+        self.half_len = half_taps * max(self.up, self.down)
+        self.phase_taps = 1
+        self.filter_bank = None
+        self.split_bank = None
+        if not self.passthrough:
+            self.filter_bank, self.split_bank = _design_filter_bank(self.up, self.down, self.half_len)
+            self.phase_taps = self.filter_bank.shape[1]
+        self.reset()
+
+    def reset(self):
+        # input history, global index of its first sample is buffer_start
+        self.buffer = np.zeros(self.phase_taps, dtype=np.float32)
+        self.buffer_start = -self.phase_taps
+        self.input_num = 0
+        self.output_num = 0
+
+    @property
+    def passthrough(self) -> bool:
+        return self.up == self.down
+
+    @property
+    def delay(self) -> int:
+        """
+        Most output samples process returns less than ceil(input samples * up / down) for the stream so far.
+        """
+        return -(-self.half_len // self.down) if not self.passthrough else 0
+
+    def process(self, audio: np.ndarray) -> np.ndarray:
+        audio = np.asarray(audio, dtype=np.float32).reshape(-1)
+        if self.passthrough:
+            return audio
+        self.buffer = np.concatenate([self.buffer, audio])
+        self.input_num += audio.shape[0]
+        # output n needs input up to (n * down + half_len) // up
+        end = (self.input_num * self.up - 1 - self.half_len) // self.down + 1
+        return self._produce(end)
+
+    def flush(self) -> np.ndarray:
+        """
+        Return the delayed tail of the stream and start over.
+        """
+        if self.passthrough:
+            return np.zeros(0, dtype=np.float32)
+        end = -(-self.input_num * self.up // self.down)
+        self.buffer = np.concatenate([self.buffer, np.zeros(self.half_len // self.up + 1, dtype=np.float32)])
+        output = self._produce(end)
+        self.reset()
+        return output
+
+    def process_int16(self, pcm: Union[bytes, np.ndarray]) -> np.ndarray:
+        """
+        Resample 16 bit pcm, given as bytes or an int16 array, to an int16 array.
+        """
+        pcm = np.frombuffer(pcm, dtype=np.int16) if isinstance(pcm, (bytes, bytearray, memoryview)) else pcm
+        if self.passthrough:
+            return np.asarray(pcm, dtype=np.int16).reshape(-1)
+        return self._to_int16(self.process(np.multiply(pcm, 1.0 / INT16_SCALE, dtype=np.float32)))
+
+    def flush_int16(self) -> np.ndarray:
+        return self._to_int16(self.flush())
+
+    @classmethod
+    def _to_int16(cls, audio: np.ndarray) -> np.ndarray:
+        audio = np.rint(audio * INT16_SCALE)
+        return np.clip(audio, -32768, 32767, out=audio).astype(np.int16)
+
+    def _produce(self, end: int) -> np.ndarray:
+        if end <= self.output_num:
+            return np.zeros(0, dtype=np.float32)
+        output_len = end - self.output_num
+        grouped = self.split_bank is not None and output_len >= GROUPED_PHASE_OUTPUTS * self.up
+        # outputs k, k + up, ... share a phase, so with many outputs per phase only the first of each is located
+        positions = np.arange(self.output_num, self.output_num + (self.up if grouped else output_len),
+                              dtype=np.int64) * self.down + self.half_len
+        # first input of the window of every output
+        starts = positions // self.up - self.buffer_start - self.phase_taps + 1
+        phases = positions % self.up
+        if grouped:
+            output = np.empty(output_len, dtype=np.float32)
+            split_taps = self.split_bank.shape[1]
+            # split taps may reach up to down - 1 samples past the newest input
+            buffer = np.concatenate([self.buffer, np.zeros(self.down, dtype=np.float32)])
+            for k in range(self.up):
+                phase_output = output[k::self.up]
+                length = phase_output.shape[0]
+                rows = buffer[starts[k]:starts[k] + (length + split_taps - 1) * self.down].reshape(-1, self.down)
+                taps = self.split_bank[phases[k]]
+                phase_output[:] = rows[:length] @ taps[0]
+                for q in range(1, split_taps):
+                    phase_output += rows[q:q + length] @ taps[q]
+        else:
+            windows = self.buffer[starts[:, np.newaxis] + np.arange(self.phase_taps)]
+            output = np.einsum("ij,ij->i", windows, self.filter_bank[phases])
+        self.output_num = end
+        # drop history no longer reachable by the next output
+        keep_from = (self.output_num * self.down + self.half_len) // self.up - self.phase_taps + 1 - self.buffer_start
+        if keep_from > 0:
+            self.buffer = self.buffer[keep_from:]
+            self.buffer_start += keep_from
+        return output
@@ -0,0 +1,100 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+from loguru import logger
+
+
+class TTSAudioCache:
+    """
+    LRU cache of synthesized audio keyed on engine, voice, text and sample rate. Entries can also be stored as npy files
+    in a directory, they are memory mapped when loaded so audio stays in page cache instead of process memory.
+    """
+
+    def __init__(self, max_size: int = 128, max_text_chars: int = 20, store_dir: Optional[str] = None):
+        self.max_size = max(1, max_size)
+        # only short phrases repeat often enough to be worth caching
+        self.max_text_chars = max_text_chars
+        self.store_dir = store_dir
+        self.lock = threading.Lock()
+        self.entries: OrderedDict[str, np.ndarray] = OrderedDict()
+        if store_dir is not None:
+            os.makedirs(store_dir, exist_ok=True)
+
+    @classmethod
+    def normalize_text(cls, text: str) -> str:
+        return re.sub(r"\s+", " ", text).strip()
+
+    @classmethod
+    def hash_file(cls, file_path: Optional[str]) -> str:
+        if file_path is None or not os.path.isfile(file_path):
+            return ""
+        with open(file_path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
+    def make_key(self, engine: str, voice: str, text: str, sample_rate: int) -> Optional[str]:
+        """
+        Returns None when the text is not cacheable.
+        """
+        text = self.normalize_text(text)
+        if len(text) == 0 or len(text) > self.max_text_chars:
+            return None
+        key_content = [engine, voice, text, sample_rate]
+        return hashlib.sha256(json.dumps(key_content, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def get(self, key: Optional[str]) -> Optional[np.ndarray]:
+        if key is None:
+            return None
+        with self.lock:
+            audio = self.entries.get(key)
+            if audio is not None:
+                self.entries.move_to_end(key)
+        if audio is None and self.store_dir is not None:
+            audio = self._load(key)
+            if audio is not None:
+                with self.lock:
+                    self._insert(key, audio)
+        # consumers may modify audio in place
+        return None if audio is None else np.array(audio)
+
+    def put(self, key: Optional[str], audio: np.ndarray):
+        if key is None or audio is None or audio.size == 0:
+            return
+        audio = np.array(audio, dtype=np.float32)
+        with self.lock:
+            self._insert(key, audio)
+        if self.store_dir is not None:
+            store_path = self._store_path(key)
+            temp_path = store_path + ".tmp.npy"
+            try:
+                np.save(temp_path, audio)
+                os.replace(temp_path, store_path)
+            except OSError as e:
+                logger.warning(f"Failed to store tts audio to {store_path}: {e}")
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _insert(self, key: str, audio: np.ndarray):
+        self.entries[key] = audio
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def _store_path(self, key: str) -> str:
+        return os.path.join(self.store_dir, f"{key}.npy")
+
+    def _load(self, key: str) -> Optional[np.ndarray]:
+        store_path = self._store_path(key)
+        if not os.path.isfile(store_path):
+            return None
+        try:
+            return np.load(store_path, mmap_mode="r")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Failed to load tts audio from {store_path}: {e}")
+            return None
@@ -0,0 +1,115 @@
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+import numpy as np
+from loguru import logger
+
+
+@dataclass
+class ASRRequest:
+    speech_id: str
+    audio: np.ndarray
+    done: threading.Event = field(default_factory=threading.Event)
+    text: str = ""
+    error: Optional[Exception] = None
+
+
+class ASRBatcher:
+    """
+    Queue audio of all sessions and recognize them together. A batch takes the requests already waiting when the worker
+    gets to it, those queued up while the previous batch ran, so no request waits for others to arrive. With max_wait
+    set, the worker additionally waits that long for other sessions. Requests are sorted by length and split into
+    buckets whose longest audio is at most bucket_ratio times the shortest, so padding stays small. Results are routed
+    back to callers by speech_id.
+    """
+
+    def __init__(self, recognize_func: Callable[[List[np.ndarray], List[str]], List[str]],
+                 max_batch_size: int = 8, max_wait: float = 0.0, bucket_ratio: float = 1.5):
+        self.recognize_func = recognize_func
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        self.bucket_ratio = max(1.0, bucket_ratio)
+        self.request_queue = queue.Queue()
+        self.session_num = 0
+        self.session_lock = threading.Lock()
+        # model is not called concurrently by batch worker and bypassing callers
+        self.model_lock = threading.Lock()
+        self.worker = threading.Thread(target=self._run, name="asr_batcher", daemon=True)
+        self.worker.start()
+
+    def add_session(self):
+        with self.session_lock:
+            self.session_num += 1
+
+    def remove_session(self):
+        with self.session_lock:
+            self.session_num = max(0, self.session_num - 1)
+
+    def recognize(self, speech_id: str, audio: np.ndarray) -> str:
+        if self.session_num <= 1:
+            # nothing to batch with, skip the hand over to batch worker
+            with self.model_lock:
+                return self.recognize_func([audio], [speech_id])[0]
+        request = ASRRequest(speech_id=speech_id, audio=audio)
+        self.request_queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.text
+
+    def _collect_requests(self) -> List[ASRRequest]:
+        requests = [self.request_queue.get()]
+        # sessions reach their end of speech independently, waiting is only done when asked for and stops once
+        # every session has a request in flight
+        deadline = time.monotonic() + self.max_wait
+        while self.max_wait > 0 and len(requests) < self.session_num:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                requests.append(self.request_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        while True:
+            try:
+                requests.append(self.request_queue.get_nowait())
+            except queue.Empty:
+                break
+        return requests
+
+    def split_buckets(self, requests: List[ASRRequest]) -> List[List[ASRRequest]]:
+        requests = sorted(requests, key=lambda x: x.audio.shape[-1])
+        buckets = []
+        bucket = []
+        for request in requests:
+            if len(bucket) > 0 and (len(bucket) >= self.max_batch_size or
+                                    request.audio.shape[-1] > bucket[0].audio.shape[-1] * self.bucket_ratio):
+                buckets.append(bucket)
+                bucket = []
+            bucket.append(request)
+        if len(bucket) > 0:
+            buckets.append(bucket)
+        return buckets
+
+    def _run_bucket(self, bucket: List[ASRRequest]):
+        try:
+            with self.model_lock:
+                texts = self.recognize_func([request.audio for request in bucket],
+                                            [request.speech_id for request in bucket])
+            for request, text in zip(bucket, texts):
+                request.text = text
+        except Exception as e:
+            logger.opt(exception=e).error(f"Failed to run ASR batch of size {len(bucket)}")
+            for request in bucket:
+                request.error = e
+        for request in bucket:
+            request.done.set()
+
+    def _run(self):
+        while True:
+            requests = self._collect_requests()
+            for bucket in self.split_buckets(requests):
+                self._run_bucket(bucket)
@@ -1,12 +1,11 @@
 
 
 import re
-from typing import Dict, Optional, cast
+from typing import Dict, List, Optional, cast
 from loguru import logger
 import numpy as np
 from pydantic import BaseModel, Field
 from abc import ABC
-import os
 import torch
 from chat_engine.contexts.handler_context import HandlerContext
 from chat_engine.data_models.chat_engine_config_data import ChatEngineConfigModel, HandlerBaseConfigModel
@@ -17,12 +16,23 @@ from chat_engine.data_models.runtime_data.data_bundle import DataBundle, DataBun
 from chat_engine.contexts.session_context import SessionContext
 from funasr import AutoModel
 
-from engine_utils.directory_info import DirectoryInfo
+from engine_utils.audio_capture import AudioCapture, AudioCaptureConfig
 from engine_utils.general_slicer import SliceContext, slice_data
+from handlers.asr.sensevoice.asr_batcher import ASRBatcher
 
 
 class ASRConfig(HandlerBaseConfigModel, BaseModel):
     model_name: str = Field(default="iic/SenseVoiceSmall")
+    # decode audio every time a slice arrives and emit partial human text before speech end
+    streaming: bool = Field(default=False)
+    # audio window of partial decoding, result of a full window is committed and decoding moves on
+    streaming_window_seconds: float = Field(default=8.0)
+    # recognize audio of concurrent sessions in batches
+    batch_inference: bool = Field(default=True)
+    batch_max_size: int = Field(default=8)
+    # time to wait for audio of other sessions, a batch only takes audio already queued when not positive
+    batch_max_wait_ms: float = Field(default=0.0)
+    audio_capture: AudioCaptureConfig = Field(default_factory=AudioCaptureConfig)
 
 
 class ASRContext(HandlerContext):
@@ -37,12 +47,11 @@ class ASRContext(HandlerContext):
         )
         self.cache = {}
 
-        self.dump_audio = True
-        self.audio_dump_file = None
-        if self.dump_audio:
-            dump_file_path = os.path.join(DirectoryInfo.get_project_dir(),
-                                          "dump_talk_audio.pcm")
-            self.audio_dump_file = open(dump_file_path, "wb")
+        # text of committed streaming windows of current speech
+        self.committed_text = ""
+        self.partial_text = ""
+
+        self.audio_capture: Optional[AudioCapture] = None
         self.shared_states = None
 
 
@@ -51,6 +60,7 @@ class HandlerASR(HandlerBase, ABC):
         super().__init__()
 
         self.model_name = 'iic/SenseVoiceSmall'
+        self.batcher: Optional[ASRBatcher] = None
 
         if torch.cuda.is_available():
             self.device = torch.device("cuda:0")
@@ -89,12 +99,21 @@ class HandlerASR(HandlerBase, ABC):
             self.model_name = handler_config.model_name
 
         self.model = AutoModel(model=self.model_name, disable_update=True)
+        if isinstance(handler_config, ASRConfig) and handler_config.batch_inference:
+            self.batcher = ASRBatcher(self._recognize_batch,
+                                      max_batch_size=handler_config.batch_max_size,
+                                      max_wait=handler_config.batch_max_wait_ms / 1000)
 
     def create_context(self, session_context, handler_config=None):
         if not isinstance(handler_config, ASRConfig):
             handler_config = ASRConfig()
         context = ASRContext(session_context.session_info.session_id)
+        context.config = handler_config
         context.shared_states = session_context.shared_states
+        context.audio_capture = AudioCapture.create(handler_config.audio_capture,
+                                                    f"asr_{session_context.session_info.session_id}")
+        if self.batcher is not None:
+            self.batcher.add_session()
         return context
     
     def start_context(self, session_context, handler_context):
@@ -117,10 +136,16 @@ class HandlerASR(HandlerBase, ABC):
             audio = audio.squeeze()
 
             logger.info('audio in')
+            segment_added = False
             for audio_segment in slice_data(context.audio_slice_context, audio):
                 if audio_segment is None or audio_segment.shape[0] == 0:
                     continue
                 context.output_audios.append(audio_segment)
+                segment_added = True
+            if segment_added and context.config.streaming:
+                partial_output = self._decode_partial(context, output_definition, speech_id)
+                if partial_output is not None:
+                    yield partial_output
 
         speech_end = inputs.data.get_meta("human_speech_end", False)
         if not speech_end:
@@ -134,15 +159,14 @@ class HandlerASR(HandlerBase, ABC):
                     [remainder_audio,
                      np.zeros(shape=(context.audio_slice_context.slice_size - remainder_audio.shape[0]))])
                 context.output_audios.append(remainder_audio)
-        output_audio = np.concatenate(context.output_audios)
-        if context.audio_dump_file is not None:
-            logger.info('dump audio')
-            context.audio_dump_file.write(output_audio.tobytes())
-
-        res = self.model.generate(input=output_audio, batch_size_s=10)
-        logger.info(res)
+        output_text = context.committed_text
+        if len(context.output_audios) > 0:
+            output_audio = np.concatenate(context.output_audios)
+            self._dump_audio(context, output_audio)
+            output_text += self._recognize(speech_id, output_audio)
         context.output_audios.clear()
-        output_text = re.sub(r"<\|.*?\|>", "", res[0]['text'])
+        context.committed_text = ""
+        context.partial_text = ""
         if len(output_text) == 0:
             # 如果 ASR 识别结果为空，则需要重新开启vad
             context.shared_states.enable_vad = True
@@ -159,5 +183,48 @@ class HandlerASR(HandlerBase, ABC):
         end_output.add_meta("speech_id", speech_id)
         yield end_output
 
+    def _recognize(self, speech_id: str, audio: np.ndarray) -> str:
+        if self.batcher is not None:
+            return self.batcher.recognize(speech_id, audio)
+        return self._recognize_batch([audio], [speech_id])[0]
+
+    def _recognize_batch(self, audios: List[np.ndarray], speech_ids: List[str]) -> List[str]:
+        res = self.model.generate(input=audios, key=speech_ids, batch_size=len(audios))
+        logger.info(res)
+        texts = {}
+        for index, result in enumerate(res):
+            texts[result.get("key", speech_ids[index])] = re.sub(r"<\|.*?\|>", "", result['text'])
+        return [texts.get(speech_id, "") for speech_id in speech_ids]
+
+    @classmethod
+    def _dump_audio(cls, context: ASRContext, audio: np.ndarray):
+        if context.audio_capture is not None:
+            context.audio_capture.capture(audio)
+
+    def _decode_partial(self, context: ASRContext, output_definition: DataBundleDefinition, speech_id: str):
+        window_audio = np.concatenate(context.output_audios)
+        window_text = self._recognize(speech_id, window_audio)
+        # every slice holds one second of audio
+        if len(context.output_audios) >= context.config.streaming_window_seconds:
+            # commit the full window, decoding cost of later partials and the final result stays bounded
+            self._dump_audio(context, window_audio)
+            context.committed_text += window_text
+            context.output_audios.clear()
+        partial_text = context.committed_text + window_text
+        if len(partial_text) == 0 or partial_text == context.partial_text:
+            return None
+        context.partial_text = partial_text
+        output = DataBundle(output_definition)
+        output.set_main_data(partial_text)
+        output.add_meta('human_text_end', False)
+        # full hypothesis of speech so far, it is replaced by later partial or final result
+        output.add_meta('human_text_partial', True)
+        output.add_meta('speech_id', speech_id)
+        return output
+
     def destroy_context(self, context: HandlerContext):
-        pass
+        context = cast(ASRContext, context)
+        if context.audio_capture is not None:
+            context.audio_capture.close()
+        if self.batcher is not None:
+            self.batcher.remove_session()
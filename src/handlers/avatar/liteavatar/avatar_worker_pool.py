@@ -0,0 +1,258 @@
+import multiprocessing
+import queue
+import threading
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from handlers.avatar.liteavatar.avatar_output_handler import AvatarOutputHandler
+from handlers.avatar.liteavatar.model.algo_model import AudioResult, AvatarInitOption, AvatarStatus, VideoResult
+from engine_utils.interval_counter import IntervalCounter
+
+
+class Tts2FaceEvent(Enum):
+    START = 1001
+    STOP = 1002
+
+    LISTENING_TO_SPEAKING = 2001
+    SPEAKING_TO_LISTENING = 2002
+
+
+@dataclass
+class AvatarSlotQueues:
+    """
+    Queues of one session slot of a worker. Every item is a (session key, payload) tuple, readers drop leftovers
+    of the previous session of the slot instead of the queues being drained in between.
+    """
+    audio_in_queue: Any
+    audio_out_queue: Any
+    video_out_queue: Any
+    event_out_queue: Any
+
+    @classmethod
+    def create(cls, mp_context) -> "AvatarSlotQueues":
+        return cls(mp_context.Queue(), mp_context.Queue(), mp_context.Queue(), mp_context.Queue())
+
+
+@dataclass
+class AvatarSession:
+    session_id: str
+    session_key: int
+    worker_index: int
+    slot_index: int
+    queues: AvatarSlotQueues
+
+
+class Tts2FaceOutputHandler(AvatarOutputHandler):
+    def __init__(self, session_key: int, slot_queues: AvatarSlotQueues):
+        self.session_key = session_key
+        self.audio_output_queue = slot_queues.audio_out_queue
+        self.video_output_queue = slot_queues.video_out_queue
+        self.event_out_queue = slot_queues.event_out_queue
+        self._video_producer_counter = IntervalCounter("video_producer")
+
+    def on_start(self, init_option: AvatarInitOption):
+        logger.info("on algo processor start")
+
+    def on_stop(self):
+        logger.info("on algo processor stop")
+
+    def on_audio(self, audio_result: AudioResult):
+        audio_frame = audio_result.audio_frame
+        audio_data = audio_frame.to_ndarray()
+        self.audio_output_queue.put_nowait((self.session_key, audio_data))
+
+    def on_video(self, video_result: VideoResult):
+        self._video_producer_counter.add()
+        video_frame = video_result.video_frame
+        data = video_frame.to_ndarray(format="bgr24")
+        self.video_output_queue.put_nowait((self.session_key, data))
+
+    def on_avatar_status_change(self, speech_id, avatar_status: AvatarStatus):
+        logger.info(f"Avatar status changed: {speech_id} {avatar_status}")
+        if avatar_status.value == AvatarStatus.LISTENING.value:
+            self.event_out_queue.put_nowait((self.session_key, Tts2FaceEvent.SPEAKING_TO_LISTENING))
+
+
+def create_tts2face_processor(handler_root: str, config):
+    from handlers.avatar.liteavatar.avatar_processor_factory import AvatarProcessorFactory, AvatarAlgoType
+    return AvatarProcessorFactory.create_avatar_processor(
+        handler_root,
+        AvatarAlgoType.TTS2FACE_CPU,
+        AvatarInitOption(
+            audio_sample_rate=24000,
+            video_frame_rate=config.fps,
+            avatar_name=config.avatar_name,
+            debug=config.debug,
+            enable_fast_mode=config.enable_fast_mode,
+            use_gpu=config.use_gpu
+        )
+    )
+
+
+class AvatarWorker:
+    """
+    Runs in an avatar worker process and hosts one avatar renderer per session slot. Renderers are created up front
+    and reused by the sessions assigned to their slot, commands (event, slot index, session key) start and stop them.
+    """
+
+    def __init__(self, create_processor: Callable[[], Any], command_queue, slot_queues: List[AvatarSlotQueues]):
+        self.create_processor = create_processor
+        self.command_queue = command_queue
+        self.slot_queues = slot_queues
+        self.processors = []
+        self.session_keys: List[Optional[int]] = [None] * len(slot_queues)
+        # audio of a session read before its start command arrived
+        self.pending_audio: List[List[Tuple[int, Any]]] = [[] for _ in slot_queues]
+        self.slot_locks = [threading.Lock() for _ in slot_queues]
+        self.running = True
+
+    def run(self):
+        for _ in self.slot_queues:
+            self.processors.append(self.create_processor())
+        audio_input_threads = [threading.Thread(target=self._audio_input_loop, args=(slot_index,), daemon=True)
+                               for slot_index in range(len(self.slot_queues))]
+        for thread in audio_input_threads:
+            thread.start()
+        while True:
+            command = self.command_queue.get()
+            if command is None:
+                break
+            event, slot_index, session_key = command
+            logger.info("receive event: {} for slot {} session {}", event, slot_index, session_key)
+            if event == Tts2FaceEvent.START:
+                self._start_session(slot_index, session_key)
+            elif event == Tts2FaceEvent.STOP:
+                self._stop_session(slot_index, session_key)
+        self.running = False
+        for thread in audio_input_threads:
+            thread.join()
+        for slot_index, session_key in enumerate(self.session_keys):
+            if session_key is not None:
+                self._stop_session(slot_index, session_key)
+
+    def _start_session(self, slot_index: int, session_key: int):
+        if self.session_keys[slot_index] is not None:
+            self._stop_session(slot_index, self.session_keys[slot_index])
+        processor = self.processors[slot_index]
+        processor.register_output_handler(Tts2FaceOutputHandler(session_key, self.slot_queues[slot_index]))
+        processor.start()
+        with self.slot_locks[slot_index]:
+            self.session_keys[slot_index] = session_key
+            pending_audio = self.pending_audio[slot_index]
+            self.pending_audio[slot_index] = [(item_key, speech_audio) for item_key, speech_audio in pending_audio
+                                              if item_key > session_key]
+            for item_key, speech_audio in pending_audio:
+                if item_key == session_key:
+                    processor.add_audio(speech_audio)
+
+    def _stop_session(self, slot_index: int, session_key: int):
+        with self.slot_locks[slot_index]:
+            if self.session_keys[slot_index] != session_key:
+                return
+            self.session_keys[slot_index] = None
+        processor = self.processors[slot_index]
+        processor.stop()
+        processor.clear_output_handlers()
+
+    def _audio_input_loop(self, slot_index: int):
+        audio_in_queue = self.slot_queues[slot_index].audio_in_queue
+        processor = self.processors[slot_index]
+        while self.running:
+            try:
+                item_key, speech_audio = audio_in_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            with self.slot_locks[slot_index]:
+                session_key = self.session_keys[slot_index]
+                if item_key == session_key:
+                    processor.add_audio(speech_audio)
+                elif session_key is None or item_key > session_key:
+                    # session keys only grow, a larger one belongs to a session about to be started
+                    self.pending_audio[slot_index].append((item_key, speech_audio))
+
+
+def run_avatar_worker(create_processor: Callable[[], Any], command_queue, slot_queues: List[AvatarSlotQueues]):
+    AvatarWorker(create_processor, command_queue, slot_queues).run()
+
+
+class AvatarWorkerPool:
+    """
+    Avatar worker processes with a fixed number of session slots each. Every slot has its own queues, a session holds
+    a slot from context creation to destruction, and new sessions go to the worker serving the fewest sessions.
+    """
+
+    def __init__(self, create_processor: Callable[[], Any], worker_num: int = 1, max_sessions_per_worker: int = 1,
+                 mp_context=None):
+        self.create_processor = create_processor
+        self.worker_num = max(1, worker_num)
+        self.max_sessions_per_worker = max(1, max_sessions_per_worker)
+        mp_context = mp_context or multiprocessing.get_context("spawn")
+        self.mp_context = mp_context
+        self.command_queues = [mp_context.Queue() for _ in range(self.worker_num)]
+        self.slot_queues = [[AvatarSlotQueues.create(mp_context) for _ in range(self.max_sessions_per_worker)]
+                            for _ in range(self.worker_num)]
+        # session occupying every slot, None when free
+        self.slot_sessions: List[List[Optional[AvatarSession]]] = [[None] * self.max_sessions_per_worker
+                                                                   for _ in range(self.worker_num)]
+        self.sessions: Dict[str, AvatarSession] = {}
+        self.next_session_key = 0
+        self.lock = threading.Lock()
+        self.processes = []
+
+    def start(self):
+        for worker_index in range(self.worker_num):
+            process = self.mp_context.Process(target=run_avatar_worker,
+                                              args=(self.create_processor, self.command_queues[worker_index],
+                                                    self.slot_queues[worker_index]),
+                                              daemon=True)
+            process.start()
+            self.processes.append(process)
+
+    @property
+    def capacity(self) -> int:
+        return self.worker_num * self.max_sessions_per_worker
+
+    def acquire(self, session_id: str) -> Optional[AvatarSession]:
+        """
+        Assign a slot on the least loaded worker to the session and start its renderer. Return None when every slot
+        is taken.
+        """
+        with self.lock:
+            best_worker = None
+            best_load = self.max_sessions_per_worker
+            for worker_index, slots in enumerate(self.slot_sessions):
+                load = sum(slot is not None for slot in slots)
+                if load < best_load:
+                    best_worker = worker_index
+                    best_load = load
+            if best_worker is None:
+                return None
+            slots = self.slot_sessions[best_worker]
+            slot_index = slots.index(None)
+            self.next_session_key += 1
+            session = AvatarSession(session_id=session_id, session_key=self.next_session_key,
+                                    worker_index=best_worker, slot_index=slot_index,
+                                    queues=self.slot_queues[best_worker][slot_index])
+            slots[slot_index] = session
+            self.sessions[session_id] = session
+        logger.info(f"avatar session {session_id} assigned to worker {best_worker} slot {slot_index}")
+        self.command_queues[best_worker].put((Tts2FaceEvent.START, slot_index, session.session_key))
+        return session
+
+    def release(self, session: AvatarSession):
+        with self.lock:
+            if self.slot_sessions[session.worker_index][session.slot_index] is not session:
+                return
+            self.slot_sessions[session.worker_index][session.slot_index] = None
+            self.sessions.pop(session.session_id, None)
+        self.command_queues[session.worker_index].put((Tts2FaceEvent.STOP, session.slot_index, session.session_key))
+
+    def stop(self):
+        for command_queue in self.command_queues:
+            command_queue.put(None)
+        for process in self.processes:
+            process.join(timeout=5)
+        self.processes = []
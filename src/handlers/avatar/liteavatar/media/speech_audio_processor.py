@@ -2,9 +2,9 @@
 
 from typing import List
 
-import librosa
 from loguru import logger
 import numpy as np
+from engine_utils.stream_resampler import StreamResampler
 from handlers.avatar.liteavatar.model.algo_model import AudioSlice
 from handlers.avatar.liteavatar.model.audio_input import SpeechAudio
 
@@ -21,6 +21,10 @@ class SpeechAudioProcessor:
         self._enable_fast_mode = enable_fast_mode
 
         self._current_audio = SpeechAudio()
+        # slices of a speech are resampled as one stream, so there are no discontinuities at slice edges
+        self._algo_resampler = StreamResampler(input_sample_rate, output_sample_rate)
+        self._algo_speech_id = None
+        self._algo_pending = np.zeros(0, dtype=np.int16)
 
     def get_speech_audio_slice(self, speech_audio: SpeechAudio) \
             -> List[AudioSlice]:
@@ -100,9 +104,7 @@ class SpeechAudioProcessor:
                             end_of_speech: bool,
                             front_padding_duration: float = 0,
                             end_padding_duration: float = 0) -> AudioSlice:
-        algo_audio = self.resample_audio(play_audio_data,
-                                         self._input_sample_rate,
-                                         self._output_sample_rate)
+        algo_audio = self._resample_slice(speech_id, play_audio_data, end_of_speech)
         return AudioSlice(
             algo_audio_data=algo_audio,
             algo_audio_sample_rate=self._output_sample_rate,
@@ -129,6 +131,29 @@ class SpeechAudioProcessor:
             audio_data = bytes(audio_data) + bytes(padding_length)
         return audio_data, padding_length / 2 / sample_rate
 
+    def _resample_slice(self, speech_id, audio_data: bytes, end_of_speech: bool) -> bytes:
+        if self._algo_resampler.passthrough:
+            return audio_data
+        if self._algo_speech_id != speech_id:
+            # speech is delayed by the resampler lag, so that every slice gets its full length
+            self._algo_resampler.reset()
+            self._algo_speech_id = speech_id
+            self._algo_pending = np.zeros(self._algo_resampler.delay, dtype=np.int16)
+        outputs = [self._algo_pending, self._algo_resampler.process_int16(audio_data)]
+        if end_of_speech:
+            outputs.append(self._algo_resampler.flush_int16())
+            self._algo_speech_id = None
+        pending = np.concatenate(outputs)
+        length = self._resampled_length(len(audio_data) // 2, self._input_sample_rate, self._output_sample_rate)
+        if pending.shape[0] < length:
+            pending = np.concatenate([pending, np.zeros(length - pending.shape[0], dtype=np.int16)])
+        self._algo_pending = pending[length:] if not end_of_speech else np.zeros(0, dtype=np.int16)
+        return bytearray(pending[:length].tobytes())
+
+    @staticmethod
+    def _resampled_length(sample_num: int, origin_sample_rate: int, target_sample_rate: int) -> int:
+        return -(-sample_num * target_sample_rate // origin_sample_rate)
+
     @staticmethod
     def resample_audio(audio_data: bytes,
                        origin_sample_rate: int,
@@ -136,15 +161,11 @@ class SpeechAudioProcessor:
         if origin_sample_rate == target_sample_rate:
             return audio_data
 
-        origin_np_array = np.frombuffer(audio_data, np.short)
-        audio_float32 = origin_np_array.astype(np.float32) / np.iinfo(
-            np.int16).max
-        resampled_float: np.ndarray = librosa.resample(
-            audio_float32,
-            orig_sr=origin_sample_rate,
-            target_sr=target_sample_rate)
-        resampled_pcm = (resampled_float * np.iinfo(np.short).max).astype(
-            np.int16)
+        resampler = StreamResampler(origin_sample_rate, target_sample_rate)
+        resampled_pcm = np.concatenate([resampler.process_int16(audio_data), resampler.flush_int16()])
+        length = SpeechAudioProcessor._resampled_length(len(audio_data) // 2, origin_sample_rate,
+                                                        target_sample_rate)
+        resampled_pcm = np.pad(resampled_pcm[:length], (0, max(0, length - resampled_pcm.shape[0])))
         resample_data = bytearray(resampled_pcm.tobytes())
 
         return resample_data
@@ -30,6 +30,9 @@ class RtcClientSessionDelegate(ClientSessionDelegate):
         self.timestamp_generator = None
         self.data_submitter = None
         self.shared_states = None
+        self.signal_emitter = None
+        # loop consuming output queues, captured on first get_data
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
         self.output_queues = {
             EngineChannelType.AUDIO: asyncio.Queue(),
             EngineChannelType.VIDEO: asyncio.Queue(),
@@ -46,6 +49,8 @@ class RtcClientSessionDelegate(ClientSessionDelegate):
         data_queue = self.output_queues.get(modality)
         if data_queue is None:
             return None
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
         if timeout is not None and timeout > 0:
             try:
                 data = await asyncio.wait_for(data_queue.get(), timeout)
@@ -84,13 +89,24 @@ class RtcClientSessionDelegate(ClientSessionDelegate):
         )
         self.data_submitter.submit(chat_data)
         if loopback:
-            self.output_queues[modality].put_nowait(chat_data)
+            self.put_output(modality, chat_data)
+
+    def put_output(self, modality: EngineChannelType, chat_data: ChatData):
+        data_queue = self.output_queues.get(modality)
+        if data_queue is None:
+            return
+        # asyncio queues are not thread safe, data from handler threads has to be put by the consuming loop
+        if self.loop is not None and self.loop.is_running():
+            self.loop.call_soon_threadsafe(data_queue.put_nowait, chat_data)
+        else:
+            data_queue.put_nowait(chat_data)
 
     def get_timestamp(self):
         return self.timestamp_generator()
 
     def emit_signal(self, signal: ChatSignal):
-        pass
+        if self.signal_emitter is not None:
+            self.signal_emitter(signal)
 
     def clear_data(self):
         for data_queue in self.output_queues.values():
@@ -220,6 +236,7 @@ class ClientHandlerRtc(ClientHandlerBase):
         session_delegate.data_submitter = handler_context.data_submitter
         session_delegate.input_data_definitions = self.output_bundle_definitions
         session_delegate.shared_states = session_context.shared_states
+        session_delegate.signal_emitter = session_context.signal_emitter
 
         handler_context.client_session_delegate = session_delegate
 
@@ -265,9 +282,7 @@ class ClientHandlerRtc(ClientHandlerBase):
         context = cast(ClientRtcContext, context)
         if context.client_session_delegate is None:
             return
-        data_queue = context.client_session_delegate.output_queues.get(inputs.type.channel_type)
-        if data_queue is not None:
-            data_queue.put_nowait(inputs)
+        context.client_session_delegate.put_output(inputs.type.channel_type, inputs)
 
     def destroy_context(self, context: HandlerContext):
         pass
@@ -22,6 +22,7 @@ from chat_engine.contexts.session_context import SessionContext
 from chat_engine.data_models.chat_data.chat_data_model import ChatData
 from chat_engine.data_models.chat_engine_config_data import ChatEngineConfigModel, HandlerBaseConfigModel
 from chat_engine.data_models.runtime_data.data_bundle import DataBundle, DataBundleDefinition, DataBundleEntry
+from engine_utils.audio_capture import AudioCapture, AudioCaptureConfig
 from engine_utils.directory_info import DirectoryInfo
 from engine_utils.general_slicer import SliceContext, slice_data
 
@@ -32,6 +33,7 @@ class MiniCPMConfig(HandlerBaseConfigModel, BaseModel):
     assistant_prompt: str = Field(default="作为助手，你将使用这种声音风格说话。")
     enable_video_input: bool = Field(default=False)
     skip_video_frame: int = Field(default=-1)
+    audio_capture: AudioCaptureConfig = Field(default_factory=AudioCaptureConfig)
 
 
 class MiniCPMContext(HandlerContext):
@@ -40,17 +42,11 @@ class MiniCPMContext(HandlerContext):
         self.config: Optional[MiniCPMConfig] = None
         self.local_session_id = 0
 
-        self.dump_audio = True
-        self.audio_dump_file = None
+        self.audio_capture: Optional[AudioCapture] = None
 
         self.prefilling = False
         self.generating = False
 
-        if self.dump_audio:
-            dump_file_path = os.path.join(DirectoryInfo.get_project_dir(),
-                                          "dump_talk_audio.pcm")
-            self.audio_dump_file = open(dump_file_path, "wb")
-
         self.sys_msg = None
 
         self.audio_prefill_length = 16000
@@ -178,6 +174,8 @@ class HandlerS2SMiniCPM(HandlerBase, ABC):
             handler_config = MiniCPMConfig()
         context = MiniCPMContext(session_context.session_info.session_id)
         context.config = handler_config
+        context.audio_capture = AudioCapture.create(handler_config.audio_capture,
+                                                    f"minicpm_{session_context.session_info.session_id}")
         context.local_session_id = self.created_session_num + 235
         self.created_session_num += 1
         self.model.reset_session()
@@ -251,11 +249,10 @@ class HandlerS2SMiniCPM(HandlerBase, ABC):
                 tokenizer=self.tokenizer,
                 **extra_params
             )
-            if context.dump_audio:
+            if context.audio_capture is not None:
                 for content_data in msg["content"]:
                     if isinstance(content_data, np.ndarray):
-                        audio = content_data
-                        context.audio_dump_file.write(audio.tobytes())
+                        context.audio_capture.capture(content_data)
 
     def handle(self, context: HandlerContext, inputs: ChatData,
                output_definitions: Dict[ChatDataType, HandlerDataInfo]):
@@ -338,9 +335,8 @@ class HandlerS2SMiniCPM(HandlerBase, ABC):
                 out_audio = out_audio.numpy()
                 result_audio.append(out_audio)
                 result_text += text
-                if context.dump_audio:
-                    dump_audio = librosa.resample(out_audio, orig_sr=24000, target_sr=16000)
-                    context.audio_dump_file.write(dump_audio.tobytes())
+                if context.audio_capture is not None:
+                    context.audio_capture.capture(out_audio, sr)
                 out_audio = out_audio[np.newaxis, ...]
                 output = DataBundle(output_definition)
                 output.set_main_data(out_audio)
@@ -358,4 +354,6 @@ class HandlerS2SMiniCPM(HandlerBase, ABC):
         # yield end_output
 
     def destroy_context(self, context: HandlerContext):
-        pass
+        context = cast(MiniCPMContext, context)
+        if context.audio_capture is not None:
+            context.audio_capture.close()
@@ -1,9 +1,13 @@
+from collections import deque
 from dataclasses import dataclass
 import re
-from typing import Literal, Optional
+import threading
+from typing import Callable, Deque, Dict, List, Literal, Optional
 
+from loguru import logger
 
 from engine_utils.media_utils import ImageUtils
+from engine_utils.sentence_segmenter import filter_text
 
 
 @dataclass
@@ -19,32 +23,61 @@ name_dict = {
 }
 
 
-def filter_text(text):
-    pattern = r"[^a-zA-Z0-9\u4e00-\u9fff,.\~!?，。！？ ]"  # 匹配不在范围内的字符
-    filtered_text = re.sub(pattern, "", text)
-    return filtered_text
+def estimate_tokens(text: str) -> int:
+    # rough estimate without a tokenizer, a cjk character is about one token and other text about four characters
+    cjk_num = len(re.findall(r"[\u4e00-\u9fff]", text))
+    return cjk_num + (len(text) - cjk_num + 3) // 4 + 4
 
 
 class ChatHistory:
-    def __init__(self):
-        self.max_history_length = 20
-        self.message_history = []
+    """
+    History messages are kept as filtered message dicts built once per message. When history exceeds its limits,
+    old messages are dropped down to trim_ratio of the limits at once, so the message prefix sent to the server stays
+    the same for several turns and its prefix cache can be hit. Dropped messages are optionally rolled into a summary
+    by summarize_func in background.
+    """
+
+    summary_prefix = "Summary of earlier conversation: "
+
+    def __init__(self, max_history_length: int = 20, max_history_tokens: int = 0, trim_ratio: float = 0.5,
+                 summarize_func: Optional[Callable[[str, List[HistoryMessage]], str]] = None):
+        # limits are disabled when not positive
+        self.max_history_length = max_history_length
+        self.max_history_tokens = max_history_tokens
+        self.trim_ratio = min(max(trim_ratio, 0.0), 1.0)
+        self.message_history: Deque[HistoryMessage] = deque()
+        self.message_cache: Deque[Dict] = deque()
+        self.token_counts: Deque[int] = deque()
+        self.token_num = 0
+        self.summary = ""
+        self.summarize_func = summarize_func
+        self.lock = threading.Lock()
+        self.summary_lock = threading.Lock()
 
     def add_message(self, message: HistoryMessage):
-        history = self.message_history
-        history.append(message)
-        # thread safe
-        while len(history) >= self.max_history_length:
-            history.pop(0)
-
-    def generate_next_messages(self, chat_text, images):
-        def history_to_message(history: HistoryMessage):
-            return {
-                "role": name_dict[history.role],
-                "content": filter_text(history.content),
-            }
-        history = self.message_history
-        messages = list(map(history_to_message, history))
+        content = filter_text(message.content)
+        with self.lock:
+            self.message_history.append(message)
+            self.message_cache.append({
+                "role": name_dict[message.role],
+                "content": content,
+            })
+            token_num = estimate_tokens(content)
+            self.token_counts.append(token_num)
+            self.token_num += token_num
+            if self._exceeds(1.0):
+                dropped = self._trim()
+            else:
+                dropped = []
+        if len(dropped) > 0 and self.summarize_func is not None:
+            threading.Thread(target=self._summarize, args=(dropped,), daemon=True).start()
+
+    def generate_next_messages(self, chat_text, images, add_to_history=True):
+        with self.lock:
+            messages = []
+            if len(self.summary) > 0:
+                messages.append({"role": "system", "content": self.summary_prefix + self.summary})
+            messages.extend(self.message_cache)
         messages.append({
             "role": "user",
             "content": [
@@ -54,8 +87,39 @@ class ChatHistory:
                 },
             ] + (list(map(lambda x: {"type": "image_url", "image_url": {"url": ImageUtils.format_image(x)}}, images)))
         })
-        self.add_message(HistoryMessage(role="human", content=chat_text))
-        return messages        
-    
+        if add_to_history:
+            self.add_message(HistoryMessage(role="human", content=chat_text))
+        return messages
+
+    def get_recent_messages(self, message_num: int) -> List[Dict]:
+        if message_num <= 0:
+            return []
+        with self.lock:
+            return list(self.message_cache)[-message_num:]
+
+    def _exceeds(self, ratio: float) -> bool:
+        if self.max_history_length > 0 and len(self.message_history) > int((self.max_history_length - 1) * ratio):
+            return True
+        if self.max_history_tokens > 0 and self.token_num > int(self.max_history_tokens * ratio):
+            return True
+        return False
+
+    def _trim(self) -> List[HistoryMessage]:
+        dropped = []
+        while len(self.message_history) > 0 and (
+                self._exceeds(self.trim_ratio) or (len(dropped) > 0 and self.message_history[0].role != "human")):
+            # history starts from a human message after trimming
+            dropped.append(self.message_history.popleft())
+            self.message_cache.popleft()
+            self.token_num -= self.token_counts.popleft()
+        return dropped
 
-  
\ No newline at end of file
+    def _summarize(self, messages: List[HistoryMessage]):
+        with self.summary_lock:
+            try:
+                summary = self.summarize_func(self.summary, messages)
+            except Exception as e:
+                logger.opt(exception=e).error("Failed to summarize chat history")
+                return
+            with self.lock:
+                self.summary = summary or ""
@@ -1,20 +1,31 @@
 
 
+import asyncio
+import functools
+import importlib.util
 import os
 import re
-from typing import Dict, Optional, cast
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, cast
+
+import httpx
 from loguru import logger
 from pydantic import BaseModel, Field
 from abc import ABC
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 from chat_engine.contexts.handler_context import HandlerContext
 from chat_engine.data_models.chat_engine_config_data import ChatEngineConfigModel, HandlerBaseConfigModel
 from chat_engine.common.handler_base import HandlerBase, HandlerBaseInfo, HandlerDataInfo, HandlerDetail
 from chat_engine.data_models.chat_data.chat_data_model import ChatData
 from chat_engine.data_models.chat_data_type import ChatDataType
 from chat_engine.contexts.session_context import SessionContext
+from chat_engine.core.session_event_loop import SessionEventLoop
+from engine_utils.directory_info import DirectoryInfo
 from chat_engine.data_models.runtime_data.data_bundle import DataBundle, DataBundleDefinition, DataBundleEntry
 from handlers.llm.openai_compatible.chat_history_manager import ChatHistory, HistoryMessage
+from handlers.llm.openai_compatible.response_cache import ResponseCache
+from handlers.llm.openai_compatible.speculative_completion import SpeculativeCompletion, normalize_transcript
+from handlers.llm.openai_compatible.vision_frame_sampler import VisionFrameSampler
 
 
 class LLMConfig(HandlerBaseConfigModel, BaseModel):
@@ -23,6 +34,36 @@ class LLMConfig(HandlerBaseConfigModel, BaseModel):
     api_key: str = Field(default=os.getenv("DASHSCOPE_API_KEY"))
     api_url: str = Field(default=None)
     enable_video_input: bool = Field(default=False)
+    # camera frames are subscribed at most once per interval, and downscaled to max size
+    video_frame_interval: float = Field(default=0.5)
+    video_frame_max_size: int = Field(default=640)
+    # connections of the client shared by all sessions
+    max_connections: int = Field(default=100)
+    max_keepalive_connections: int = Field(default=20)
+    # requires h2 package
+    http2: bool = Field(default=False)
+    # stream completions on an event loop instead of holding handler thread while waiting on tokens
+    async_streaming: bool = Field(default=False)
+    # start completion on partial human text of streaming asr, generated text is held until the turn ends
+    speculative_start: bool = Field(default=False)
+    # partial text with less characters does not start a speculative completion
+    speculative_min_chars: int = Field(default=2)
+    # history is trimmed by estimated tokens, message count limit is disabled when not positive
+    history_max_tokens: int = Field(default=4000)
+    history_max_length: int = Field(default=0)
+    # trimmed history keeps this ratio of the limits, so message prefix stays stable for several turns
+    history_trim_ratio: float = Field(default=0.5)
+    # roll trimmed messages into a summary with the llm
+    history_summary: bool = Field(default=False)
+    # replay responses of identical requests, requests with images are not cached
+    response_cache: bool = Field(default=False)
+    response_cache_size: int = Field(default=256)
+    # seconds, cached responses never expire when not positive
+    response_cache_ttl: float = Field(default=3600)
+    # number of latest history messages in cache key
+    response_cache_history: int = Field(default=2)
+    # jsonl file to persist cached responses, relative to project root if not absolute
+    response_cache_path: Optional[str] = Field(default=None)
 
 
 class LLMContext(HandlerContext):
@@ -37,14 +78,37 @@ class LLMContext(HandlerContext):
         self.client = None
         self.input_texts = ""
         self.output_texts = ""
-        self.current_image = None
+        self.frame_sampler: Optional[VisionFrameSampler] = None
         self.history = ChatHistory()
         self.enable_video_input = False
+        # completion streaming in async mode, next turn waits for it
+        self.completion_future: Optional[Future] = None
+        # completion started on partial human text of current speech
+        self.speculation: Optional[SpeculativeCompletion] = None
+
+    def has_images(self) -> bool:
+        return self.frame_sampler is not None and self.frame_sampler.frame is not None
+
+    def get_images(self) -> List[str]:
+        if self.frame_sampler is None:
+            return []
+        image_url = self.frame_sampler.get_image_url()
+        return [image_url] if image_url is not None else []
+
+    def clear_images(self):
+        if self.frame_sampler is not None:
+            self.frame_sampler.clear()
 
 
 class HandlerLLM(HandlerBase, ABC):
     def __init__(self):
         super().__init__()
+        self.client: Optional[OpenAI] = None
+        self.async_client: Optional[AsyncOpenAI] = None
+        self.event_loop: Optional[SessionEventLoop] = None
+        # jpeg encoder of sampled camera frames shared by all sessions
+        self.frame_encoder: Optional[ThreadPoolExecutor] = None
+        self.response_cache: Optional[ResponseCache] = None
 
     def get_handler_info(self) -> HandlerBaseInfo:
         return HandlerBaseInfo(
@@ -55,14 +119,22 @@ class HandlerLLM(HandlerBase, ABC):
                            context: HandlerContext) -> HandlerDetail:
         definition = DataBundleDefinition()
         definition.add_entry(DataBundleEntry.create_text_entry("avatar_text"))
+        context = cast(LLMContext, context)
         inputs = {
             ChatDataType.HUMAN_TEXT: HandlerDataInfo(
                 type=ChatDataType.HUMAN_TEXT,
-            ),
-            ChatDataType.CAMERA_VIDEO: HandlerDataInfo(
-                type=ChatDataType.CAMERA_VIDEO,
+                # partial human text is only used by speculative start
+                meta_predicate=None if context.config.speculative_start
+                else lambda meta: not meta.get("human_text_partial", False),
             ),
         }
+        if context.enable_video_input:
+            frame_interval = context.config.video_frame_interval
+            inputs[ChatDataType.CAMERA_VIDEO] = HandlerDataInfo(
+                type=ChatDataType.CAMERA_VIDEO,
+                max_rate=1 / frame_interval if frame_interval > 0 else 0,
+                latest_only=True,
+            )
         outputs = {
             ChatDataType.AVATAR_TEXT: HandlerDataInfo(
                 type=ChatDataType.AVATAR_TEXT,
@@ -79,22 +151,66 @@ class HandlerLLM(HandlerBase, ABC):
                 error_message = 'api_key is required in config/xxx.yaml, when use handler_llm'
                 logger.error(error_message)
                 raise ValueError(error_message)
+            http2 = handler_config.http2
+            if http2 and importlib.util.find_spec("h2") is None:
+                logger.warning("Package h2 is not installed, http2 is disabled for llm client.")
+                http2 = False
+            limits = httpx.Limits(max_connections=handler_config.max_connections,
+                                  max_keepalive_connections=handler_config.max_keepalive_connections)
+            # one pooled client for all sessions, connections are kept alive and reused across sessions
+            self.client = OpenAI(
+                api_key=handler_config.api_key,
+                base_url=handler_config.api_url,
+                http_client=httpx.Client(limits=limits, http2=http2),
+            )
+            if handler_config.async_streaming:
+                self.event_loop = SessionEventLoop(max_workers=1)
+                self.event_loop.start()
+                self.async_client = AsyncOpenAI(
+                    api_key=handler_config.api_key,
+                    base_url=handler_config.api_url,
+                    http_client=httpx.AsyncClient(limits=limits, http2=http2),
+                )
+                if handler_config.speculative_start:
+                    logger.warning("Speculative start is not supported with async streaming, it is disabled.")
+            if handler_config.enable_video_input:
+                self.frame_encoder = ThreadPoolExecutor(max_workers=1, thread_name_prefix="llm_frame_encoder")
+            if handler_config.response_cache:
+                cache_path = handler_config.response_cache_path
+                if cache_path is not None and not os.path.isabs(cache_path):
+                    cache_path = os.path.join(DirectoryInfo.get_project_dir(), cache_path)
+                self.response_cache = ResponseCache(max_size=handler_config.response_cache_size,
+                                                    ttl=handler_config.response_cache_ttl,
+                                                    persist_path=cache_path)
 
     def create_context(self, session_context, handler_config=None):
         if not isinstance(handler_config, LLMConfig):
             handler_config = LLMConfig()
         context = LLMContext(session_context.session_info.session_id)
+        context.config = handler_config
         context.model_name = handler_config.model_name
         context.system_prompt = {'role': 'system', 'content': handler_config.system_prompt}
         context.api_key = handler_config.api_key
         context.api_url = handler_config.api_url
         context.enable_video_input = handler_config.enable_video_input
-        
-        context.client = OpenAI(
-            # 若没有配置环境变量，请用百炼API Key将下行替换为：api_key="sk-xxx",
-            api_key=context.api_key,
-            base_url=context.api_url,
+        if context.enable_video_input:
+            context.frame_sampler = VisionFrameSampler(self.frame_encoder,
+                                                       max_size=handler_config.video_frame_max_size)
+        context.history = ChatHistory(
+            max_history_length=handler_config.history_max_length,
+            max_history_tokens=handler_config.history_max_tokens,
+            trim_ratio=handler_config.history_trim_ratio,
+            summarize_func=functools.partial(self._summarize_history, context)
+            if handler_config.history_summary else None,
         )
+
+        context.client = self.client
+        if context.client is None:
+            context.client = OpenAI(
+                # 若没有配置环境变量，请用百炼API Key将下行替换为：api_key="sk-xxx",
+                api_key=context.api_key,
+                base_url=context.api_url,
+            )
         return context
     
     def start_context(self, session_context, handler_context):
@@ -106,7 +222,7 @@ class HandlerLLM(HandlerBase, ABC):
         context = cast(LLMContext, context)
         text = None
         if inputs.type == ChatDataType.CAMERA_VIDEO and context.enable_video_input:
-            context.current_image = inputs.data.get_main_data()
+            context.frame_sampler.update(inputs.data.get_main_data())
             return
         elif inputs.type == ChatDataType.HUMAN_TEXT:
             text = inputs.data.get_main_data()
@@ -116,6 +232,12 @@ class HandlerLLM(HandlerBase, ABC):
         if (speech_id is None):
             speech_id = context.session_id
 
+        if inputs.data.get_meta("human_text_partial", False):
+            # partial hypothesis of streaming asr, final text will follow
+            if context.config.speculative_start and self.async_client is None and text is not None:
+                self._speculate(context, text, speech_id)
+            return
+
         if text is not None:
             context.input_texts += text
 
@@ -128,39 +250,181 @@ class HandlerLLM(HandlerBase, ABC):
         if len(chat_text) < 1:
             return
         logger.info(f'llm input {context.model_name} {chat_text} ')
-        current_content = context.history.generate_next_messages(chat_text, 
-                                                                 [context.current_image] if context.current_image is not None else [])
-        logger.debug(f'llm input {context.model_name} {current_content} ')
-        completion = context.client.chat.completions.create(
+        context.input_texts = ''
+        context.output_texts = ''
+        if self.async_client is not None:
+            images = context.get_images()
+            context.clear_images()
+            # history is read and extended on the loop once the completion in flight has finished,
+            # so every turn is built on the previous reply
+            context.completion_future = self.event_loop.submit(self._stream_completion_async(
+                context, output_definition, speech_id, chat_text, images, context.completion_future))
+            return
+        cache_key = self._get_cache_key(context, chat_text, context.has_images())
+        cached_texts = self.response_cache.get(cache_key) if cache_key is not None else None
+        speculation = self._take_speculation(context, speech_id, chat_text)
+        if cached_texts is not None:
+            logger.info(f'use cached response of {speech_id}')
+            if speculation is not None:
+                speculation.cancel()
+            context.history.add_message(HistoryMessage(role="human", content=chat_text))
+            context.clear_images()
+            output_texts = iter(cached_texts)
+        elif speculation is not None:
+            logger.info(f'use speculative completion of {speech_id}')
+            context.history.add_message(HistoryMessage(role="human", content=chat_text))
+            context.clear_images()
+            output_texts = speculation.iter_texts()
+        else:
+            current_content = context.history.generate_next_messages(chat_text, context.get_images())
+            logger.debug(f'llm input {context.model_name} {current_content} ')
+            messages = [context.system_prompt] + current_content
+            context.clear_images()
+            output_texts = self._iter_completion_texts(context, messages)
+        output_chunks = []
+        for output_text in output_texts:
+            context.output_texts += output_text
+            output_chunks.append(output_text)
+            logger.info(output_text)
+            yield self._create_text_output(output_definition, output_text, speech_id, False)
+        if cache_key is not None and cached_texts is None:
+            self.response_cache.put(cache_key, output_chunks)
+        yield self._finish_completion(context, output_definition, speech_id, context.output_texts)
+        context.output_texts = ''
+
+    def _get_cache_key(self, context: LLMContext, chat_text: str, has_images: bool) -> Optional[str]:
+        if self.response_cache is None or has_images:
+            return None
+        return ResponseCache.make_key(context.model_name, context.system_prompt['content'],
+                                      context.history.get_recent_messages(context.config.response_cache_history),
+                                      chat_text)
+
+    @classmethod
+    def _create_completion(cls, context: LLMContext, messages: List[Dict]):
+        return context.client.chat.completions.create(
             model=context.model_name,  # 此处以qwen-plus为例，可按需更换模型名称。模型列表：https://help.aliyun.com/zh/model-studio/getting-started/models
-            messages=[
-                context.system_prompt,
-            ] + current_content,
+            messages=messages,
             stream=True,
             stream_options={"include_usage": True}
         )
-        context.current_image = None
-        context.input_texts = ''
-        context.output_texts = ''
-        for chunk in completion:
+
+    @classmethod
+    def _iter_completion_texts(cls, context: LLMContext, messages: List[Dict]):
+        for chunk in cls._create_completion(context, messages):
             if (chunk and chunk.choices and chunk.choices[0] and chunk.choices[0].delta.content):
-                output_text = chunk.choices[0].delta.content
-                context.output_texts += output_text
-                logger.info(output_text)
-                output = DataBundle(output_definition)
-                output.set_main_data(output_text)
-                output.add_meta("avatar_text_end", False)
-                output.add_meta("speech_id", speech_id)
-                yield output
-        context.history.add_message(HistoryMessage(role="avatar", content=context.output_texts))
-        context.output_texts = ''
+                yield chunk.choices[0].delta.content
+
+    @classmethod
+    def _speculate(cls, context: LLMContext, partial_text: str, speech_id: str):
+        chat_text = re.sub(r"<\|.*?\|>", "", context.input_texts + partial_text)
+        if context.speculation is not None:
+            if context.speculation.matches(speech_id, chat_text):
+                return
+            logger.info(f'partial human text changed, restart speculative completion of {speech_id}')
+            cls._cancel_speculation(context)
+        if len(normalize_transcript(chat_text)) < context.config.speculative_min_chars:
+            return
+        current_content = context.history.generate_next_messages(
+            chat_text, context.get_images(), add_to_history=False)
+        messages = [context.system_prompt] + current_content
+        logger.info(f'llm speculative input {context.model_name} {chat_text} ')
+        context.speculation = SpeculativeCompletion(
+            speech_id, chat_text, functools.partial(cls._create_completion, context, messages)).start()
+
+    @classmethod
+    def _take_speculation(cls, context: LLMContext, speech_id: str, chat_text: str) -> Optional[SpeculativeCompletion]:
+        speculation = context.speculation
+        context.speculation = None
+        if speculation is None:
+            return None
+        if not speculation.matches(speech_id, chat_text):
+            logger.info(f'final human text differs from speculation of {speech_id}, restart completion')
+            speculation.cancel()
+            return None
+        return speculation
+
+    @classmethod
+    def _cancel_speculation(cls, context: LLMContext):
+        if context.speculation is not None:
+            context.speculation.cancel()
+            context.speculation = None
+
+    @classmethod
+    def _summarize_history(cls, context: LLMContext, summary: str, messages: List[HistoryMessage]) -> str:
+        conversation = "\n".join(f"{message.role}: {message.content}" for message in messages)
+        if len(summary) > 0:
+            conversation = f"{ChatHistory.summary_prefix}{summary}\n{conversation}"
+        completion = context.client.chat.completions.create(
+            model=context.model_name,
+            messages=[
+                {"role": "system", "content": "Summarize the conversation in a few sentences, in its own language. "
+                                              "Keep facts and user preferences needed to continue it."},
+                {"role": "user", "content": conversation},
+            ],
+        )
+        return completion.choices[0].message.content
+
+    @classmethod
+    def _create_text_output(cls, output_definition: DataBundleDefinition, text: str, speech_id: str, text_end: bool):
+        output = DataBundle(output_definition)
+        output.set_main_data(text)
+        output.add_meta("avatar_text_end", text_end)
+        output.add_meta("speech_id", speech_id)
+        return output
+
+    @classmethod
+    def _finish_completion(cls, context: LLMContext, output_definition: DataBundleDefinition, speech_id: str,
+                           output_texts: str):
+        context.history.add_message(HistoryMessage(role="avatar", content=output_texts))
         logger.info('avatar text end')
-        end_output = DataBundle(output_definition)
-        end_output.set_main_data('')
-        end_output.add_meta("avatar_text_end", True)
-        end_output.add_meta("speech_id", speech_id)
-        yield end_output
+        return cls._create_text_output(output_definition, '', speech_id, True)
+
+    async def _stream_completion_async(self, context: LLMContext, output_definition: DataBundleDefinition,
+                                       speech_id: str, chat_text: str, images: List[str],
+                                       previous_future: Optional[Future]):
+        if previous_future is not None:
+            # keep turns of a session in order
+            try:
+                await asyncio.wrap_future(previous_future)
+            except Exception:
+                pass
+        output_texts = ''
+        cache_key = self._get_cache_key(context, chat_text, len(images) > 0)
+        cached_texts = self.response_cache.get(cache_key) if cache_key is not None else None
+        if cached_texts is not None:
+            logger.info(f'use cached response of {speech_id}')
+            context.history.add_message(HistoryMessage(role="human", content=chat_text))
+            for output_text in cached_texts:
+                output_texts += output_text
+                context.submit_data(self._create_text_output(output_definition, output_text, speech_id, False))
+            context.submit_data(self._finish_completion(context, output_definition, speech_id, output_texts))
+            return
+        messages = [context.system_prompt] + context.history.generate_next_messages(chat_text, images)
+        logger.debug(f'llm input {context.model_name} {messages} ')
+        output_chunks = []
+        try:
+            completion = await self.async_client.chat.completions.create(
+                model=context.model_name,
+                messages=messages,
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+            async for chunk in completion:
+                if chunk and chunk.choices and chunk.choices[0] and chunk.choices[0].delta.content:
+                    output_text = chunk.choices[0].delta.content
+                    output_texts += output_text
+                    output_chunks.append(output_text)
+                    logger.info(output_text)
+                    context.submit_data(self._create_text_output(output_definition, output_text, speech_id, False))
+            if cache_key is not None:
+                self.response_cache.put(cache_key, output_chunks)
+        except Exception as e:
+            logger.opt(exception=e).error(f"Failed to stream completion of {speech_id}")
+        context.submit_data(self._finish_completion(context, output_definition, speech_id, output_texts))
 
     def destroy_context(self, context: HandlerContext):
-        pass
+        context = cast(LLMContext, context)
+        if context.completion_future is not None:
+            context.completion_future.cancel()
+        self._cancel_speculation(context)
 
@@ -0,0 +1,93 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from handlers.llm.openai_compatible.speculative_completion import normalize_transcript
+
+
+class ResponseCache:
+    """
+    LRU cache of streamed responses keyed on normalized request content, with optional ttl. Entries can be persisted
+    to an append only jsonl file, which is compacted when it is loaded.
+    """
+
+    def __init__(self, max_size: int = 256, ttl: float = 0, persist_path: Optional[str] = None):
+        self.max_size = max(1, max_size)
+        # seconds, entries never expire when not positive
+        self.ttl = ttl
+        self.persist_path = persist_path
+        self.lock = threading.Lock()
+        self.entries: OrderedDict[str, Tuple[float, List[str]]] = OrderedDict()
+        if persist_path is not None:
+            self._load()
+
+    @classmethod
+    def make_key(cls, model_name: str, system_prompt: str, history_messages: List[Dict], user_text: str) -> str:
+        key_content = [model_name, normalize_transcript(system_prompt)]
+        for message in history_messages:
+            key_content.append(f"{message['role']}:{normalize_transcript(message['content'])}")
+        key_content.append(normalize_transcript(user_text))
+        return hashlib.sha256(json.dumps(key_content, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[List[str]]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if self._expired(entry[0]):
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return list(entry[1])
+
+    def put(self, key: str, chunks: List[str]):
+        if len(chunks) == 0:
+            return
+        entry = (time.time(), list(chunks))
+        with self.lock:
+            self._insert(key, entry)
+            if self.persist_path is not None:
+                try:
+                    with open(self.persist_path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps({"key": key, "time": entry[0], "chunks": entry[1]},
+                                           ensure_ascii=False) + "\n")
+                except OSError as e:
+                    logger.warning(f"Failed to persist llm response cache to {self.persist_path}: {e}")
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _expired(self, created_time: float) -> bool:
+        return self.ttl > 0 and time.time() - created_time > self.ttl
+
+    def _insert(self, key: str, entry: Tuple[float, List[str]]):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def _load(self):
+        if not os.path.isfile(self.persist_path):
+            os.makedirs(os.path.dirname(os.path.abspath(self.persist_path)), exist_ok=True)
+            return
+        with open(self.persist_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if not self._expired(record["time"]):
+                    self._insert(record["key"], (record["time"], record["chunks"]))
+        # rewrite with live entries only, so the file does not grow without bound across restarts
+        temp_path = self.persist_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for key, (created_time, chunks) in self.entries.items():
+                f.write(json.dumps({"key": key, "time": created_time, "chunks": chunks}, ensure_ascii=False) + "\n")
+        os.replace(temp_path, self.persist_path)
+        logger.info(f"Loaded {len(self.entries)} llm responses from {self.persist_path}")
@@ -0,0 +1,74 @@
+import queue
+import re
+import threading
+from typing import Callable, Iterable, Optional
+
+from loguru import logger
+
+
+def normalize_transcript(text: str) -> str:
+    # punctuation and spacing of partial and final asr results may differ, words decide whether a guess holds
+    return re.sub(r"[\W_]+", "", re.sub(r"<\|.*?\|>", "", text)).lower()
+
+
+class SpeculativeCompletion:
+    """
+    Completion started on a provisional transcript before the turn is confirmed. Streamed texts are buffered
+    until the handler confirms the turn and consumes them, or the completion is cancelled when transcript changes.
+    """
+
+    def __init__(self, speech_id: str, transcript: str, create_stream: Callable[[], Iterable]):
+        self.speech_id = speech_id
+        self.transcript = transcript
+        self.normalized_transcript = normalize_transcript(transcript)
+        self.create_stream = create_stream
+        self.text_queue = queue.Queue()
+        self.cancelled = threading.Event()
+        self.stream = None
+        self.error: Optional[Exception] = None
+        self.thread = threading.Thread(target=self._run, name=f"speculative_completion_{speech_id}", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def matches(self, speech_id: str, transcript: str) -> bool:
+        return self.speech_id == speech_id and self.normalized_transcript == normalize_transcript(transcript)
+
+    def cancel(self):
+        self.cancelled.set()
+        stream = self.stream
+        if stream is not None and hasattr(stream, "close"):
+            try:
+                stream.close()
+            except Exception as e:
+                logger.debug(f"Failed to close speculative completion stream: {e}")
+
+    def iter_texts(self):
+        """
+        Yield buffered texts first and then the rest of completion as it streams. Raise error of the completion.
+        """
+        while True:
+            text = self.text_queue.get()
+            if text is None:
+                break
+            yield text
+        if self.error is not None:
+            raise self.error
+
+    def _run(self):
+        try:
+            self.stream = self.create_stream()
+            if self.cancelled.is_set():
+                self.cancel()
+                return
+            for chunk in self.stream:
+                if self.cancelled.is_set():
+                    break
+                if chunk and chunk.choices and chunk.choices[0] and chunk.choices[0].delta.content:
+                    self.text_queue.put(chunk.choices[0].delta.content)
+        except Exception as e:
+            if not self.cancelled.is_set():
+                self.error = e
+        finally:
+            self.text_queue.put(None)
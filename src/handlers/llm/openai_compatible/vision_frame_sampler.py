@@ -0,0 +1,92 @@
+import base64
+import threading
+from concurrent.futures import Executor, Future
+from typing import Optional
+
+import cv2
+import numpy as np
+from loguru import logger
+
+
+class VisionFrameSampler:
+    """
+    Keep a downscaled latest camera frame. Frames are jpeg encoded by executor ahead of the turn end, so the data url
+    is usually ready when the request is built. Frames are not throttled here, the handler subscribes to camera video
+    at a limited rate.
+    """
+
+    def __init__(self, executor: Optional[Executor], max_size: int = 640, jpeg_quality: int = 85):
+        self.executor = executor
+        self.max_size = max_size
+        self.jpeg_quality = jpeg_quality
+        self.lock = threading.Lock()
+        self.frame: Optional[np.ndarray] = None
+        self.frame_version = 0
+        self.encode_future: Optional[Future] = None
+        self.encoded_version = -1
+        self.encoded_frame: Optional[np.ndarray] = None
+        self.encoded_url: Optional[str] = None
+
+    def update(self, frame: np.ndarray):
+        frame = self.downscale(np.squeeze(frame), self.max_size)
+        with self.lock:
+            self.frame = frame
+            self.frame_version += 1
+            version = self.frame_version
+        if self.executor is not None:
+            self.encode_future = self.executor.submit(self._encode_version, frame, version)
+
+    def get_image_url(self) -> Optional[str]:
+        with self.lock:
+            frame = self.frame
+            version = self.frame_version
+            if frame is None:
+                return None
+            if self.encoded_version == version:
+                return self.encoded_url
+        future = self.encode_future
+        if future is not None:
+            try:
+                future.result()
+            except Exception as e:
+                logger.opt(exception=e).warning("Failed to encode camera frame in background")
+        with self.lock:
+            if self.encoded_version == version:
+                return self.encoded_url
+        return self._encode_version(frame, version)
+
+    def clear(self):
+        with self.lock:
+            self.frame = None
+
+    @classmethod
+    def downscale(cls, frame: np.ndarray, max_size: int) -> np.ndarray:
+        height, width = frame.shape[:2]
+        scale = max_size / max(height, width)
+        if max_size <= 0 or scale >= 1:
+            return frame
+        return cv2.resize(frame, (max(1, round(width * scale)), max(1, round(height * scale))),
+                          interpolation=cv2.INTER_AREA)
+
+    def _encode_version(self, frame: np.ndarray, version: int) -> str:
+        with self.lock:
+            encoded_frame = self.encoded_frame
+            encoded_url = self.encoded_url
+        # camera pointing at a static scene produces the same frame, its encoding is reused
+        if encoded_frame is None or not np.array_equal(encoded_frame, frame):
+            encoded_url = self.encode(frame, self.jpeg_quality)
+            encoded_frame = frame
+        with self.lock:
+            if version >= self.encoded_version:
+                self.encoded_version = version
+                self.encoded_frame = encoded_frame
+                self.encoded_url = encoded_url
+        return encoded_url
+
+    @classmethod
+    def encode(cls, frame: np.ndarray, jpeg_quality: int) -> str:
+        # frame is bgr as in ImageUtils.numpy2base64, which is what cv2 expects
+        success, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
+        if not success:
+            raise ValueError(f"Failed to encode frame of shape {frame.shape}")
+        return f"data:image/jpeg;base64,{base64.b64encode(buffer.tobytes()).decode('utf-8')}"
@@ -0,0 +1,190 @@
+import threading
+import time
+from collections import deque
+from typing import Callable, Generic, List, Optional, TypeVar
+
+import numpy as np
+from loguru import logger
+
+T = TypeVar("T")
+
+
+# private method of dashscope SpeechSynthesizer opening the websocket and starting the task
+_START_STREAM = "_SpeechSynthesizer__start_stream"
+
+
+def can_start_synthesizer_stream(synthesizer_class) -> bool:
+    """
+    Whether the installed dashscope lets synthesizers be started ahead of their first text.
+    """
+    return hasattr(synthesizer_class, _START_STREAM)
+
+
+def start_synthesizer_stream(synthesizer):
+    """
+    Open the websocket of a dashscope SpeechSynthesizer and start its task before any text is known, which the sdk
+    otherwise does at the first streaming_call. Later streaming_call only submits text. Without the private start
+    method of the pinned sdk version, the synthesizer is returned as is and starts at its first streaming_call.
+    """
+    # dashscope 1.23 has no public pre connect, its own object pool in later versions goes the same way
+    if not can_start_synthesizer_stream(synthesizer) or not hasattr(synthesizer, "_is_first"):
+        return synthesizer
+    getattr(synthesizer, _START_STREAM)()
+    synthesizer._is_first = False
+    return synthesizer
+
+
+class SynthesizerPool(Generic[T]):
+    """
+    Keep size synthesizers opened ahead of time, so a reply starts on an established connection instead of paying
+    connect and task start latency at its first text. A synthesizer serves a single reply and is replaced in the
+    background once leased. Idle ones are reopened after max_idle_seconds, before the server drops them.
+    """
+
+    def __init__(self, open_synthesizer: Callable[[], T], close_synthesizer: Callable[[T], None],
+                 size: int = 2, max_idle_seconds: float = 20.0, retry_seconds: float = 1.0,
+                 is_open: Optional[Callable[[T], bool]] = None):
+        self.open_synthesizer = open_synthesizer
+        self.close_synthesizer = close_synthesizer
+        # tells whether an idle synthesizer is still connected, leasing skips those dropped by the server
+        self.is_open = is_open
+        self.size = size
+        self.max_idle_seconds = max_idle_seconds
+        self.retry_seconds = retry_seconds
+        # (open time, synthesizer), oldest first
+        self.idle = deque()
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.refill_thread = None
+
+    def start(self):
+        if self.size <= 0:
+            return
+        self.refill_thread = threading.Thread(target=self._refill, daemon=True)
+        self.refill_thread.start()
+
+    @property
+    def idle_num(self) -> int:
+        with self.condition:
+            return len(self.idle)
+
+    def lease(self) -> T:
+        """
+        Take an opened synthesizer, or open one right away if none is ready.
+        """
+        synthesizer = None
+        with self.condition:
+            expired = self._take_expired()
+            while len(self.idle) > 0 and synthesizer is None:
+                _, synthesizer = self.idle.popleft()
+                if self.is_open is not None and not self.is_open(synthesizer):
+                    expired.append(synthesizer)
+                    synthesizer = None
+            self.condition.notify_all()
+        self._close(expired)
+        if synthesizer is None:
+            logger.warning("no pre opened synthesizer ready, opening one for this reply")
+            synthesizer = self.open_synthesizer()
+        return synthesizer
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            idle = [synthesizer for _, synthesizer in self.idle]
+            self.idle.clear()
+            self.condition.notify_all()
+        if self.refill_thread is not None:
+            self.refill_thread.join()
+            self.refill_thread = None
+        self._close(idle)
+
+    def _take_expired(self) -> List[T]:
+        expired = []
+        deadline = time.monotonic() - self.max_idle_seconds
+        while len(self.idle) > 0 and self.idle[0][0] <= deadline:
+            expired.append(self.idle.popleft()[1])
+        return expired
+
+    def _close(self, synthesizers: List[T]):
+        for synthesizer in synthesizers:
+            try:
+                self.close_synthesizer(synthesizer)
+            except Exception as e:
+                logger.warning(f"failed to close idle synthesizer: {e}")
+
+    def _refill(self):
+        while True:
+            with self.condition:
+                while not self.stopped and len(self.idle) >= self.size:
+                    wait_seconds = self.idle[0][0] + self.max_idle_seconds - time.monotonic()
+                    if wait_seconds <= 0:
+                        break
+                    self.condition.wait(wait_seconds)
+                if self.stopped:
+                    return
+                expired = self._take_expired()
+            self._close(expired)
+            try:
+                synthesizer = self.open_synthesizer()
+            except Exception as e:
+                logger.warning(f"failed to pre open synthesizer: {e}")
+                with self.condition:
+                    self.condition.wait_for(lambda: self.stopped, self.retry_seconds)
+                continue
+            with self.condition:
+                if not self.stopped:
+                    self.idle.append((time.monotonic(), synthesizer))
+                    synthesizer = None
+            if synthesizer is not None:
+                self._close([synthesizer])
+
+
+class PcmFrameBuffer:
+    """
+    Collect streamed 16 bit pcm into frames of a fixed number of samples. Incoming bytes are copied once into a
+    preallocated frame, whole frames in a large message are converted straight from it.
+    """
+
+    def __init__(self, frame_samples: int):
+        self.frame_bytes = frame_samples * 2
+        self.frame = bytearray(self.frame_bytes)
+        self.frame_view = memoryview(self.frame)
+        self.filled = 0
+
+    def push(self, data: bytes) -> List[np.ndarray]:
+        """
+        Return frames completed by data as float32 arrays of shape (1, frame_samples).
+        """
+        frames = []
+        data = memoryview(data).cast("B")
+        if self.filled > 0:
+            size = min(len(data), self.frame_bytes - self.filled)
+            self.frame_view[self.filled:self.filled + size] = data[:size]
+            self.filled += size
+            data = data[size:]
+            if self.filled < self.frame_bytes:
+                return frames
+            frames.append(self._convert(self.frame_view))
+            self.filled = 0
+        whole_bytes = len(data) - len(data) % self.frame_bytes
+        if whole_bytes > 0:
+            audio = self._convert(data[:whole_bytes])
+            frames.extend(np.split(audio, whole_bytes // self.frame_bytes, axis=-1))
+        rest = len(data) - whole_bytes
+        self.frame_view[:rest] = data[whole_bytes:]
+        self.filled = rest
+        return frames
+
+    def flush(self) -> Optional[np.ndarray]:
+        """
+        Return the last partial frame, if any, and start over.
+        """
+        sample_bytes = self.filled - self.filled % 2
+        self.filled = 0
+        if sample_bytes == 0:
+            return None
+        return self._convert(self.frame_view[:sample_bytes])
+
+    @classmethod
+    def _convert(cls, pcm: memoryview) -> np.ndarray:
+        return (np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32767)[np.newaxis, ...]
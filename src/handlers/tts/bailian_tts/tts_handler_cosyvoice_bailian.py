@@ -1,3 +1,4 @@
+import atexit
 import io
 import os
 import re
@@ -16,6 +17,9 @@ from chat_engine.data_models.chat_data_type import ChatDataType
 from chat_engine.contexts.session_context import SessionContext
 from chat_engine.data_models.runtime_data.data_bundle import DataBundle, DataBundleDefinition, DataBundleEntry
 from engine_utils.directory_info import DirectoryInfo
+from engine_utils.tts_audio_cache import TTSAudioCache
+from handlers.tts.bailian_tts.bailian_tts_pool import PcmFrameBuffer, SynthesizerPool, can_start_synthesizer_stream, \
+    start_synthesizer_stream
 from dashscope.audio.tts_v2 import SpeechSynthesizer, ResultCallback, AudioFormat
 import dashscope
 
@@ -26,6 +30,18 @@ class TTSConfig(HandlerBaseConfigModel, BaseModel):
     sample_rate: int = Field(default=24000)
     api_key: str = Field(default=os.getenv("DASHSCOPE_API_KEY"))
     model_name: str = Field(default="cosyvoice-1")
+    # number of synthesized short replies kept in memory, 0 to disable audio cache
+    audio_cache_size: int = Field(default=128)
+    # only replies up to this many characters are cached
+    audio_cache_max_chars: int = Field(default=20)
+    # directory to store cached audio across restarts, None to keep it in memory only
+    audio_cache_dir: str = Field(default=None)
+    # number of synthesizer connections opened ahead of replies, 0 to connect at the first text of a reply
+    connection_pool_size: int = Field(default=2)
+    # pre opened connections idle for longer are reopened before the server drops them
+    connection_max_idle_seconds: float = Field(default=20.0)
+    # synthesized audio is handed over in frames of this length
+    frame_seconds: float = Field(default=0.5)
 
 
 class TTSContext(HandlerContext):
@@ -37,6 +53,7 @@ class TTSContext(HandlerContext):
         self.dump_audio = False
         self.audio_dump_file = None
         self.synthesizer = None
+        self.synthesizer_callback = None
 
 
 class HandlerTTS(HandlerBase, ABC):
@@ -50,7 +67,10 @@ class HandlerTTS(HandlerBase, ABC):
         self.sample_rate = None
         self.model_name = None
         self.api_key = None
-      
+        self.audio_cache = None
+        self.synthesizer_pool = None
+        self.frame_samples = None
+
 
     def get_handler_info(self) -> HandlerBaseInfo:
         return HandlerBaseInfo(
@@ -77,16 +97,47 @@ class HandlerTTS(HandlerBase, ABC):
         )
 
     def load(self, engine_config: ChatEngineConfigModel, handler_config: Optional[BaseModel] = None):
-       config = cast(TTSConfig, handler_config)
-       self.voice = config.voice
-       self.sample_rate = config.sample_rate
-       self.ref_audio_path = config.ref_audio_path
-       self.ref_audio_text = config.ref_audio_text
-       self.model_name = config.model_name
-       if 'DASHSCOPE_API_KEY' in os.environ:
+        config = cast(TTSConfig, handler_config)
+        self.voice = config.voice
+        self.sample_rate = config.sample_rate
+        self.ref_audio_path = config.ref_audio_path
+        self.ref_audio_text = config.ref_audio_text
+        self.model_name = config.model_name
+        if 'DASHSCOPE_API_KEY' in os.environ:
             dashscope.api_key = os.environ['DASHSCOPE_API_KEY']  # load API-key from environment variable DASHSCOPE_API_KEY
-       else:
+        else:
             dashscope.api_key = config.api_key  # set API-key manually
+        if config.audio_cache_size > 0:
+            self.audio_cache = TTSAudioCache(config.audio_cache_size, config.audio_cache_max_chars,
+                                             config.audio_cache_dir)
+        # bailian synthesizes at 24000 regardless of the configured sample rate
+        self.frame_samples = max(1, int(24000 * config.frame_seconds))
+        pool_size = config.connection_pool_size
+        if pool_size > 0 and not can_start_synthesizer_stream(SpeechSynthesizer):
+            logger.warning("Installed dashscope can not start synthesizers ahead of replies, "
+                           "connection pool is disabled.")
+            pool_size = 0
+        self.synthesizer_pool = SynthesizerPool(self._open_synthesizer, self._close_synthesizer,
+                                                pool_size, config.connection_max_idle_seconds,
+                                                is_open=self._is_synthesizer_open)
+        self.synthesizer_pool.start()
+        atexit.register(self.synthesizer_pool.stop)
+
+    def _open_synthesizer(self) -> SpeechSynthesizer:
+        # callback is replaced by the one of the reply the synthesizer is leased to
+        synthesizer = SpeechSynthesizer(model=self.model_name, voice=self.voice, callback=ResultCallback(),
+                                        format=AudioFormat.PCM_24000HZ_MONO_16BIT)
+        return start_synthesizer_stream(synthesizer)
+
+    @classmethod
+    def _close_synthesizer(cls, synthesizer: SpeechSynthesizer):
+        synthesizer.streaming_cancel()
+
+    @classmethod
+    def _is_synthesizer_open(cls, synthesizer: SpeechSynthesizer) -> bool:
+        # complete event is also set when the server fails the started task
+        return (synthesizer.ws is not None and synthesizer.ws.sock is not None and synthesizer.ws.sock.connected
+                and not synthesizer.complete_event.is_set())
 
 
 
@@ -105,11 +156,6 @@ class HandlerTTS(HandlerBase, ABC):
         context = cast(TTSContext, context)
         
 
-    def filter_text(self, text):
-        pattern = r"[^a-zA-Z0-9\u4e00-\u9fff,.\~!?，。！？ ]"  # 匹配不在范围内的字符
-        filtered_text = re.sub(pattern, "", text)
-        return filtered_text
-
     def handle(self, context: HandlerContext, inputs: ChatData,
                output_definitions: Dict[ChatDataType, HandlerDataInfo]):
         output_definition = output_definitions.get(ChatDataType.AVATAR_AUDIO).definition
@@ -127,18 +173,63 @@ class HandlerTTS(HandlerBase, ABC):
             
 
         text_end = inputs.data.get_meta("avatar_text_end", False)
+        if text is None:
+            text = ''
+        context.input_text += text
+        if (context.synthesizer is None and self.audio_cache is not None
+                and len(context.input_text) <= self.audio_cache.max_text_chars):
+            if not text_end:
+                # a short reply may have been synthesized before, its text is held until the reply ends
+                return
+            if self._submit_cached(context, output_definition, speech_id, context.input_text):
+                context.input_text = ''
+                return
+        if context.synthesizer is None:
+            # text held back for the cache lookup goes out with this piece
+            text = context.input_text
+            callback = CosyvoiceCallBack(context=context, output_definition=output_definition, speech_id=speech_id,
+                                         frame_samples=self.frame_samples)
+            context.synthesizer_callback = callback
+            context.synthesizer = self.synthesizer_pool.lease()
+            context.synthesizer.callback = callback
+        if self.audio_cache is not None and len(context.input_text) > self.audio_cache.max_text_chars:
+            # reply is too long to be cached, stop collecting its audio
+            context.synthesizer_callback.cache_audios = None
         if not text_end:
-            if context.synthesizer is None:
-                callback = CosyvoiceCallBack(context=context, output_definition=output_definition, speech_id=speech_id)
-                context.synthesizer = SpeechSynthesizer(model=self.model_name, voice=self.voice, callback=callback, format=AudioFormat.PCM_24000HZ_MONO_16BIT)
             logger.info(f'streaming_call {text}')
             context.synthesizer.streaming_call(text)
         else:
             logger.info(f'streaming_call last {text}')
+            if self.audio_cache is not None:
+                context.synthesizer_callback.set_cache(
+                    self.audio_cache, self._make_cache_key(context.input_text))
             context.synthesizer.streaming_call(text)
             context.synthesizer.streaming_complete()
             context.synthesizer = None
+            context.synthesizer_callback = None
             context.input_text = ''
+
+    def _make_cache_key(self, text: str):
+        return self.audio_cache.make_key("bailian", f"{self.model_name}|{self.voice}", text, 24000)
+
+    def _submit_cached(self, context: TTSContext, output_definition, speech_id, text: str) -> bool:
+        if self.audio_cache is None:
+            return False
+        cached_audio = self.audio_cache.get(self._make_cache_key(text))
+        if cached_audio is None:
+            return False
+        logger.info(f'tts audio cache hit {text}')
+        output = DataBundle(output_definition)
+        output.set_main_data(cached_audio)
+        output.add_meta("avatar_speech_end", False)
+        output.add_meta("speech_id", speech_id)
+        context.submit_data(output)
+        output = DataBundle(output_definition)
+        output.set_main_data(np.zeros(shape=(1, 24000), dtype=np.float32))
+        output.add_meta("avatar_speech_end", True)
+        output.add_meta("speech_id", speech_id)
+        context.submit_data(output)
+        return True
            
 
     def destroy_context(self, context: HandlerContext):
@@ -147,12 +238,19 @@ class HandlerTTS(HandlerBase, ABC):
 
 
 class CosyvoiceCallBack(ResultCallback):
-    def __init__(self, context: TTSContext, output_definition, speech_id):
+    def __init__(self, context: TTSContext, output_definition, speech_id, frame_samples: int = 12000):
         super().__init__()
         self.context = context
         self.output_definition = output_definition
         self.speech_id = speech_id
-        self.temp_bytes = b''
+        self.frame_buffer = PcmFrameBuffer(frame_samples)
+        self.audio_cache = None
+        self.cache_key = None
+        self.cache_audios = []
+
+    def set_cache(self, audio_cache: TTSAudioCache, cache_key):
+        self.audio_cache = audio_cache
+        self.cache_key = cache_key
     
     def on_open(self) -> None:
         logger.info('连接成功')
@@ -162,29 +260,26 @@ class CosyvoiceCallBack(ResultCallback):
         logger.info(message)
     
     def on_data(self, data: bytes) -> None:
-        self.temp_bytes += data
-        if len(self.temp_bytes) > 24000:
-            # 实现接收合成二进制音频结果的逻辑
-            output_audio = np.array(np.frombuffer(self.temp_bytes, dtype=np.int16)).astype(np.float32)/32767# librosa.load(io.BytesIO(self.temp_bytes), sr=None)[0]
-            output_audio = output_audio[np.newaxis, ...]
-            output = DataBundle(self.output_definition)
-            output.set_main_data(output_audio)
-            output.add_meta("avatar_speech_end", False)
-            output.add_meta("speech_id", self.speech_id)
-            self.context.submit_data(output)
-            self.temp_bytes = b''
-            
+        # 实现接收合成二进制音频结果的逻辑
+        for output_audio in self.frame_buffer.push(data):
+            self._submit_audio(output_audio)
+
+    def _submit_audio(self, output_audio: np.ndarray):
+        if self.cache_audios is not None:
+            self.cache_audios.append(output_audio)
+        output = DataBundle(self.output_definition)
+        output.set_main_data(output_audio)
+        output.add_meta("avatar_speech_end", False)
+        output.add_meta("speech_id", self.speech_id)
+        self.context.submit_data(output)
 
     def on_complete(self) -> None:
-        if len(self.temp_bytes) > 0:
-            output_audio = np.array(np.frombuffer(self.temp_bytes, dtype=np.int16)).astype(np.float32)/32767
-            output_audio = output_audio[np.newaxis, ...]
-            output = DataBundle(self.output_definition)
-            output.set_main_data(output_audio)
-            output.add_meta("avatar_speech_end", False)
-            output.add_meta("speech_id", self.speech_id)
-            self.context.submit_data(output)
-            self.temp_bytes = b''
+        output_audio = self.frame_buffer.flush()
+        if output_audio is not None:
+            self._submit_audio(output_audio)
+        if self.audio_cache is not None and self.cache_key is not None and self.cache_audios:
+            self.audio_cache.put(self.cache_key, np.concatenate(self.cache_audios, axis=-1))
+        self.cache_audios = None
         output = DataBundle(self.output_definition)
         output.set_main_data(np.zeros(shape=(1, 24000), dtype=np.float32))
         output.add_meta("avatar_speech_end", True)
@@ -0,0 +1,70 @@
+from typing import Iterator, Optional
+
+import numpy as np
+import requests
+from loguru import logger
+
+from engine_utils.stream_resampler import StreamResampler
+
+
+class CosyVoiceApiClient:
+    """
+    Client of a remote CosyVoice zero shot api. Connections are kept alive across sentences and the prompt audio is
+    read once. Streamed pcm is resampled with state kept across chunks of a sentence.
+    """
+
+    # CosyVoice server streams 16 bit mono pcm at this rate
+    api_sample_rate = 22050
+
+    def __init__(self, api_url: str, ref_audio_path: Optional[str], ref_audio_text: Optional[str],
+                 sample_rate: int = 24000, chunk_seconds: float = 0.1, timeout: float = 30):
+        self.api_url = api_url
+        self.ref_audio_text = ref_audio_text
+        self.prompt_wav = None
+        if ref_audio_path is not None:
+            with open(ref_audio_path, "rb") as f:
+                self.prompt_wav = f.read()
+        # later audio is handed over once this many bytes arrived, the server may send much smaller pieces
+        self.chunk_bytes = int(self.api_sample_rate * chunk_seconds) * 2
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.resampler = StreamResampler(self.api_sample_rate, sample_rate)
+
+    def synthesize(self, text: str) -> Iterator[np.ndarray]:
+        """
+        Yield audio of text as float32 arrays of shape (1, n) at the target sample rate.
+        """
+        files = {'prompt_wav': ('prompt.wav', self.prompt_wav)} if self.prompt_wav is not None else None
+        data = {
+            'prompt_text': self.ref_audio_text,
+            'tts_text': text
+        }
+        self.resampler.reset()
+        with self.session.post(self.api_url, data=data, files=files, stream=True, timeout=self.timeout) as response:
+            if response.status_code != 200:
+                logger.info(f"Request failed with status code {response.status_code}")
+                return
+            pending = bytearray()
+            # first audio is handed over as soon as it arrives
+            chunk_bytes = 2
+            for content in response.iter_content(chunk_size=None):
+                pending += content
+                if len(pending) < chunk_bytes:
+                    continue
+                chunk_bytes = self.chunk_bytes
+                # keep odd trailing byte for the next sample
+                sample_bytes = len(pending) - len(pending) % 2
+                audio = self._resample(bytes(pending[:sample_bytes]))
+                del pending[:sample_bytes]
+                if audio.shape[0] > 0:
+                    yield audio[np.newaxis, ...]
+            audio = np.concatenate([self._resample(bytes(pending[:len(pending) - len(pending) % 2])),
+                                    self.resampler.flush()])
+            if audio.shape[0] > 0:
+                yield audio[np.newaxis, ...]
+
+    def _resample(self, pcm: bytes) -> np.ndarray:
+        return self.resampler.process(np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32767)
+
+    def close(self):
+        self.session.close()
@@ -6,12 +6,11 @@ import torch.multiprocessing as mp
 import os
 import sys
 
-import librosa
 from loguru import logger
-import numpy as np
-import requests
 
 from engine_utils.directory_info import DirectoryInfo
+from handlers.tts.cosyvoice.cosyvoice_api_client import CosyVoiceApiClient
+from handlers.tts.cosyvoice.shared_audio_ring import AudioChunkSender
 
 
 # @dataclass
@@ -26,7 +25,8 @@ from engine_utils.directory_info import DirectoryInfo
 spawn_context = mp.get_context('spawn')   
 
 class TTSCosyVoiceProcessor(spawn_context.Process):
-    def __init__(self, handler_root: str, config: any, input_queue: Queue, output_queue: Queue):
+    def __init__(self, handler_root: str, config: any, input_queue: Queue, output_queue: Queue,
+                 ring_args: tuple = (None, 0, -1)):
         super().__init__()
         self.handler_root = handler_root
         self.model = None
@@ -38,40 +38,32 @@ class TTSCosyVoiceProcessor(spawn_context.Process):
         self.ref_audio_buffer = None
         self.sample_rate = config.sample_rate
         self.api_key = config.api_key
+        self.api_client = None
 
         self.input_queue = input_queue
         self.output_queue = output_queue
+        # audio goes through a shared memory ring of this worker, it is attached in the worker process
+        self.ring_args = ring_args
+        self.audio_sender = None
         self.dump_audio = False
 
     def run(self):
         logger.remove()
         logger.add(sys.stdout, level='INFO')
+        self.audio_sender = AudioChunkSender(self.output_queue, *self.ring_args)
         if self.dump_audio:
             dump_file_path = os.path.join(DirectoryInfo.get_project_dir(),
                                             "dump_avatar_audio.pcm")
             self.audio_dump_file = open(dump_file_path, "wb")
         logger.info('start tts processor')
         if self.api_url is not None and self.model_name is None:
-            # === 构造 multipart/form-data 请求 ===
-            files = {
-                'prompt_wav': open(self.ref_audio_path, 'rb')
-            }
-            data = {
-                'prompt_text': self.ref_audio_text,
-                'tts_text': '测试'
-            }
-
-            # === 发送 POST 请求，流式接收返回的音频 ===
+            self.api_client = CosyVoiceApiClient(self.api_url, self.ref_audio_path, self.ref_audio_text,
+                                                 self.sample_rate)
             print("正在发送请求...")
-            response = requests.post(self.api_url, data=data, files=files, stream=True)
-            if response is not None:
-                for tts_speech in response:
-                    self.output_queue.put({
-                        'key': '',
-                        'tts_speech': tts_speech,
-                        'session_id': ''
-                    })
-                    logger.debug('tts test')
+            for tts_speech in self.api_client.synthesize('测试'):
+                logger.debug('tts test')
+            # only tells the handler that the worker is ready
+            self.audio_sender.send('', '', None)
         # use local model
         elif self.api_key is None and self.model_name is not None:
             sys.path.append(os.path.join(self.handler_root, "CosyVoice"))
@@ -101,11 +93,7 @@ class TTSCosyVoiceProcessor(spawn_context.Process):
                 return
             if response is not None:
                 for tts_speech in response:
-                    self.output_queue.put({
-                        'key': '',
-                        'tts_speech': tts_speech,
-                        'session_id': ''
-                    })
+                    self.audio_sender.send('', '', tts_speech['tts_speech'].numpy())
                     logger.debug('tts test')
         elif self.api_key is not None:
             raise TypeError('api_key not support yet')
@@ -120,89 +108,55 @@ class TTSCosyVoiceProcessor(spawn_context.Process):
             input_text = input['text']
             key = input['key']
             session_id = input['session_id']
-            if (len(input_text) < 1):
-                # ignore
-                logger.info('ignore empty input_text')
-            elif self.model is None and self.api_url is not None:
-
-
-                # === 构造 multipart/form-data 请求 ===
-                files = {
-                    'prompt_wav': open(self.ref_audio_path, 'rb')
-                }
-                data = {
-                    'prompt_text': self.ref_audio_text,
-                    'tts_text': input_text
-                }
-
-                # === 发送 POST 请求，流式接收返回的音频 ===
-                print("正在发送请求...")
-                response = requests.post(self.api_url, data=data, files=files, stream=True)
-
-
-
-                # # if you start cosyvoice tts server through CosyVoice/runtime/python/fastapi/server.py
-                # response = requests.get(self.api_url, data={
-                #     'tts_text': input_text,
-                #     'spk_id': self.spk_id
-                # }, stream=True)
-                if response.status_code != 200:
-                    logger.info(f"Request failed with status code {response.status_code}")
-                    continue
-                tts_audio = b''
-                for r in response.iter_content(chunk_size=16000):
-                    tts_audio = r
-                    tts_speech = np.array(np.frombuffer(tts_audio, dtype=np.int16)).astype(np.float32)/32767
-                    logger.debug(f'audio response {tts_speech.shape}')
-
-                    output_audio = librosa.resample(tts_speech, orig_sr=22050, target_sr=self.sample_rate)
-                    logger.debug(f'audio response resample {output_audio.shape}')
-                    out_audio = output_audio[np.newaxis, ...]
-                    output = {
-                        'key': key,
-                        'tts_speech': out_audio,
-                        'session_id': session_id
-                    }
-                    self.output_queue.put(output)
-            # if self.api_key is not None:
-            #     self.model.streaming_call(input_text)
-
-            #     for tts_audio in self.callback_instance.get_data_generator():
-            #         tts_speech = np.array(np.frombuffer(tts_audio, dtype=np.int16)).astype(np.float32)/32767
-            #         logger.info('audio response', tts_speech.shape)
-
-            #         output_audio = librosa.resample(tts_speech, orig_sr=self.sample_rate, target_sr=24000)
-            #         out_audio = output_audio[np.newaxis, ...]
-            #         yield out_audio
-            else:
-                response = None
-                if self.model:
-                    if self.ref_audio_buffer is not None:
-                        response = self.model.inference_zero_shot(
-                            input_text, self.ref_audio_text, self.ref_audio_buffer, True)
-                    elif self.spk_id:
-                        response = self.model.inference_sft(input_text, self.spk_id, True)
-                    else:
-                        logger.error('cosyvoice need a ref_audio or spk_id')
-                        return
-
-                for tts_speech in response:
-                    tts_audio = tts_speech['tts_speech'].numpy()
-                    logger.debug(f'tts sample rate {self.model.sample_rate}')
-                    tts_audio = tts_audio  # librosa.resample(tts_audio, orig_sr=self.model.sample_rate, target_sr=24000)
-                    # tts_audio = torchaudio.transforms.Resample(orig_freq=22050, new_freq=24000)(tts_audio)
-                    if self.dump_audio:
-                        dump_audio = tts_audio
-                        self.audio_dump_file.write(dump_audio.tobytes())
-                    output = {
-                        'key': key,
-                        'tts_speech': tts_audio,
-                        'session_id': session_id
-                    }
-                    self.output_queue.put(output)
-            output = {
-                'key': key,
-                'tts_speech': None,
-                'session_id': session_id
-            }
-            self.output_queue.put(output)
+            try:
+                self._synthesize(input_text, key, session_id)
+            except Exception as e:
+                logger.opt(exception=e).error(f'tts failed on {input_text}')
+            finally:
+                # completion is always reported, so the task frees its worker and its session moves on
+                self.audio_sender.send(key, session_id, None)
+
+    def _synthesize(self, input_text: str, key, session_id: str):
+        if (len(input_text) < 1):
+            # ignore
+            logger.info('ignore empty input_text')
+        elif self.model is None and self.api_url is not None:
+            # # if you start cosyvoice tts server through CosyVoice/runtime/python/fastapi/server.py
+            # response = requests.get(self.api_url, data={
+            #     'tts_text': input_text,
+            #     'spk_id': self.spk_id
+            # }, stream=True)
+            for out_audio in self.api_client.synthesize(input_text):
+                logger.debug(f'audio response resample {out_audio.shape}')
+                self.audio_sender.send(key, session_id, out_audio)
+        # if self.api_key is not None:
+        #     self.model.streaming_call(input_text)
+
+        #     for tts_audio in self.callback_instance.get_data_generator():
+        #         tts_speech = np.array(np.frombuffer(tts_audio, dtype=np.int16)).astype(np.float32)/32767
+        #         logger.info('audio response', tts_speech.shape)
+
+        #         output_audio = librosa.resample(tts_speech, orig_sr=self.sample_rate, target_sr=24000)
+        #         out_audio = output_audio[np.newaxis, ...]
+        #         yield out_audio
+        else:
+            response = None
+            if self.model:
+                if self.ref_audio_buffer is not None:
+                    response = self.model.inference_zero_shot(
+                        input_text, self.ref_audio_text, self.ref_audio_buffer, True)
+                elif self.spk_id:
+                    response = self.model.inference_sft(input_text, self.spk_id, True)
+                else:
+                    logger.error('cosyvoice need a ref_audio or spk_id')
+                    return
+
+            for tts_speech in response:
+                tts_audio = tts_speech['tts_speech'].numpy()
+                logger.debug(f'tts sample rate {self.model.sample_rate}')
+                tts_audio = tts_audio  # librosa.resample(tts_audio, orig_sr=self.model.sample_rate, target_sr=24000)
+                # tts_audio = torchaudio.transforms.Resample(orig_freq=22050, new_freq=24000)(tts_audio)
+                if self.dump_audio:
+                    dump_audio = tts_audio
+                    self.audio_dump_file.write(dump_audio.tobytes())
+                self.audio_sender.send(key, session_id, tts_audio)
@@ -0,0 +1,137 @@
+import time
+from multiprocessing import shared_memory
+from typing import List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+
+class SharedAudioRing:
+    """
+    Single producer, single consumer ring of float32 samples in shared memory. Header holds monotonic write and read
+    sample counters, producer only moves write counter and consumer only moves read counter.
+    """
+
+    header_size = 16
+
+    def __init__(self, capacity: int, name: Optional[str] = None):
+        self.capacity = capacity
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=self.header_size + capacity * 4)
+        else:
+            self.shm = self._attach(name)
+        self.name = self.shm.name
+        self.header = np.ndarray((2,), dtype=np.int64, buffer=self.shm.buf)
+        self.samples = np.ndarray((capacity,), dtype=np.float32, buffer=self.shm.buf, offset=self.header_size)
+        if self.owner:
+            self.header[:] = 0
+
+    @classmethod
+    def _attach(cls, name: str) -> shared_memory.SharedMemory:
+        try:
+            return shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # before python 3.13 attaching always registers to resource tracker, workers spawned by the owner share
+            # its tracker so the segment is still unlinked only once
+            return shared_memory.SharedMemory(name=name)
+
+    def write(self, audio: np.ndarray, timeout: float = 1.0) -> Optional[int]:
+        """
+        Copy audio into the ring and return its start counter, None if it does not fit within timeout.
+        """
+        length = audio.shape[0]
+        if length > self.capacity:
+            return None
+        write_pos = int(self.header[0])
+        deadline = time.monotonic() + timeout
+        while write_pos + length - int(self.header[1]) > self.capacity:
+            if time.monotonic() > deadline:
+                return None
+            time.sleep(0.001)
+        start = write_pos % self.capacity
+        first_num = min(length, self.capacity - start)
+        self.samples[start:start + first_num] = audio[:first_num]
+        self.samples[:length - first_num] = audio[first_num:]
+        self.header[0] = write_pos + length
+        return write_pos
+
+    def read(self, position: int, length: int) -> np.ndarray:
+        output = np.empty(length, dtype=np.float32)
+        start = position % self.capacity
+        first_num = min(length, self.capacity - start)
+        output[:first_num] = self.samples[start:start + first_num]
+        output[first_num:] = self.samples[:length - first_num]
+        # chunks are read in order, space of earlier chunks that were skipped is released too
+        self.header[1] = max(int(self.header[1]), position + length)
+        return output
+
+    def close(self):
+        self.header = None
+        self.samples = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class AudioChunkSender:
+    """
+    Worker side of the transport, audio goes to the ring and a small descriptor goes to the queue. Audio that does not
+    fit in the ring is sent inline with its descriptor.
+    """
+
+    def __init__(self, output_queue, ring_name: Optional[str] = None, ring_capacity: int = 0, ring_index: int = -1):
+        self.output_queue = output_queue
+        self.ring_index = ring_index
+        self.ring = SharedAudioRing(ring_capacity, ring_name) if ring_name is not None else None
+
+    def send(self, key, session_id: str, audio: Optional[np.ndarray]):
+        output = {
+            'key': key,
+            'tts_speech': None,
+            'session_id': session_id,
+            'send_time': time.monotonic(),
+        }
+        if audio is not None:
+            audio = np.ascontiguousarray(audio, dtype=np.float32)
+            position = None
+            if self.ring is not None:
+                position = self.ring.write(audio.reshape(-1))
+            if position is None:
+                output['tts_speech'] = audio
+            else:
+                output['ring'] = (self.ring_index, position, audio.shape)
+        self.output_queue.put(output)
+
+
+class AudioChunkReceiver:
+    """
+    Engine side of the transport, it owns one ring per worker.
+    """
+
+    def __init__(self, output_queue, ring_num: int, ring_capacity: int):
+        self.output_queue = output_queue
+        self.ring_capacity = ring_capacity
+        self.rings: List[SharedAudioRing] = [SharedAudioRing(ring_capacity) for _ in range(ring_num)] \
+            if ring_capacity > 0 else []
+
+    def create_sender_args(self, ring_index: int) -> Tuple[Optional[str], int, int]:
+        if len(self.rings) == 0:
+            return None, 0, -1
+        return self.rings[ring_index].name, self.ring_capacity, ring_index
+
+    def receive(self, timeout: Optional[float] = None) -> dict:
+        output = self.output_queue.get(timeout=timeout)
+        ring_info = output.pop('ring', None)
+        if ring_info is not None:
+            ring_index, position, shape = ring_info
+            output['tts_speech'] = self.rings[ring_index].read(position, int(np.prod(shape))).reshape(shape)
+        return output
+
+    def close(self):
+        for ring in self.rings:
+            try:
+                ring.close()
+            except Exception as e:
+                logger.warning(f"Failed to release shared audio ring {ring.name}: {e}")
+        self.rings = []
@@ -1,13 +1,10 @@
-from collections import deque
-from dataclasses import dataclass, field
-from torch.multiprocessing import Manager, Queue
+import atexit
 import os
 import queue
 import re
 import threading
 import time
 from typing import Dict, Optional, cast
-import uuid
 import numpy as np
 from loguru import logger
 from pydantic import BaseModel, Field
@@ -18,12 +15,19 @@ from chat_engine.data_models.chat_engine_config_data import ChatEngineConfigMode
 from chat_engine.common.handler_base import HandlerBase, HandlerBaseInfo, HandlerDataInfo, HandlerDetail
 from chat_engine.data_models.chat_data.chat_data_model import ChatData
 from chat_engine.data_models.chat_data_type import ChatDataType
+from chat_engine.data_models.chat_signal import ChatSignal
+from chat_engine.data_models.chat_signal_type import ChatSignalType
 from chat_engine.contexts.session_context import SessionContext
 from chat_engine.data_models.runtime_data.data_bundle import DataBundle, DataBundleDefinition, DataBundleEntry
-from handlers.tts.cosyvoice.cosyvoice_processor import TTSCosyVoiceProcessor
+from handlers.tts.cosyvoice.cosyvoice_processor import TTSCosyVoiceProcessor, spawn_context
+from handlers.tts.cosyvoice.shared_audio_ring import AudioChunkReceiver
+from handlers.tts.cosyvoice.tts_task_router import HandlerTask, TTSTaskRouter
+from handlers.tts.cosyvoice.tts_task_scheduler import ScheduledTask, TTSTaskScheduler
 import modelscope
 
 from engine_utils.directory_info import DirectoryInfo
+from engine_utils.sentence_segmenter import SentenceSegmenter, filter_text
+from engine_utils.tts_audio_cache import TTSAudioCache
 
 class TTSConfig(HandlerBaseConfigModel, BaseModel):
     model_name: str = Field(default=None)
@@ -34,14 +38,20 @@ class TTSConfig(HandlerBaseConfigModel, BaseModel):
     spk_id: str = Field(default=None)
     sample_rate: int = Field(default=24000)
     process_num: int = Field(default=1)
-
-
-@dataclass
-class HandlerTask:
-    id: uuid.UUID = field(default_factory=uuid.uuid4)
-    result_queue: queue.Queue = field(default_factory=queue.Queue)
-    speech_id: str = field(default=None)
-    speech_end: bool = field(default=False)
+    # tts segments shorter than this are merged with the following text, the first segment is never merged
+    segment_min_chars: int = Field(default=5)
+    # cut the first segment after this many characters without punctuation to start audio early, 0 to disable
+    first_segment_max_chars: int = Field(default=0)
+    # seconds of audio each worker can buffer in shared memory before the engine reads it, 0 sends audio by queue
+    audio_ring_seconds: float = Field(default=30)
+    # sentences of one session synthesized at the same time, workers are shared round robin between sessions
+    session_concurrency: int = Field(default=2)
+    # number of synthesized short phrases kept in memory, 0 to disable audio cache
+    audio_cache_size: int = Field(default=128)
+    # only texts up to this many characters are cached
+    audio_cache_max_chars: int = Field(default=20)
+    # directory to store cached audio across restarts, None to keep it in memory only
+    audio_cache_dir: str = Field(default=None)
 
 
 class TTSContext(HandlerContext):
@@ -49,11 +59,16 @@ class TTSContext(HandlerContext):
         super().__init__(session_id)
         self.config = None
         self.local_session_id = 0
-        self.input_text = ''
+        self.segmenter = SentenceSegmenter()
+        # speech of the last scheduled sentence, first sentence of a new speech is scheduled before other sessions
+        self.scheduled_speech_id = None
+        # speech cancelled by the human speaking again, its remaining text is not synthesized
+        self.cancelled_speech_id = None
         self.dump_audio = False
         self.audio_dump_file = None
 
-        self.task_queue: deque[HandlerTask]
+        # tasks of the session in order of delivery
+        self.task_queue: queue.Queue = queue.Queue()
         self.task_consumer_thread = None
 
 
@@ -70,12 +85,16 @@ class HandlerTTS(HandlerBase, ABC):
         self.model = None
         self.ref_audio_buffer = None
         self.sample_rate = None
-        self.mp = Manager()
-        self.tts_input_queue = self.mp.Queue()
-        self.tts_output_queue = self.mp.Queue()
+        # queues only carry tasks and audio descriptors, audio itself goes through shared memory rings
+        self.tts_input_queue = spawn_context.Queue()
+        self.tts_output_queue = spawn_context.Queue()
+        self.audio_receiver = None
         self.multi_process = []
         self.consume_thread = None
-        self.task_queue_map = {}
+        self.task_router = TTSTaskRouter()
+        self.task_scheduler = None
+        self.audio_cache = None
+        self.voice_id = None
         if torch.cuda.is_available():
             self.device = torch.device("cuda:0")
         elif torch.mps.is_available():
@@ -95,7 +114,12 @@ class HandlerTTS(HandlerBase, ABC):
         inputs = {
             ChatDataType.AVATAR_TEXT: HandlerDataInfo(
                 type=ChatDataType.AVATAR_TEXT,
-            )
+            ),
+            # only start of human speech is delivered, to stop the reply being spoken
+            ChatDataType.HUMAN_AUDIO: HandlerDataInfo(
+                type=ChatDataType.HUMAN_AUDIO,
+                meta_predicate=lambda meta: meta.get("human_speech_start", False),
+            ),
         }
         outputs = {
             ChatDataType.AVATAR_AUDIO: HandlerDataInfo(
@@ -114,34 +138,39 @@ class HandlerTTS(HandlerBase, ABC):
                     modelscope.snapshot_download(handler_config.model_name)
 
             self.sample_rate = handler_config.sample_rate      
+            ring_capacity = int(handler_config.audio_ring_seconds * handler_config.sample_rate)
+            self.audio_receiver = AudioChunkReceiver(self.tts_output_queue, handler_config.process_num,
+                                                     ring_capacity)
+            atexit.register(self.audio_receiver.close)
             for i in range(handler_config.process_num):
                 process = TTSCosyVoiceProcessor(self.handler_root, handler_config,
-                                                self.tts_input_queue, self.tts_output_queue)
+                                                self.tts_input_queue, self.tts_output_queue,
+                                                self.audio_receiver.create_sender_args(i))
                 process.start()
                 self.multi_process.append(process)
-            self.tts_output_queue.get()
+            self.audio_receiver.receive()
+            self.task_scheduler = TTSTaskScheduler(self.tts_input_queue.put, handler_config.process_num,
+                                                   handler_config.session_concurrency)
+            if handler_config.audio_cache_size > 0:
+                self.audio_cache = TTSAudioCache(handler_config.audio_cache_size,
+                                                 handler_config.audio_cache_max_chars,
+                                                 handler_config.audio_cache_dir)
+                self.voice_id = "|".join([str(handler_config.model_name or handler_config.api_url),
+                                          str(handler_config.spk_id), str(handler_config.ref_audio_text),
+                                          TTSAudioCache.hash_file(handler_config.ref_audio_path)])
 
-        def consumer(task_queue_map: dict[str, deque], tts_output_queue: Queue):
+        def consumer(task_router: TTSTaskRouter, task_scheduler: TTSTaskScheduler,
+                     audio_receiver: AudioChunkReceiver):
             while True:
-                logger.debug(f"tts output {len(task_queue_map.keys()), tts_output_queue.qsize()}")
-                output = None
-                try:
-                    output = tts_output_queue.get(timeout=1)
-                except Exception as e:
-                    logger.debug(e)
-                    continue
-                logger.debug(f'output {output}')
-                key = output['key']
-                audio = output['tts_speech']
-                session_id = output['session_id']
-                taskDeque = task_queue_map.get(session_id)
-                if taskDeque is None:
-                    continue
-                for task in taskDeque:
-                    if task is not None and task.id == key:
-                        task.result_queue.put(audio)
-                        break
-        self.consume_thread = threading.Thread(target=consumer, args=[self.task_queue_map, self.tts_output_queue])
+                output = audio_receiver.receive()
+                logger.debug(f"output {output['key']}")
+                # audio of cancelled or unknown tasks is dropped
+                task_router.route(output['key'], output['tts_speech'])
+                if output['tts_speech'] is None:
+                    task_scheduler.finish(output['key'])
+        self.consume_thread = threading.Thread(target=consumer,
+                                               args=[self.task_router, self.task_scheduler, self.audio_receiver],
+                                               daemon=True)
         self.consume_thread.start()
         
     @staticmethod
@@ -155,8 +184,8 @@ class HandlerTTS(HandlerBase, ABC):
         if not isinstance(handler_config, TTSConfig):
             handler_config = TTSConfig()
         context = TTSContext(session_context.session_info.session_id)
-        context.input_text = ''
-        context.task_queue = deque()
+        context.segmenter = SentenceSegmenter(min_chars=handler_config.segment_min_chars,
+                                              first_max_chars=handler_config.first_segment_max_chars)
         if context.dump_audio:
             dump_file_path = os.path.join(DirectoryInfo.get_project_dir(), 'temp',
                                             f"dump_avatar_audio_{context.session_id}_{time.localtime().tm_hour}_{time.localtime().tm_min}.pcm")
@@ -167,40 +196,35 @@ class HandlerTTS(HandlerBase, ABC):
         context = cast(TTSContext, context)
         output_definition = self.get_handler_detail(session_context, context).outputs.get(ChatDataType.AVATAR_AUDIO).definition
 
-        def task_consumer(task_inner_queue: deque, callback: callable):
+        def task_consumer(task_inner_queue: queue.Queue, callback: callable):
+            # tasks are delivered in order, consumer sleeps until the head task has audio
             while True:
-                if len(task_inner_queue) == 0:
-                    time.sleep(0.03)
-                    continue
-                task = task_inner_queue[0]
-                task = cast(HandlerTask, task)
+                task = task_inner_queue.get()
                 if task is None:
                     break
-                logger.debug(f'get task audio {len(task_inner_queue), task.result_queue.qsize()}')
-                try:
-                    audio = task.result_queue.get(timeout=1)
-                    if audio is not None:
-                        output = DataBundle(output_definition)
-                        output.set_main_data(audio)
-                        output.add_meta("avatar_speech_end", False if not task.speech_end else True)
-                        output.add_meta("speech_id", task.speech_id)
-                        callback(output)
-                        if context.dump_audio:
-                            dump_audio = audio
-                            context.audio_dump_file.write(dump_audio.tobytes())
-                    else:
-                        task_inner_queue.popleft()
-                except Exception as e:
-                    logger.debug(e)
+                task = cast(HandlerTask, task)
+                cache_audios = []
+                while True:
+                    audio = task.result_queue.get()
+                    if audio is None:
+                        break
+                    if task.cancelled:
+                        continue
+                    if task.cache_key is not None:
+                        cache_audios.append(audio)
+                    output = DataBundle(output_definition)
+                    output.set_main_data(audio)
+                    output.add_meta("avatar_speech_end", False if not task.speech_end else True)
+                    output.add_meta("speech_id", task.speech_id)
+                    callback(output)
+                    if context.dump_audio:
+                        dump_audio = audio
+                        context.audio_dump_file.write(dump_audio.tobytes())
+                if len(cache_audios) > 0 and not task.cancelled:
+                    self.audio_cache.put(task.cache_key, np.concatenate(cache_audios, axis=-1))
   
         context.task_consume_thread = threading.Thread(target=task_consumer, args=[context.task_queue, context.submit_data])
         context.task_consume_thread.start()
-        self.task_queue_map[context.session_id] = context.task_queue
-
-    def filter_text(self, text):
-        pattern = r"[^a-zA-Z0-9\u4e00-\u9fff,.\~!?，。！？ ]"  # 匹配不在范围内的字符
-        filtered_text = re.sub(pattern, "", text)
-        return filtered_text
 
     def handle(self, context: HandlerContext, inputs: ChatData,
                output_definitions: Dict[ChatDataType, HandlerDataInfo]):
@@ -208,58 +232,96 @@ class HandlerTTS(HandlerBase, ABC):
         context = cast(TTSContext, context)
         if inputs.type == ChatDataType.AVATAR_TEXT:
             text = inputs.data.get_main_data()
+        elif inputs.type == ChatDataType.HUMAN_AUDIO:
+            if inputs.data.get_meta("human_speech_start", False):
+                logger.info("human speech started")
+                self._interrupt(context)
+            return
         else:
             return
         speech_id = inputs.data.get_meta("speech_id")
         if (speech_id is None):
             speech_id = context.session_id
+        if speech_id == context.cancelled_speech_id:
+            # end of the cancelled speech is still delivered, so the avatar goes back to listening
+            text = ''
+            context.segmenter.reset()
 
-        if text is not None:
-            text = re.sub(r"<\|.*?\|>", "", text)
-            context.input_text += self.filter_text(text)
+        text = filter_text(re.sub(r"<\|.*?\|>", "", text)) if text is not None else ''
 
         text_end = inputs.data.get_meta("avatar_text_end", False)
         if not text_end:
-            sentences = re.split(r'(?<=[,.~!?，。！？])', context.input_text)
-            if len(sentences) > 1:  # 至少有一个完整句子
-                complete_sentences = sentences[:-1]  # 完整句子
-                context.input_text = sentences[-1]  # 剩余的未完成部分
-
-                # 对完整句子进行处理
-                for sentence in complete_sentences:
-                    if len(sentence.strip()) < 1:
-                        continue
-                    logger.info('current sentence' + sentence)
-                    task = HandlerTask(speech_id=speech_id)
-                    tts_info = {
-                        "text": sentence + '。',
-                        "key": task.id,
-                        "session_id": context.session_id
-                    
-                    }
-                    self.tts_input_queue.put(tts_info)
-                    context.task_queue.append(task)
+            # 对完整句子进行处理
+            for sentence in context.segmenter.push(text):
+                logger.info('current sentence' + sentence)
+                self._submit_sentence(context, speech_id, sentence + '。')
         else:
-            logger.info('last sentence' + context.input_text)
-            if context.input_text is not None and len(context.input_text.strip()) > 0:
-                task = HandlerTask(speech_id=speech_id)
-                tts_info = {
-                    "text": context.input_text,
-                    "key": task.id,
-                    "session_id": context.session_id
-                }
-                self.tts_input_queue.put(tts_info)
-                context.task_queue.append(task)
-            context.input_text = ''
+            last_text = context.segmenter.flush(text)
+            logger.info(f'last sentence {last_text}')
+            if last_text is not None:
+                self._submit_sentence(context, speech_id, last_text)
             end_task = HandlerTask(speech_id=speech_id, speech_end=True)
             end_task.result_queue.put(np.zeros(shape=(1, self.sample_rate), dtype=np.float32))
             end_task.result_queue.put(None)
             logger.info(f"speech end {end_task}")
-            context.task_queue.append(end_task)
+            context.task_queue.put(end_task)
+
+    def _submit_sentence(self, context: TTSContext, speech_id: str, text: str):
+        task = HandlerTask(speech_id=speech_id, session_id=context.session_id)
+        if self.audio_cache is not None:
+            task.cache_key = self.audio_cache.make_key("cosyvoice", self.voice_id, text, self.sample_rate)
+            cached_audio = self.audio_cache.get(task.cache_key)
+            if cached_audio is not None:
+                # cached phrase is delivered in order without touching workers
+                logger.info(f'tts audio cache hit {text}')
+                task.cache_key = None
+                task.result_queue.put(cached_audio)
+                task.result_queue.put(None)
+                context.scheduled_speech_id = speech_id
+                context.task_queue.put(task)
+                return
+        tts_info = {
+            "text": text,
+            "key": task.id,
+            "session_id": context.session_id
+        }
+        first = speech_id != context.scheduled_speech_id
+        context.scheduled_speech_id = speech_id
+        self.task_router.register(task)
+        context.task_queue.put(task)
+        self.task_scheduler.submit(ScheduledTask(key=task.id, session_id=context.session_id, speech_id=speech_id,
+                                                 tts_info=tts_info, first=first))
 
     def destroy_context(self, context: HandlerContext):
         context = cast(TTSContext, context)
         logger.info('destroy context')
-        del self.task_queue_map[context.session_id]
-        context.task_queue.clear()
-        context.task_queue.append(None)
+        self.cancel_speech(context)
+        while not context.task_queue.empty():
+            try:
+                context.task_queue.get_nowait()
+            except queue.Empty:
+                break
+        context.task_queue.put(None)
+
+    def on_signal(self, context: HandlerContext, signal: ChatSignal):
+        if signal.type == ChatSignalType.INTERRUPT:
+            logger.info(f"interrupted by {signal.source_type}")
+            self._interrupt(cast(TTSContext, context))
+
+    def _interrupt(self, context: TTSContext):
+        # reply being spoken is cancelled, its remaining text is not synthesized
+        if context.scheduled_speech_id is None:
+            return
+        context.cancelled_speech_id = context.scheduled_speech_id
+        self.cancel_speech(context)
+
+    def cancel_speech(self, context: HandlerContext, speech_id: Optional[str] = None):
+        """
+        Cancel pending sentences of the session, or only those of speech_id. Their remaining audio is not delivered.
+        """
+        context = cast(TTSContext, context)
+        # queued sentences never reach a worker, those being synthesized are dropped by the router
+        self.task_scheduler.cancel(context.session_id, speech_id)
+        cancelled_tasks = self.task_router.cancel_session(context.session_id, speech_id)
+        if len(cancelled_tasks) > 0:
+            logger.info(f"cancelled {len(cancelled_tasks)} tts tasks of {speech_id or context.session_id}")
@@ -0,0 +1,88 @@
+import queue
+import threading
+import uuid
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+@dataclass
+class HandlerTask:
+    id: uuid.UUID = field(default_factory=uuid.uuid4)
+    result_queue: queue.Queue = field(default_factory=queue.Queue)
+    speech_id: str = field(default=None)
+    speech_end: bool = field(default=False)
+    session_id: str = field(default=None)
+    done: threading.Event = field(default_factory=threading.Event)
+    cancelled: bool = field(default=False)
+    # audio of the task is added to tts audio cache under this key once it completes
+    cache_key: str = field(default=None)
+
+
+class TTSTaskRouter:
+    """
+    Route audio produced by tts workers to the task it belongs to by task id. A task is unregistered when its
+    completion marker arrives or it is cancelled, audio of unknown tasks is dropped.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tasks: Dict[uuid.UUID, HandlerTask] = {}
+
+    def register(self, task: HandlerTask):
+        with self.lock:
+            self.tasks[task.id] = task
+
+    def route(self, key: uuid.UUID, audio: Optional[np.ndarray]) -> bool:
+        """
+        Deliver audio to its task, None marks completion of the task. Returns whether the task is known.
+        """
+        if audio is None:
+            return self.complete(key)
+        with self.lock:
+            task = self.tasks.get(key)
+        if task is None:
+            return False
+        task.result_queue.put(audio)
+        return True
+
+    def complete(self, key: uuid.UUID) -> bool:
+        with self.lock:
+            task = self.tasks.pop(key, None)
+        if task is None:
+            return False
+        task.result_queue.put(None)
+        task.done.set()
+        return True
+
+    def cancel(self, key: uuid.UUID) -> bool:
+        with self.lock:
+            task = self.tasks.pop(key, None)
+        if task is None:
+            return False
+        self._mark_cancelled(task)
+        return True
+
+    def cancel_session(self, session_id: str, speech_id: Optional[str] = None) -> List[HandlerTask]:
+        """
+        Cancel tasks of a session, or only those of a speech when speech_id is given.
+        """
+        with self.lock:
+            tasks = [task for task in self.tasks.values()
+                     if task.session_id == session_id and (speech_id is None or task.speech_id == speech_id)]
+            for task in tasks:
+                del self.tasks[task.id]
+        for task in tasks:
+            self._mark_cancelled(task)
+        return tasks
+
+    @classmethod
+    def _mark_cancelled(cls, task: HandlerTask):
+        task.cancelled = True
+        # wake up consumer waiting on the task, audio already queued is skipped
+        task.result_queue.put(None)
+        task.done.set()
+
+    def __len__(self):
+        return len(self.tasks)
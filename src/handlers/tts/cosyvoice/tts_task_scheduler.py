@@ -0,0 +1,100 @@
+import threading
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Deque, Dict, List, Optional
+
+
+@dataclass
+class ScheduledTask:
+    key: uuid.UUID
+    session_id: str
+    speech_id: str
+    tts_info: dict
+    first: bool = False
+
+
+class TTSTaskScheduler:
+    """
+    Hand tts tasks to worker processes only when a worker is free. Sessions are served round robin and a session whose
+    next sentence is the first of a speech goes before the others. Sentences of one session keep their order since
+    they are played in order anyway, and at most session_concurrency of them are synthesized at the same time.
+    """
+
+    def __init__(self, dispatch: Callable[[dict], None], worker_num: int, session_concurrency: int = 1):
+        self.dispatch = dispatch
+        self.worker_num = worker_num
+        self.session_concurrency = max(1, session_concurrency)
+        self.lock = threading.Lock()
+        self.pending: Dict[str, Deque[ScheduledTask]] = {}
+        self.running: Dict[uuid.UUID, str] = {}
+        self.session_running: Dict[str, int] = {}
+        # round robin order, sessions served least recently go first
+        self.served_num = 0
+        self.last_served: Dict[str, int] = {}
+
+    def submit(self, task: ScheduledTask):
+        with self.lock:
+            self.pending.setdefault(task.session_id, deque()).append(task)
+            self._schedule()
+
+    def finish(self, key: uuid.UUID) -> bool:
+        """
+        Called when a worker reports completion of a task, its worker is given the next task.
+        """
+        with self.lock:
+            session_id = self.running.pop(key, None)
+            if session_id is None:
+                return False
+            self.session_running[session_id] -= 1
+            if self.session_running[session_id] == 0:
+                del self.session_running[session_id]
+                if session_id not in self.pending:
+                    self.last_served.pop(session_id, None)
+            self._schedule()
+            return True
+
+    def cancel(self, session_id: str, speech_id: Optional[str] = None) -> List[ScheduledTask]:
+        """
+        Drop queued tasks of a session, or only those of a speech. Tasks already on a worker run to completion.
+        """
+        with self.lock:
+            tasks = self.pending.get(session_id)
+            if tasks is None:
+                return []
+            cancelled = [task for task in tasks if speech_id is None or task.speech_id == speech_id]
+            remaining = deque(task for task in tasks if speech_id is not None and task.speech_id != speech_id)
+            if len(remaining) > 0:
+                self.pending[session_id] = remaining
+            else:
+                del self.pending[session_id]
+            self._schedule()
+            return cancelled
+
+    def _select(self) -> Optional[ScheduledTask]:
+        candidates = [session_id for session_id in self.pending
+                      if self.session_running.get(session_id, 0) < self.session_concurrency]
+        if len(candidates) == 0:
+            return None
+        selected = min(candidates, key=lambda session_id: (not self.pending[session_id][0].first,
+                                                           self.last_served.get(session_id, 0)))
+        tasks = self.pending[selected]
+        task = tasks.popleft()
+        if len(tasks) == 0:
+            del self.pending[selected]
+        self.served_num += 1
+        self.last_served[selected] = self.served_num
+        return task
+
+    def _schedule(self):
+        while len(self.running) < self.worker_num:
+            task = self._select()
+            if task is None:
+                break
+            self.running[task.key] = task.session_id
+            self.session_running[task.session_id] = self.session_running.get(task.session_id, 0) + 1
+            self.dispatch(task.tts_info)
+
+    @property
+    def pending_num(self) -> int:
+        return sum(len(tasks) for tasks in self.pending.values())
@@ -0,0 +1,172 @@
+import asyncio
+import queue
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Callable, Optional
+
+import av
+import numpy as np
+from loguru import logger
+
+from engine_utils.tts_audio_cache import TTSAudioCache
+
+
+class Mp3StreamDecoder:
+    """
+    Decode an mp3 stream while it arrives. Bytes are split into frames by the codec parser and every frame is decoded
+    once, so each push costs only the frames it completes. Encoder delay and padding announced in a LAME header are
+    trimmed, the same way whole file decoding does.
+    """
+
+    # samples the mp3 decoder itself lags behind the encoder delay
+    DECODER_DELAY = 529
+
+    def __init__(self):
+        self.codec = None
+        self.sample_rate = None
+        self._reset()
+
+    def _reset(self):
+        self.codec = av.CodecContext.create("mp3float", "r")
+        self.header_checked = False
+        self.skip_samples = 0
+        # samples held back from the output, they are the padding if the stream ends there
+        self.end_padding = 0
+        self.tail = np.zeros(0, dtype=np.float32)
+
+    def push(self, data: bytes) -> np.ndarray:
+        return self._decode(self.codec.parse(data))
+
+    def flush(self) -> np.ndarray:
+        output = self._decode(self.codec.parse(None) + [None])
+        self._reset()
+        return output
+
+    def _decode(self, packets) -> np.ndarray:
+        audios = [self.tail]
+        for packet in packets:
+            if packet is not None and not self.header_checked:
+                self.header_checked = True
+                if self._read_lame_header(bytes(packet)):
+                    # the header frame decodes to silence only
+                    continue
+            for frame in self.codec.decode(packet):
+                self.sample_rate = frame.sample_rate
+                audio = frame.to_ndarray()
+                audios.append(audio.mean(axis=0) if audio.shape[0] > 1 else audio[0])
+        audio = np.concatenate(audios) if len(audios) > 1 else self.tail
+        if self.skip_samples > 0:
+            skip = min(self.skip_samples, audio.shape[0])
+            self.skip_samples -= skip
+            audio = audio[skip:]
+        end = max(0, audio.shape[0] - self.end_padding)
+        self.tail = audio[end:]
+        return audio[:end]
+
+    def _read_lame_header(self, packet: bytes) -> bool:
+        """
+        Take encoder delay and padding from a Xing/Info frame, return whether the packet is one.
+        """
+        if packet.find(b"Xing", 0, 64) < 0 and packet.find(b"Info", 0, 64) < 0:
+            return False
+        lame = packet.find(b"LAME")
+        if lame >= 0 and len(packet) >= lame + 24:
+            delay_padding = packet[lame + 21:lame + 24]
+            delay = (delay_padding[0] << 4) | (delay_padding[1] >> 4)
+            padding = ((delay_padding[1] & 0x0f) << 8) | delay_padding[2]
+            self.skip_samples = delay + self.DECODER_DELAY
+            self.end_padding = max(0, padding - self.DECODER_DELAY)
+        return True
+
+
+@dataclass
+class SentenceJob:
+    speech_id: str
+    text: str = field(default="")
+    speech_end: bool = field(default=False)
+    # decoded audio chunks of shape (1, n), None marks the end of the sentence
+    result_queue: queue.Queue = field(default_factory=queue.Queue)
+    future: Optional[object] = field(default=None)
+    cancelled: bool = field(default=False)
+
+
+class EdgeTTSPipeline:
+    """
+    Synthesize sentences on an event loop. A sentence starts as soon as it is submitted, so later sentences are
+    synthesized while earlier ones still stream, and its mp3 is decoded chunk by chunk into the job's result queue.
+    Jobs are delivered in submission order by the session consumer. At most max_concurrency sentences of a session
+    are synthesized at the same time.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop,
+                 create_stream: Callable[[str], AsyncIterator[bytes]],
+                 max_concurrency: int = 2, min_chunk_samples: int = 0,
+                 audio_cache: Optional[TTSAudioCache] = None, cache_voice: str = "", sample_rate: int = 24000):
+        self.loop = loop
+        self.create_stream = create_stream
+        self.max_concurrency = max(1, max_concurrency)
+        # decoded audio is handed over in chunks of at least this many samples, except the first one
+        self.min_chunk_samples = min_chunk_samples
+        self.audio_cache = audio_cache
+        self.cache_voice = cache_voice
+        self.sample_rate = sample_rate
+
+    def create_limiter(self) -> asyncio.Semaphore:
+        return asyncio.Semaphore(self.max_concurrency)
+
+    def submit(self, job: SentenceJob, limiter: asyncio.Semaphore):
+        job.future = asyncio.run_coroutine_threadsafe(self._synthesize(job, limiter), self.loop)
+
+    def cancel(self, job: SentenceJob):
+        job.cancelled = True
+        if job.future is not None:
+            job.future.cancel()
+        job.result_queue.put(None)
+
+    async def _synthesize(self, job: SentenceJob, limiter: asyncio.Semaphore):
+        cache_key = None
+        if self.audio_cache is not None:
+            cache_key = self.audio_cache.make_key("edgetts", self.cache_voice, job.text, self.sample_rate)
+            cached_audio = self.audio_cache.get(cache_key)
+            if cached_audio is not None:
+                logger.info(f'tts audio cache hit {job.text}')
+                job.result_queue.put(cached_audio)
+                job.result_queue.put(None)
+                return
+        decoder = Mp3StreamDecoder()
+        cache_audios = [] if cache_key is not None else None
+        pending = []
+        pending_num = 0
+        first = True
+        try:
+            async with limiter:
+                async for data in self.create_stream(job.text):
+                    audio = decoder.push(data)
+                    if audio.shape[0] == 0:
+                        continue
+                    pending.append(audio)
+                    pending_num += audio.shape[0]
+                    if first or pending_num >= self.min_chunk_samples:
+                        self._put(job, pending, cache_audios)
+                        pending = []
+                        pending_num = 0
+                        first = False
+            pending.append(decoder.flush())
+            self._put(job, pending, cache_audios)
+            if cache_audios:
+                self.audio_cache.put(cache_key, np.concatenate(cache_audios, axis=-1))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f'edge tts failed on {job.text}: {e}')
+        finally:
+            job.result_queue.put(None)
+
+    @classmethod
+    def _put(cls, job: SentenceJob, audios, cache_audios):
+        audio = np.concatenate(audios) if len(audios) > 1 else audios[0]
+        if audio.shape[0] == 0:
+            return
+        audio = audio[np.newaxis, ...]
+        job.result_queue.put(audio)
+        if cache_audios is not None:
+            cache_audios.append(audio)
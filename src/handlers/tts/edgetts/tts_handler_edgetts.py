@@ -1,10 +1,10 @@
-import io
 import edge_tts
 import os
+import queue
 import re
+import threading
 import time
 from typing import Dict, Optional, cast
-import librosa
 import numpy as np
 from loguru import logger
 from pydantic import BaseModel, Field
@@ -15,14 +15,32 @@ from chat_engine.common.handler_base import HandlerBase, HandlerBaseInfo, Handle
 from chat_engine.data_models.chat_data.chat_data_model import ChatData
 from chat_engine.data_models.chat_data_type import ChatDataType
 from chat_engine.contexts.session_context import SessionContext
+from chat_engine.core.session_event_loop import SessionEventLoop
 from chat_engine.data_models.runtime_data.data_bundle import DataBundle, DataBundleDefinition, DataBundleEntry
 from engine_utils.directory_info import DirectoryInfo
+from engine_utils.sentence_segmenter import SentenceSegmenter, filter_text
+from engine_utils.tts_audio_cache import TTSAudioCache
+from handlers.tts.edgetts.edge_tts_pipeline import EdgeTTSPipeline, SentenceJob
 
 class TTSConfig(HandlerBaseConfigModel, BaseModel):
     ref_audio_path: str = Field(default=None)
     ref_audio_text: str = Field(default=None)
     voice: str = Field(default=None)
     sample_rate: int = Field(default=24000)
+    # tts segments shorter than this are merged with the following text, the first segment is never merged
+    segment_min_chars: int = Field(default=5)
+    # cut the first segment after this many characters without punctuation to start audio early, 0 to disable
+    first_segment_max_chars: int = Field(default=0)
+    # number of synthesized short phrases kept in memory, 0 to disable audio cache
+    audio_cache_size: int = Field(default=128)
+    # only texts up to this many characters are cached
+    audio_cache_max_chars: int = Field(default=20)
+    # directory to store cached audio across restarts, None to keep it in memory only
+    audio_cache_dir: str = Field(default=None)
+    # sentences of one session synthesized at the same time, later ones are synthesized while earlier ones stream
+    pipeline_concurrency: int = Field(default=2)
+    # decoded audio is delivered in chunks of at least this length, except the first chunk of each sentence
+    stream_chunk_seconds: float = Field(default=0.2)
 
 
 class TTSContext(HandlerContext):
@@ -30,10 +48,16 @@ class TTSContext(HandlerContext):
         super().__init__(session_id)
         self.config = None
         self.local_session_id = 0
-        self.input_text = ''
+        self.segmenter = SentenceSegmenter()
         self.dump_audio = False
         self.audio_dump_file = None
 
+        # sentence jobs of the session in order of delivery
+        self.job_queue: queue.Queue = queue.Queue()
+        self.current_job: Optional[SentenceJob] = None
+        self.job_limiter = None
+        self.job_consumer_thread = None
+
 
 class HandlerTTS(HandlerBase, ABC):
     def __init__(self):
@@ -44,6 +68,9 @@ class HandlerTTS(HandlerBase, ABC):
         self.voice = None
         self.ref_audio_buffer = None
         self.sample_rate = None
+        self.audio_cache = None
+        self.event_loop: Optional[SessionEventLoop] = None
+        self.pipeline: Optional[EdgeTTSPipeline] = None
       
 
     def get_handler_info(self) -> HandlerBaseInfo:
@@ -71,36 +98,74 @@ class HandlerTTS(HandlerBase, ABC):
         )
 
     def load(self, engine_config: ChatEngineConfigModel, handler_config: Optional[BaseModel] = None):
-       config = cast(TTSConfig, handler_config)
-       self.voice = config.voice
-       self.sample_rate = config.sample_rate
-       self.ref_audio_path = config.ref_audio_path
-       self.ref_audio_text = config.ref_audio_text
+        config = cast(TTSConfig, handler_config)
+        self.voice = config.voice
+        self.sample_rate = config.sample_rate
+        self.ref_audio_path = config.ref_audio_path
+        self.ref_audio_text = config.ref_audio_text
+        if config.audio_cache_size > 0:
+            self.audio_cache = TTSAudioCache(config.audio_cache_size, config.audio_cache_max_chars,
+                                             config.audio_cache_dir)
+        self.event_loop = SessionEventLoop(max_workers=1)
+        self.event_loop.start()
+        self.pipeline = EdgeTTSPipeline(self.event_loop.loop, self._create_stream, config.pipeline_concurrency,
+                                        int(config.stream_chunk_seconds * config.sample_rate),
+                                        self.audio_cache, self.voice, self.sample_rate)
+
+    async def _create_stream(self, text: str):
+        communicate = edge_tts.Communicate(text, self.voice)
+        async for chunk in communicate.stream():
+            if chunk['type'] == 'audio':
+                yield chunk['data']
 
 
     def create_context(self, session_context, handler_config=None):
         if not isinstance(handler_config, TTSConfig):
             handler_config = TTSConfig()
         context = TTSContext(session_context.session_info.session_id)
-        context.input_text = ''
+        context.segmenter = SentenceSegmenter(min_chars=handler_config.segment_min_chars,
+                                              first_max_chars=handler_config.first_segment_max_chars)
         if context.dump_audio:
             dump_file_path = os.path.join(DirectoryInfo.get_project_dir(), 'temp',
                                             f"dump_avatar_audio_{context.session_id}_{time.localtime().tm_hour}_{time.localtime().tm_min}.pcm")
             context.audio_dump_file = open(dump_file_path, "wb")
+        context.job_limiter = self.pipeline.create_limiter()
         return context
     
     def start_context(self, session_context, context: HandlerContext):
         context = cast(TTSContext, context)
         edge_tts.Communicate(text="测试音频启动", voice=self.voice)
-
-    def filter_text(self, text):
-        pattern = r"[^a-zA-Z0-9\u4e00-\u9fff,.\~!?，。！？ ]"  # 匹配不在范围内的字符
-        filtered_text = re.sub(pattern, "", text)
-        return filtered_text
+        output_definition = self.get_handler_detail(session_context,
+                                                    context).outputs.get(ChatDataType.AVATAR_AUDIO).definition
+
+        def job_consumer(job_queue: queue.Queue, callback: callable):
+            # sentences are synthesized concurrently but delivered in order
+            while True:
+                job = job_queue.get()
+                if job is None:
+                    break
+                context.current_job = job
+                while True:
+                    audio = job.result_queue.get()
+                    if audio is None:
+                        break
+                    if job.cancelled:
+                        continue
+                    output = DataBundle(output_definition)
+                    output.set_main_data(audio)
+                    output.add_meta("avatar_speech_end", job.speech_end)
+                    output.add_meta("speech_id", job.speech_id)
+                    callback(output)
+                    if context.dump_audio:
+                        context.audio_dump_file.write(audio.tobytes())
+                context.current_job = None
+
+        context.job_consumer_thread = threading.Thread(target=job_consumer,
+                                                       args=[context.job_queue, context.submit_data])
+        context.job_consumer_thread.start()
 
     def handle(self, context: HandlerContext, inputs: ChatData,
                output_definitions: Dict[ChatDataType, HandlerDataInfo]):
-        output_definition = output_definitions.get(ChatDataType.AVATAR_AUDIO).definition
         context = cast(TTSContext, context)
         if inputs.type == ChatDataType.AVATAR_TEXT:
             text = inputs.data.get_main_data()
@@ -110,64 +175,41 @@ class HandlerTTS(HandlerBase, ABC):
         if (speech_id is None):
             speech_id = context.session_id
 
-        if text is not None:
-            text = re.sub(r"<\|.*?\|>", "", text)
-            context.input_text += self.filter_text(text)
+        text = filter_text(re.sub(r"<\|.*?\|>", "", text)) if text is not None else ''
 
         text_end = inputs.data.get_meta("avatar_text_end", False)
         if not text_end:
-            sentences = re.split(r'(?<=[,.~!?，。！？])', context.input_text)
-            if len(sentences) > 1:  # 至少有一个完整句子
-                complete_sentences = sentences[:-1]  # 完整句子
-                context.input_text = sentences[-1]  # 剩余的未完成部分
-
-                # 对完整句子进行处理
-                for sentence in complete_sentences:
-                    if len(sentence.strip()) < 1:
-                        continue
-                    logger.info('current sentence' + sentence)
-                    
-                    communicate = edge_tts.Communicate(sentence, self.voice)
-                    data = b''
-
-                    for chunk in communicate.stream_sync():
-                        if chunk['type'] == 'audio':
-                            # tts_audio = chunk['data']
-                            data += chunk['data']
-                    
-                    output_audio = librosa.load(io.BytesIO(data), sr=None)[0]
-                    output_audio = output_audio[np.newaxis, ...]
-                    output = DataBundle(output_definition)
-                    output.set_main_data(output_audio)
-                    output.add_meta("avatar_speech_end", False)
-                    output.add_meta("speech_id", speech_id)
-                    context.submit_data(output)
+            # 对完整句子进行处理
+            for sentence in context.segmenter.push(text):
+                logger.info('current sentence' + sentence)
+                self._submit_sentence(context, speech_id, sentence)
         else:
-            logger.info('last sentence' + context.input_text)
-            if context.input_text is not None and len(context.input_text.strip()) > 0:
-                    communicate = edge_tts.Communicate(context.input_text, self.voice)
-                    data = b''
-
-                    for chunk in communicate.stream_sync():
-                        if chunk['type'] == 'audio':
-                            # tts_audio = chunk['data']
-                            data += chunk['data']
-                    output_audio = librosa.load(io.BytesIO(data), sr=None)[0]
-                    output_audio = output_audio[np.newaxis, ...]
-                    output = DataBundle(output_definition)
-                    output.set_main_data(output_audio)
-                    output.add_meta("avatar_speech_end", False)
-                    output.add_meta("speech_id", speech_id)
-                    context.submit_data(output)
-            context.input_text = ''
-            output = DataBundle(output_definition)
-            output.set_main_data(np.zeros(shape=(1, self.sample_rate), dtype=np.float32))
-            output.add_meta("avatar_speech_end", True)
-            output.add_meta("speech_id", speech_id)
-            context.submit_data(output)
+            last_text = context.segmenter.flush(text)
+            logger.info(f'last sentence {last_text}')
+            if last_text is not None:
+                self._submit_sentence(context, speech_id, last_text)
+            end_job = SentenceJob(speech_id=speech_id, speech_end=True)
+            end_job.result_queue.put(np.zeros(shape=(1, self.sample_rate), dtype=np.float32))
+            end_job.result_queue.put(None)
+            context.job_queue.put(end_job)
             logger.info(f"speech end")
 
+    def _submit_sentence(self, context: TTSContext, speech_id: str, text: str):
+        job = SentenceJob(speech_id=speech_id, text=text)
+        context.job_queue.put(job)
+        self.pipeline.submit(job, context.job_limiter)
+
     def destroy_context(self, context: HandlerContext):
         context = cast(TTSContext, context)
         logger.info('destroy context')
+        jobs = [context.current_job]
+        while not context.job_queue.empty():
+            try:
+                jobs.append(context.job_queue.get_nowait())
+            except queue.Empty:
+                break
+        for job in jobs:
+            if job is not None:
+                self.pipeline.cancel(job)
+        context.job_queue.put(None)
 
@@ -0,0 +1,105 @@
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+
+@dataclass
+class VADInferenceRequest:
+    clip: np.ndarray
+    state: np.ndarray
+    done: threading.Event = field(default_factory=threading.Event)
+    prob: float = 0.0
+    result_state: Optional[np.ndarray] = None
+    error: Optional[Exception] = None
+
+
+class SileroVADBatcher:
+    """
+    Collect pending clips of all sessions within a short time window and run them through the model as one batch.
+    Clips are stacked into (B, clip_size) and model states into (2, B, 128), results are scattered back to callers.
+    """
+
+    def __init__(self, model, sample_rate: int = 16000, max_batch_size: int = 32, max_wait: float = 0.002):
+        self.model = model
+        self.sample_rate = np.array([sample_rate], dtype=np.int64)
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        self.request_queue = queue.Queue()
+        self.session_num = 0
+        self.session_lock = threading.Lock()
+        self.worker = threading.Thread(target=self._run, name="silero_vad_batcher", daemon=True)
+        self.worker.start()
+
+    def add_session(self):
+        with self.session_lock:
+            self.session_num += 1
+
+    def remove_session(self):
+        with self.session_lock:
+            self.session_num = max(0, self.session_num - 1)
+
+    def infer(self, clip: np.ndarray, state: np.ndarray) -> Tuple[float, np.ndarray]:
+        if self.session_num <= 1:
+            # nothing to batch with, skip the hand over to batch worker
+            probs, state = self.model.run(None, {
+                "input": clip[np.newaxis, ...],
+                "sr": self.sample_rate,
+                "state": state,
+            })
+            return probs[0][0], state
+        request = VADInferenceRequest(clip=clip, state=state)
+        self.request_queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.prob, request.result_state
+
+    def _collect_batch(self) -> List[VADInferenceRequest]:
+        batch = [self.request_queue.get()]
+        # every session has at most one clip in flight, no need to wait when all of them have arrived
+        batch_limit = min(self.max_batch_size, max(1, self.session_num))
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < batch_limit:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self.request_queue.get(timeout=remaining))
+                else:
+                    batch.append(self.request_queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run_batch(self, batch: List[VADInferenceRequest]):
+        clips = np.stack([request.clip for request in batch], axis=0)
+        states = np.concatenate([request.state for request in batch], axis=1)
+        probs, states = self.model.run(None, {
+            "input": clips,
+            "sr": self.sample_rate,
+            "state": states,
+        })
+        for i, request in enumerate(batch):
+            request.prob = probs[i][0]
+            request.result_state = states[:, i:i + 1, :]
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            # clips of different length can not be stacked, run them in separate batches
+            groups: Dict[int, List[VADInferenceRequest]] = {}
+            for request in batch:
+                groups.setdefault(request.clip.shape[-1], []).append(request)
+            for group in groups.values():
+                try:
+                    self._run_batch(group)
+                except Exception as e:
+                    logger.opt(exception=e).error(f"Failed to run VAD batch of size {len(group)}")
+                    for request in group:
+                        request.error = e
+                for request in group:
+                    request.done.set()
@@ -15,7 +15,9 @@ from chat_engine.contexts.session_context import SessionContext
 from chat_engine.data_models.chat_data.chat_data_model import ChatData
 from chat_engine.data_models.chat_engine_config_data import ChatEngineConfigModel, HandlerBaseConfigModel
 from chat_engine.data_models.runtime_data.data_bundle import DataBundle, DataBundleDefinition, DataBundleEntry
-from engine_utils.general_slicer import SliceContext, slice_data
+from engine_utils.clip_ring_buffer import ClipRingBuffer
+from engine_utils.general_slicer import SliceContext, slice_data_stacked
+from handlers.vad.silerovad.silero_vad_batcher import SileroVADBatcher
 
 
 class SileroVADConfigModel(HandlerBaseConfigModel, BaseModel):
@@ -24,6 +26,10 @@ class SileroVADConfigModel(HandlerBaseConfigModel, BaseModel):
     end_delay: int = Field(default=5000)
     buffer_look_back: int = Field(default=1024)
     speech_padding: int = Field(default=512)
+    # run clips of all sessions in one batched inference
+    batch_inference: bool = Field(default=True)
+    batch_max_size: int = Field(default=32)
+    batch_max_wait_ms: float = Field(default=2.0)
 
 
 class SpeakingStatus(enum.Enum):
@@ -40,7 +46,7 @@ class HumanAudioVADContext(HandlerContext):
 
         self.clip_size = 512
 
-        self.audio_history = []
+        self.audio_history: Optional[ClipRingBuffer] = None
         self.history_length_limit = 0
 
         self.speech_length: int = 0
@@ -61,19 +67,11 @@ class HumanAudioVADContext(HandlerContext):
 
     def _update_status_on_pre_start(self, clip: np.ndarray, _timestamp: Optional[int] = None):
         if self.speech_length >= self.config.start_delay:
-            head_sample_id = None
             self.speaking_status = SpeakingStatus.START
             sample_num_to_fetch = self.config.buffer_look_back + self.config.start_delay
             slice_num_to_fetch = math.ceil(sample_num_to_fetch / self.clip_size)
-            audio_clips = []
-            for history_entry in self.audio_history[-slice_num_to_fetch:]:
-                history_clip, history_timestamp = history_entry
-                if head_sample_id is None:
-                    head_sample_id = history_timestamp
-                audio_clips.append(history_clip)
-            output_audio = np.concatenate(audio_clips, axis=0)
-            output_audio = np.concatenate(
-                [np.zeros(self.config.speech_padding, dtype=clip.dtype), output_audio], axis=0)
+            output_audio, head_sample_id = self.audio_history.get_latest(slice_num_to_fetch,
+                                                                         pre_padding=self.config.speech_padding)
             self.speech_id += 1
             logger.info("Start of human speech")
             extra_args =  {
@@ -114,9 +112,7 @@ class HumanAudioVADContext(HandlerContext):
         return None, {}
 
     def _append_to_history(self, clip: np.ndarray, timestamp: Optional[int] = None):
-        self.audio_history.append((clip, timestamp))
-        while 0 < self.history_length_limit < len(self.audio_history):
-            self.audio_history.pop(0)
+        self.audio_history.append(clip, timestamp)
 
     def update_status(self, speech_prob: float, clip: np.ndarray,
                       timestamp: Optional[int]=None) -> Tuple[Optional[np.ndarray], Dict]:
@@ -139,6 +135,7 @@ class HandlerAudioVAD(HandlerBase, ABC):
     def __init__(self):
         super().__init__()
         self.model = None
+        self.batcher: Optional[SileroVADBatcher] = None
 
     def get_handler_info(self):
         return HandlerBaseInfo(
@@ -158,6 +155,10 @@ class HandlerAudioVAD(HandlerBase, ABC):
         self.model = onnxruntime.InferenceSession(model_path,
                                                   providers=["CPUExecutionProvider"],
                                                   sess_options=options)
+        if isinstance(handler_config, SileroVADConfigModel) and handler_config.batch_inference:
+            self.batcher = SileroVADBatcher(self.model,
+                                            max_batch_size=handler_config.batch_max_size,
+                                            max_wait=handler_config.batch_max_wait_ms / 1000)
 
     def create_context(self, session_context: SessionContext, handler_config = None) -> HandlerContext:
         context = HumanAudioVADContext(session_context.session_info.session_id)
@@ -171,6 +172,9 @@ class HandlerAudioVAD(HandlerBase, ABC):
         )
         context.history_length_limit = math.ceil((context.config.start_delay + context.config.buffer_look_back)
                                                  / context.clip_size)
+        context.audio_history = ClipRingBuffer(context.history_length_limit, context.clip_size)
+        if self.batcher is not None:
+            self.batcher.add_session()
         return context
 
     def start_context(self, session_context, handler_context):
@@ -201,6 +205,9 @@ class HandlerAudioVAD(HandlerBase, ABC):
         if clip.ndim != 1:
             logger.warning("Input audio should be 1-dim array")
             return 0
+        if self.batcher is not None:
+            prob, context.model_state = self.batcher.infer(clip, context.model_state)
+            return prob
         clip = np.expand_dims(clip, axis=0)
         inputs = {
             "input": clip,
@@ -236,31 +243,60 @@ class HandlerAudioVAD(HandlerBase, ABC):
 
         context.slice_context.update_start_id(timestamp[0], force_update=False)
 
-        for clip in slice_data(context.slice_context, audio):
-            head_sample_id = context.slice_context.get_last_slice_start_index()
+        start_id = context.slice_context.get_next_slice_start_index()
+        clips = slice_data_stacked(context.slice_context, audio)
+        # consecutive in speech clips are coalesced into one output, [first, last) index in clips
+        speech_range = None
+        for clip_index, clip in enumerate(clips):
+            head_sample_id = start_id + clip_index * context.clip_size
             speech_prob = self._inference(context, clip)
             audio_clip, extra_args = context.update_status(speech_prob, clip, timestamp=head_sample_id)
-            # FIXME this is a hack to disable VAD after human speech end,
-            #  but it should be handled by client or downstream handlers
+            if audio_clip is None:
+                continue
+            human_speech_start = extra_args.get("human_speech_start", False)
             human_speech_end = extra_args.get("human_speech_end", False)
-            timestamp = extra_args.get("head_sample_id", head_sample_id)
-            speech_id = f"speech-{context.session_id}-{context.speech_id}"
+            if not human_speech_start and not human_speech_end:
+                if speech_range is None:
+                    speech_range = [clip_index, clip_index + 1]
+                else:
+                    speech_range[1] = clip_index + 1
+                continue
+            if speech_range is not None:
+                yield self._create_output(context, output_definition, sample_rate,
+                                          clips[speech_range[0]:speech_range[1]].reshape(-1),
+                                          {"head_sample_id": start_id + speech_range[0] * context.clip_size})
+                speech_range = None
+            yield self._create_output(context, output_definition, sample_rate, audio_clip, extra_args,
+                                      head_sample_id)
             if human_speech_end:
+                # FIXME this is a hack to disable VAD after human speech end,
+                #  but it should be handled by client or downstream handlers
                 context.shared_states.enable_vad = False
                 context.reset()
-            if audio_clip is not None:
-                output = DataBundle(output_definition)
-                output.set_main_data(np.expand_dims(audio_clip, axis=0))
-                for flag_name, flag_value in extra_args.items():
-                    output.add_meta(flag_name, flag_value)
-                output.add_meta("speech_id", speech_id)
-                output_chat_data = ChatData(
-                    type=ChatDataType.HUMAN_AUDIO,
-                    data=output
-                )
-                if timestamp >= 0:
-                    output_chat_data.timestamp = timestamp, sample_rate
-                yield output_chat_data
+                # vad is disabled, rest of the chunk is dropped
+                break
+        if speech_range is not None:
+            yield self._create_output(context, output_definition, sample_rate,
+                                      clips[speech_range[0]:speech_range[1]].reshape(-1),
+                                      {"head_sample_id": start_id + speech_range[0] * context.clip_size})
+
+    @classmethod
+    def _create_output(cls, context: HumanAudioVADContext, output_definition: DataBundleDefinition,
+                       sample_rate: int, audio: np.ndarray, extra_args: Dict, head_sample_id: int = -1):
+        timestamp = extra_args.get("head_sample_id", head_sample_id)
+        output = DataBundle(output_definition)
+        output.set_main_data(np.expand_dims(audio, axis=0))
+        for flag_name, flag_value in extra_args.items():
+            output.add_meta(flag_name, flag_value)
+        output.add_meta("speech_id", f"speech-{context.session_id}-{context.speech_id}")
+        output_chat_data = ChatData(
+            type=ChatDataType.HUMAN_AUDIO,
+            data=output
+        )
+        if timestamp >= 0:
+            output_chat_data.timestamp = timestamp, sample_rate
+        return output_chat_data
 
     def destroy_context(self, context: HandlerContext):
-        pass
+        if self.batcher is not None:
+            self.batcher.remove_session()
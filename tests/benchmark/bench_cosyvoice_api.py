@@ -0,0 +1,128 @@
+"""
+Compare the remote CosyVoice api path as it was, a new connection and prompt upload from disk per sentence with every
+16 KB chunk resampled by itself, against CosyVoiceApiClient. A local stand-in server streams 22050 Hz pcm paced like
+a server synthesizing at twice real time. Reported are time to first chunk, time per sentence, resampling cpu time
+and the error at chunk boundaries against resampling the whole sentence at once.
+
+Run from project root:
+    python tests/benchmark/bench_cosyvoice_api.py
+"""
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import librosa
+import numpy as np
+import requests
+from scipy.signal import resample_poly
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "src"))
+
+from handlers.tts.cosyvoice.cosyvoice_api_client import CosyVoiceApiClient  # noqa: E402
+
+SENTENCE_NUM = 20
+SENTENCE_SECONDS = 3
+PIECE_SECONDS = 0.05
+REAL_TIME_FACTOR = 0.5
+PCM = (np.sin(np.arange(22050 * SENTENCE_SECONDS) * 2 * np.pi * 220 / 22050) * 10000).astype(np.int16)
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        # like uvicorn, otherwise small pieces wait for acks on kept alive connections
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.send_response(200)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        pcm = PCM.tobytes()
+        piece_bytes = int(22050 * PIECE_SECONDS) * 2
+        for start in range(0, len(pcm), piece_bytes):
+            time.sleep(PIECE_SECONDS * REAL_TIME_FACTOR)
+            piece = pcm[start:start + piece_bytes]
+            self.wfile.write(f"{len(piece):x}\r\n".encode() + piece + b"\r\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, *args):
+        pass
+
+
+def synthesize_before(api_url, ref_audio_path, text, resample_time):
+    files = {'prompt_wav': open(ref_audio_path, 'rb')}
+    data = {'prompt_text': "prompt", 'tts_text': text}
+    response = requests.post(api_url, data=data, files=files, stream=True)
+    for r in response.iter_content(chunk_size=16000):
+        start = time.thread_time()
+        tts_speech = np.array(np.frombuffer(r, dtype=np.int16)).astype(np.float32) / 32767
+        output_audio = librosa.resample(tts_speech, orig_sr=22050, target_sr=24000)
+        resample_time[0] += time.thread_time() - start
+        yield output_audio[np.newaxis, ...]
+
+
+def synthesize_client(client, text, resample_time):
+    resample = client._resample
+
+    def timed_resample(pcm):
+        start = time.thread_time()
+        output = resample(pcm)
+        resample_time[0] += time.thread_time() - start
+        return output
+    client._resample = timed_resample
+    yield from client.synthesize(text)
+    client._resample = resample
+
+
+def measure(name, synthesize):
+    first_chunk_latencies = []
+    sentence_times = []
+    resample_time = [0.0]
+    audio = None
+    # warm up lazy imports and connections
+    list(synthesize("warm up", [0.0]))
+    for i in range(SENTENCE_NUM):
+        start = time.monotonic()
+        chunks = []
+        for chunk in synthesize(f"sentence {i}", resample_time):
+            if len(chunks) == 0:
+                first_chunk_latencies.append(time.monotonic() - start)
+            chunks.append(chunk)
+        sentence_times.append(time.monotonic() - start)
+        audio = np.concatenate(chunks, axis=-1)[0]
+    expected = resample_poly(PCM.astype(np.float32) / 32767, 160, 147)
+    length = min(len(expected), len(audio)) - 200
+    error = np.abs(audio[100:length] - expected[100:length]).max()
+    print(f"{name}: first chunk {np.mean(first_chunk_latencies) * 1000:6.1f} ms, "
+          f"sentence {np.mean(sentence_times) * 1000:6.1f} ms, "
+          f"resample cpu {resample_time[0] / SENTENCE_NUM * 1000:6.2f} ms per sentence, "
+          f"max error vs whole signal {error:.4f}")
+
+
+def main():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    api_url = f"http://127.0.0.1:{server.server_port}/"
+    with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as f:
+        f.write(os.urandom(200 * 1024))
+        ref_audio_path = f.name
+    try:
+        measure("before ", lambda text, resample_time: synthesize_before(api_url, ref_audio_path, text,
+                                                                         resample_time))
+        client = CosyVoiceApiClient(api_url, ref_audio_path, "prompt", 24000)
+        measure("client ", lambda text, resample_time: synthesize_client(client, text, resample_time))
+        client.close()
+    finally:
+        os.remove(ref_audio_path)
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Compare transport of synthesized audio from tts worker processes to the engine, a manager queue carrying the numpy
+chunks against shared memory rings with descriptors on a plain multiprocessing queue. Workers hand over a chunk every
+CHUNK_INTERVAL like a model synthesizing faster than real time, latency is measured from the worker handing a chunk
+over until the engine holds it as an array.
+
+Run from project root (linux, reads manager cpu time from /proc):
+    python tests/benchmark/bench_cosyvoice_transport.py
+"""
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "src"))
+
+from handlers.tts.cosyvoice.shared_audio_ring import AudioChunkReceiver, AudioChunkSender  # noqa: E402
+
+SAMPLE_RATE = 24000
+CHUNK_NUM = 200
+CHUNK_INTERVAL = 0.01
+
+
+def process_cpu_time(pid):
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def send_by_queue(output_queue, chunk_samples):
+    audio = np.random.rand(1, chunk_samples).astype(np.float32)
+    for i in range(CHUNK_NUM):
+        time.sleep(CHUNK_INTERVAL)
+        output_queue.put({'key': i, 'tts_speech': audio, 'session_id': "session", 'send_time': time.monotonic()})
+    output_queue.put(None)
+
+
+def send_by_ring(output_queue, ring_args, chunk_samples):
+    sender = AudioChunkSender(output_queue, *ring_args)
+    audio = np.random.rand(1, chunk_samples).astype(np.float32)
+    for i in range(CHUNK_NUM):
+        time.sleep(CHUNK_INTERVAL)
+        sender.send(i, "session", audio)
+    output_queue.put(None)
+
+
+def collect(receive, worker_num):
+    latencies = []
+    finished = 0
+    while finished < worker_num:
+        output = receive()
+        if output is None:
+            finished += 1
+            continue
+        latencies.append(time.monotonic() - output['send_time'])
+    return np.array(latencies) * 1000
+
+
+def run_manager(context, worker_num, chunk_samples):
+    manager = context.Manager()
+    output_queue = manager.Queue()
+    cpu_start = process_cpu_time(manager._process.pid)
+    start = time.monotonic()
+    workers = [context.Process(target=send_by_queue, args=(output_queue, chunk_samples)) for _ in range(worker_num)]
+    for worker in workers:
+        worker.start()
+    latencies = collect(output_queue.get, worker_num)
+    elapsed = time.monotonic() - start
+    manager_cpu = process_cpu_time(manager._process.pid) - cpu_start
+    for worker in workers:
+        worker.join()
+    manager.shutdown()
+    return latencies, elapsed, manager_cpu
+
+
+def run_ring(context, worker_num, chunk_samples):
+    output_queue = context.Queue()
+    receiver = AudioChunkReceiver(output_queue, worker_num, SAMPLE_RATE * 30)
+
+    def receive():
+        output = output_queue.get()
+        if output is None:
+            return None
+        ring_index, position, shape = output.pop('ring')
+        output['tts_speech'] = receiver.rings[ring_index].read(position, int(np.prod(shape))).reshape(shape)
+        return output
+
+    start = time.monotonic()
+    workers = [context.Process(target=send_by_ring, args=(output_queue, receiver.create_sender_args(i), chunk_samples))
+               for i in range(worker_num)]
+    for worker in workers:
+        worker.start()
+    latencies = collect(receive, worker_num)
+    elapsed = time.monotonic() - start
+    for worker in workers:
+        worker.join()
+    receiver.close()
+    return latencies, elapsed, 0.0
+
+
+def main():
+    context = multiprocessing.get_context("spawn")
+    for worker_num in [1, 4, 8]:
+        for chunk_seconds in [0.2, 1.0]:
+            chunk_samples = int(SAMPLE_RATE * chunk_seconds)
+            for name, run in [("manager queue", run_manager), ("shared ring  ", run_ring)]:
+                latencies, elapsed, manager_cpu = run(context, worker_num, chunk_samples)
+                print(f"{worker_num} workers, {chunk_seconds:.1f}s chunks, {name}: "
+                      f"latency p50 {np.percentile(latencies, 50):6.2f} ms "
+                      f"p99 {np.percentile(latencies, 99):6.2f} ms, "
+                      f"{len(latencies) / elapsed:5.0f} chunks/s, manager cpu {manager_cpu:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
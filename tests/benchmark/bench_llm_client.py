@@ -0,0 +1,162 @@
+"""
+Measure time to first token of concurrent sessions against a local stand-in of an OpenAI compatible server,
+with a client per session, a shared pooled client, and a shared async client.
+
+Run from project root:
+    python tests/benchmark/bench_llm_client.py
+"""
+import asyncio
+import json
+import multiprocessing
+import threading
+import time
+from typing import List, Tuple
+
+import httpx
+import numpy as np
+from openai import AsyncOpenAI, OpenAI
+
+SESSION_NUM = 100
+ROUND_NUM = 3
+TOKEN_NUM = 20
+FIRST_TOKEN_DELAY = 0.2
+TOKEN_INTERVAL = 0.03
+
+
+class StandInServer:
+    """
+    Minimal http/1.1 server streaming chat completion chunks, keep-alive is supported.
+    It runs in its own process, so it does not compete with the measured clients for the GIL.
+    """
+
+    def __init__(self):
+        self.port = None
+        self.connection_num = multiprocessing.Value("i", 0)
+        self.port_queue = multiprocessing.Queue()
+        self.process = multiprocessing.Process(target=self._run, daemon=True)
+
+    def start(self):
+        self.process.start()
+        self.port = self.port_queue.get()
+
+    def _run(self):
+        loop = asyncio.new_event_loop()
+        server = loop.run_until_complete(asyncio.start_server(self._serve, "127.0.0.1", 0, backlog=1024))
+        self.port_queue.put(server.sockets[0].getsockname()[1])
+        loop.run_forever()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        with self.connection_num.get_lock():
+            self.connection_num.value += 1
+        try:
+            while True:
+                header = await reader.readuntil(b"\r\n\r\n")
+                content_length = 0
+                for line in header.decode().split("\r\n"):
+                    if line.lower().startswith("content-length:"):
+                        content_length = int(line.split(":")[1])
+                await reader.readexactly(content_length)
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+                             b"Transfer-Encoding: chunked\r\nConnection: keep-alive\r\n\r\n")
+                await asyncio.sleep(FIRST_TOKEN_DELAY)
+                for i in range(TOKEN_NUM):
+                    chunk = {"id": "bench", "object": "chat.completion.chunk", "created": 0, "model": "bench",
+                             "choices": [{"index": 0, "delta": {"content": f"t{i} "}, "finish_reason": None}]}
+                    self._write_chunk(writer, f"data: {json.dumps(chunk)}\n\n".encode())
+                    await writer.drain()
+                    await asyncio.sleep(TOKEN_INTERVAL)
+                self._write_chunk(writer, b"data: [DONE]\n\n")
+                writer.write(b"0\r\n\r\n")
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    @classmethod
+    def _write_chunk(cls, writer: asyncio.StreamWriter, data: bytes):
+        writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+
+def create_request():
+    return dict(model="bench", messages=[{"role": "user", "content": "hello"}], stream=True)
+
+
+def run_threaded(base_url: str, shared_client: bool) -> Tuple[List[float], int]:
+    ttft = []
+    lock = threading.Lock()
+    client = None
+    if shared_client:
+        client = OpenAI(api_key="bench", base_url=base_url,
+                        http_client=httpx.Client(limits=httpx.Limits(max_connections=SESSION_NUM,
+                                                                     max_keepalive_connections=SESSION_NUM)))
+
+    def run_session():
+        session_client = client or OpenAI(api_key="bench", base_url=base_url)
+        for _ in range(ROUND_NUM):
+            start = time.perf_counter()
+            first = None
+            for _chunk in session_client.chat.completions.create(**create_request()):
+                if first is None:
+                    first = time.perf_counter() - start
+            with lock:
+                ttft.append(first)
+
+    threads = [threading.Thread(target=run_session) for _ in range(SESSION_NUM)]
+    for thread in threads:
+        thread.start()
+    thread_num = threading.active_count()
+    for thread in threads:
+        thread.join()
+    return ttft, thread_num
+
+
+def run_async(base_url: str) -> Tuple[List[float], int]:
+    ttft = []
+    thread_num = 0
+
+    async def run_session(client: AsyncOpenAI):
+        for _ in range(ROUND_NUM):
+            start = time.perf_counter()
+            first = None
+            async for _chunk in await client.chat.completions.create(**create_request()):
+                if first is None:
+                    first = time.perf_counter() - start
+            ttft.append(first)
+
+    async def run_all():
+        nonlocal thread_num
+        client = AsyncOpenAI(api_key="bench", base_url=base_url,
+                             http_client=httpx.AsyncClient(limits=httpx.Limits(max_connections=SESSION_NUM,
+                                                                               max_keepalive_connections=SESSION_NUM)))
+        tasks = [asyncio.create_task(run_session(client)) for _ in range(SESSION_NUM)]
+        await asyncio.sleep(0)
+        thread_num = threading.active_count()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run_all())
+    return ttft, thread_num
+
+
+def main():
+    server = StandInServer()
+    server.start()
+    base_url = f"http://127.0.0.1:{server.port}/v1"
+    cases = [
+        ("client per session", lambda: run_threaded(base_url, False)),
+        ("shared client", lambda: run_threaded(base_url, True)),
+        ("shared async client", lambda: run_async(base_url)),
+    ]
+    for name, run_case in cases:
+        connection_num = server.connection_num.value
+        start = time.perf_counter()
+        ttft, thread_num = run_case()
+        duration = time.perf_counter() - start
+        ttft = np.array(ttft) * 1000
+        print(f"{name:>20}: ttft mean {ttft.mean():.1f} ms, p95 {np.percentile(ttft, 95):.1f} ms, "
+              f"total {duration:.2f} s, {server.connection_num.value - connection_num} connections, "
+              f"{thread_num} threads")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Compare throughput of the incremental sentence segmenter with splitting the whole accumulated text on every token,
+for replies of growing length streamed as llm tokens.
+
+Run from project root:
+    python tests/benchmark/bench_sentence_segmenter.py
+"""
+import os
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "src"))
+
+from engine_utils.sentence_segmenter import SentenceSegmenter  # noqa: E402
+
+REPEAT = 5
+
+
+def create_tokens(char_num: int, clause_length: int):
+    rng = random.Random(0)
+    text = ""
+    while len(text) < char_num:
+        text += "".join(rng.choice("数字人助手今天天气不错我们出发吧") for _ in range(clause_length))
+        text += rng.choice("，。！？")
+    tokens = []
+    index = 0
+    while index < len(text):
+        size = rng.randint(1, 3)
+        tokens.append(text[index:index + size])
+        index += size
+    return tokens
+
+
+def split_by_regex(tokens):
+    input_text = ""
+    for token in tokens:
+        input_text += token
+        sentences = re.split(r'(?<=[,.~!?，。！？])', input_text)
+        if len(sentences) > 1:
+            input_text = sentences[-1]
+
+
+def segment(tokens):
+    segmenter = SentenceSegmenter(min_chars=5)
+    for token in tokens:
+        segmenter.push(token)
+    segmenter.flush()
+
+
+def main():
+    for char_num in [200, 2000, 20000]:
+        for clause_length in [10, 200]:
+            tokens = create_tokens(char_num, clause_length)
+            regex_time = min(timeit.repeat(lambda: split_by_regex(tokens), number=1, repeat=REPEAT))
+            segmenter_time = min(timeit.repeat(lambda: segment(tokens), number=1, repeat=REPEAT))
+            print(f"{char_num:>6} chars, clause {clause_length:>3}: "
+                  f"regex split {len(tokens) / regex_time / 1000:8.1f} k tokens/s, "
+                  f"segmenter {len(tokens) / segmenter_time / 1000:8.1f} k tokens/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Measure the latency chat data needs to travel through a chain of handlers in a ChatSession,
+for every available pump mode.
+
+Run from project root:
+    python tests/benchmark/bench_session_pump.py
+"""
+import os
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "src"))
+
+from chat_engine.common.handler_base import HandlerBase, HandlerBaseInfo, HandlerDataInfo, HandlerDetail  # noqa: E402
+from chat_engine.contexts.handler_context import HandlerContext  # noqa: E402
+from chat_engine.contexts.session_context import SessionContext  # noqa: E402
+from chat_engine.core.chat_session import ChatSession  # noqa: E402
+from chat_engine.core.handler_worker_pool import HandlerWorkerPool  # noqa: E402
+from chat_engine.core.session_event_loop import SessionEventLoop  # noqa: E402
+from chat_engine.data_models.chat_data.chat_data_model import ChatData  # noqa: E402
+from chat_engine.data_models.chat_data_type import ChatDataType  # noqa: E402
+from chat_engine.data_models.chat_engine_config_data import (  # noqa: E402
+    ChatEngineConfigModel, HandlerBaseConfigModel, SessionPumpMode)
+from chat_engine.data_models.runtime_data.data_bundle import (  # noqa: E402
+    DataBundle, DataBundleDefinition, DataBundleEntry)
+from chat_engine.data_models.session_info_data import SessionInfoData  # noqa: E402
+
+# VAD -> ASR -> LLM -> TTS -> Avatar
+PIPELINE = [
+    ChatDataType.MIC_AUDIO,
+    ChatDataType.HUMAN_AUDIO,
+    ChatDataType.HUMAN_TEXT,
+    ChatDataType.AVATAR_TEXT,
+    ChatDataType.AVATAR_AUDIO,
+    ChatDataType.AVATAR_VIDEO,
+]
+
+
+def create_definition(data_type: ChatDataType):
+    definition = DataBundleDefinition()
+    definition.add_entry(DataBundleEntry.create_audio_entry(data_type.value, 1, 16000))
+    return definition
+
+
+class RelayHandler(HandlerBase):
+    def __init__(self, input_type: ChatDataType, output_type: Optional[ChatDataType],
+                 arrivals: Optional[Dict[int, float]] = None):
+        super().__init__()
+        self.input_type = input_type
+        self.output_type = output_type
+        self.arrivals = arrivals
+        self.arrived = threading.Event()
+
+    def get_handler_info(self) -> HandlerBaseInfo:
+        return HandlerBaseInfo(config_model=HandlerBaseConfigModel)
+
+    def load(self, engine_config, handler_config=None):
+        pass
+
+    def create_context(self, session_context, handler_config=None) -> HandlerContext:
+        return HandlerContext(session_context.session_info.session_id)
+
+    def start_context(self, session_context, handler_context):
+        pass
+
+    def get_handler_detail(self, session_context, context) -> HandlerDetail:
+        inputs = {self.input_type: HandlerDataInfo(type=self.input_type)}
+        outputs = {}
+        if self.output_type is not None:
+            outputs[self.output_type] = HandlerDataInfo(type=self.output_type,
+                                                        definition=create_definition(self.output_type))
+        return HandlerDetail(inputs=inputs, outputs=outputs)
+
+    def handle(self, context, inputs: ChatData, output_definitions: Dict[ChatDataType, HandlerDataInfo]):
+        if self.output_type is None:
+            self.arrivals[inputs.data.get_meta("seq")] = time.perf_counter()
+            self.arrived.set()
+            return
+        output = DataBundle(output_definitions[self.output_type].definition)
+        output.set_main_data(inputs.data.get_main_data())
+        output.add_meta("seq", inputs.data.get_meta("seq"))
+        yield output
+
+    def destroy_context(self, context):
+        pass
+
+
+def run_pipeline(pump_mode: SessionPumpMode, message_num: int, interval: float,
+                 event_loop: Optional[SessionEventLoop] = None) -> Tuple[List[float], int]:
+    session_context = SessionContext(SessionInfoData(session_id=f"bench-{pump_mode.value}"), {}, {})
+    session = ChatSession(session_context, ChatEngineConfigModel(pump_mode=pump_mode), event_loop)
+    arrivals: Dict[int, float] = {}
+    worker_pools: List[HandlerWorkerPool] = []
+
+    def prepare(handler: RelayHandler, name: str):
+        worker_pool = None
+        if pump_mode == SessionPumpMode.WORKER_POOL:
+            worker_pool = HandlerWorkerPool(name, 2)
+            worker_pools.append(worker_pool)
+        return session.prepare_handler(handler, HandlerBaseInfo(name=name), HandlerBaseConfigModel(), worker_pool)
+
+    source_env = prepare(RelayHandler(ChatDataType.NONE, PIPELINE[0]), "source")
+    for hop, (input_type, output_type) in enumerate(zip(PIPELINE[:-1], PIPELINE[1:])):
+        prepare(RelayHandler(input_type, output_type), f"hop_{hop}")
+    sink = RelayHandler(PIPELINE[-1], None, arrivals)
+    prepare(sink, "sink")
+    session.start()
+    thread_num = threading.active_count()
+
+    definition = create_definition(PIPELINE[0])
+    sent = {}
+    for seq in range(message_num):
+        bundle = DataBundle(definition)
+        bundle.set_main_data(np.zeros((1, 512), dtype=np.float32))
+        bundle.add_meta("seq", seq)
+        sent[seq] = time.perf_counter()
+        source_env.context.submit_data(bundle)
+        time.sleep(interval)
+    deadline = time.monotonic() + 5
+    while len(arrivals) < message_num and time.monotonic() < deadline:
+        sink.arrived.wait(0.1)
+        sink.arrived.clear()
+    session.stop()
+    for worker_pool in worker_pools:
+        worker_pool.shutdown()
+    return [arrivals[seq] - sent[seq] for seq in sorted(arrivals.keys())], thread_num
+
+
+def main():
+    message_num = 100
+    interval = 0.032
+    hop_num = len(PIPELINE) - 1
+    event_loop = SessionEventLoop(max_workers=4)
+    event_loop.start()
+    for pump_mode in SessionPumpMode:
+        latencies, thread_num = run_pipeline(pump_mode, message_num, interval, event_loop)
+        latencies = np.array(latencies) * 1000
+        print(f"{pump_mode.value:>12}: {len(latencies)}/{message_num} delivered, "
+              f"end-to-end mean {latencies.mean():.2f} ms, p95 {np.percentile(latencies, 95):.2f} ms, "
+              f"per hop mean {latencies.mean() / hop_num:.2f} ms, {thread_num} threads running")
+    event_loop.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Compare SileroVAD inference of concurrent sessions with one model run per clip and with cross session batching.
+
+Run from project root:
+    python tests/benchmark/bench_silero_vad_batch.py [path/to/silero_vad.onnx]
+"""
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "src"))
+
+from handlers.vad.silerovad.silero_vad_batcher import SileroVADBatcher  # noqa: E402
+
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "src", "handlers", "vad",
+                                  "silerovad", "silero_vad", "src", "silero_vad", "data", "silero_vad.onnx")
+
+
+def load_model(model_path: str):
+    import onnxruntime
+    options = onnxruntime.SessionOptions()
+    options.inter_op_num_threads = 1
+    options.intra_op_num_threads = 1
+    options.log_severity_level = 4
+    return onnxruntime.InferenceSession(model_path, providers=["CPUExecutionProvider"], sess_options=options)
+
+
+def run_sessions(session_num: int, clip_num: int, infer_func) -> float:
+    clips = np.random.uniform(-0.1, 0.1, (session_num, clip_num, 512)).astype(np.float32)
+
+    def run_session(session_index: int):
+        state = np.zeros((2, 1, 128), dtype=np.float32)
+        for clip in clips[session_index]:
+            _, state = infer_func(clip, state)
+
+    threads = [threading.Thread(target=run_session, args=(i,)) for i in range(session_num)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def main():
+    model_path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_MODEL_PATH
+    model = load_model(model_path)
+    sr = np.array([16000], dtype=np.int64)
+    model_lock = threading.Lock()
+
+    def single_infer(clip, state):
+        with model_lock:
+            prob, state = model.run(None, {"input": clip[np.newaxis, :], "sr": sr, "state": state})
+        return prob[0][0], state
+
+    clip_num = 100
+    for session_num in [1, 8, 32, 64]:
+        batcher = SileroVADBatcher(model, max_batch_size=64)
+        for _ in range(session_num):
+            batcher.add_session()
+        single_dur = run_sessions(session_num, clip_num, single_infer)
+        batch_dur = run_sessions(session_num, clip_num, batcher.infer)
+        total_clips = session_num * clip_num
+        print(f"{session_num:>3} sessions: per clip {single_dur / total_clips * 1e6:8.1f} us unbatched, "
+              f"{batch_dur / total_clips * 1e6:8.1f} us batched, speedup {single_dur / batch_dur:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Compare resampling audio streamed in chunks with librosa.resample and scipy resample_poly on every chunk by itself,
+as the call sites did, against StreamResampler. Cases follow the call sites: 24 kHz avatar audio sliced for the
+16 kHz lip sync model, 22050 Hz CosyVoice api pcm, and 24 kHz audio captured at 16 kHz. Reported are time per chunk
+and the error at chunk boundaries against resampling the whole signal at once with the same method.
+
+Run from project root:
+    python tests/benchmark/bench_stream_resampler.py
+"""
+import os
+import sys
+import time
+
+import librosa
+import numpy as np
+from scipy.signal import resample_poly
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "src"))
+
+from engine_utils.stream_resampler import StreamResampler  # noqa: E402
+
+SIGNAL_SECONDS = 20
+CASES = [
+    # name, original rate, target rate, chunk seconds, int16
+    ("avatar slice 24k->16k ", 24000, 16000, 1.0, True),
+    ("cosyvoice api 22050->24k", 22050, 24000, 0.1, False),
+    ("audio capture 24k->16k", 24000, 16000, 0.04, False),
+]
+
+
+def make_signal(sample_rate):
+    t = np.arange(sample_rate * SIGNAL_SECONDS) / sample_rate
+    audio = 0.3 * np.sin(2 * np.pi * 220 * t) + 0.2 * np.sin(2 * np.pi * 1800 * t * (1 + t / SIGNAL_SECONDS))
+    return audio.astype(np.float32)
+
+
+def chunks_of(audio, chunk_size, int16):
+    if int16:
+        pcm = (audio * 32767).astype(np.int16)
+        return [pcm[i:i + chunk_size].tobytes() for i in range(0, len(pcm), chunk_size)]
+    return [audio[i:i + chunk_size] for i in range(0, len(audio), chunk_size)]
+
+
+def to_float(chunk, int16):
+    return np.frombuffer(chunk, dtype=np.int16).astype(np.float32) / 32767 if int16 else chunk
+
+
+def run_librosa(chunks, orig_sr, target_sr, int16):
+    outputs = []
+    for chunk in chunks:
+        output = librosa.resample(to_float(chunk, int16), orig_sr=orig_sr, target_sr=target_sr)
+        outputs.append((output * 32767).astype(np.int16) if int16 else output)
+    return outputs
+
+
+def run_resample_poly(chunks, orig_sr, target_sr, int16):
+    resampler = StreamResampler(orig_sr, target_sr)
+    outputs = []
+    for chunk in chunks:
+        output = resample_poly(to_float(chunk, int16), resampler.up, resampler.down)
+        outputs.append((output * 32767).astype(np.int16) if int16 else output)
+    return outputs
+
+
+def run_stream(chunks, orig_sr, target_sr, int16):
+    resampler = StreamResampler(orig_sr, target_sr)
+    if int16:
+        return [resampler.process_int16(chunk) for chunk in chunks] + [resampler.flush_int16()]
+    return [resampler.process(chunk) for chunk in chunks] + [resampler.flush()]
+
+
+def boundary_error(output, expected, int16):
+    output = output.astype(np.float32) / 32767 if int16 else output
+    length = min(len(output), len(expected)) - 200
+    return np.abs(output[100:length] - expected[100:length]).max()
+
+
+def main():
+    for name, orig_sr, target_sr, chunk_seconds, int16 in CASES:
+        audio = make_signal(orig_sr)
+        chunks = chunks_of(audio, int(orig_sr * chunk_seconds), int16)
+        whole = to_float(b"".join(chunks), int16) if int16 else audio
+        up_down = StreamResampler(orig_sr, target_sr)
+        expected = {
+            "librosa      ": librosa.resample(whole, orig_sr=orig_sr, target_sr=target_sr),
+            "resample_poly": resample_poly(whole, up_down.up, up_down.down),
+            "stream       ": resample_poly(whole, up_down.up, up_down.down),
+        }
+        print(f"{name}: {len(chunks)} chunks of {chunk_seconds * 1000:.0f} ms")
+        for method, run in [("librosa      ", run_librosa), ("resample_poly", run_resample_poly),
+                            ("stream       ", run_stream)]:
+            run(chunks[:3], orig_sr, target_sr, int16)
+            start = time.perf_counter()
+            outputs = run(chunks, orig_sr, target_sr, int16)
+            elapsed = time.perf_counter() - start
+            error = boundary_error(np.concatenate(outputs), expected[method], int16)
+            print(f"  {method}: {elapsed / len(chunks) * 1e6:8.1f} us per chunk, "
+                  f"max error vs whole signal {error:.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Compare time to first audio of tts turns when sentences of all sessions go to the workers FIFO, as before, against
+the task scheduler. Workers are simulated by threads sleeping in proportion to sentence length, sessions stream a short
+first sentence followed by longer ones like an llm reply, then pause before the next turn.
+
+Run from project root:
+    python tests/benchmark/bench_tts_scheduler.py
+"""
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import uuid
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "src"))
+
+from handlers.tts.cosyvoice.tts_task_scheduler import ScheduledTask, TTSTaskScheduler  # noqa: E402
+
+WORKER_NUM = 2
+TURN_NUM = 8
+SECONDS_PER_CHAR = 0.004
+FIRST_CHUNK_SECONDS = 0.03
+SENTENCE_INTERVAL = 0.05
+
+
+class Simulation:
+    def __init__(self, use_scheduler: bool):
+        self.work_queue = queue.Queue()
+        self.started = {}
+        self.done = {}
+        self.lock = threading.Lock()
+        self.scheduler = TTSTaskScheduler(self.work_queue.put, WORKER_NUM, session_concurrency=1) \
+            if use_scheduler else None
+
+    def worker(self):
+        while True:
+            tts_info = self.work_queue.get()
+            if tts_info is None:
+                break
+            with self.lock:
+                self.started[tts_info["key"]] = time.monotonic()
+            time.sleep(len(tts_info["text"]) * SECONDS_PER_CHAR)
+            self.done[tts_info["key"]].set()
+            if self.scheduler is not None:
+                self.scheduler.finish(tts_info["key"])
+
+    def submit(self, session_id, speech_id, text, first):
+        key = uuid.uuid4()
+        self.done[key] = threading.Event()
+        tts_info = {"text": text, "key": key, "session_id": session_id}
+        if self.scheduler is None:
+            self.work_queue.put(tts_info)
+        else:
+            self.scheduler.submit(ScheduledTask(key=key, session_id=session_id, speech_id=speech_id,
+                                                tts_info=tts_info, first=first))
+        return key
+
+    def session(self, session_id, seed, first_audio_latencies):
+        rng = random.Random(seed)
+        time.sleep(rng.uniform(0, 0.5))
+        for turn in range(TURN_NUM):
+            speech_id = f"{session_id}-{turn}"
+            submit_time = time.monotonic()
+            keys = [self.submit(session_id, speech_id, "嗯" * rng.randint(6, 10), True)]
+            for _ in range(rng.randint(3, 6)):
+                time.sleep(SENTENCE_INTERVAL)
+                keys.append(self.submit(session_id, speech_id, "嗯" * rng.randint(20, 50), False))
+            for key in keys:
+                self.done[key].wait()
+            first_audio_latencies.append(self.started[keys[0]] + FIRST_CHUNK_SECONDS - submit_time)
+            time.sleep(rng.uniform(0.3, 1.0))
+
+    def run(self, session_num):
+        workers = [threading.Thread(target=self.worker) for _ in range(WORKER_NUM)]
+        for worker in workers:
+            worker.start()
+        latencies = []
+        sessions = [threading.Thread(target=self.session, args=(f"session-{i}", i, latencies))
+                    for i in range(session_num)]
+        for session in sessions:
+            session.start()
+        for session in sessions:
+            session.join()
+        for _ in workers:
+            self.work_queue.put(None)
+        for worker in workers:
+            worker.join()
+        return np.array(latencies) * 1000
+
+
+def main():
+    for session_num in [2, 4, 8]:
+        for name, use_scheduler in [("fifo queue", False), ("scheduler ", True)]:
+            latencies = Simulation(use_scheduler).run(session_num)
+            print(f"{session_num} sessions, {WORKER_NUM} workers, {name}: time to first audio "
+                  f"p50 {np.percentile(latencies, 50):6.0f} ms p95 {np.percentile(latencies, 95):6.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
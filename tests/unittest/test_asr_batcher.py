@@ -0,0 +1,76 @@
+import threading
+import time
+import unittest
+
+import numpy as np
+
+from handlers.asr.sensevoice.asr_batcher import ASRBatcher, ASRRequest
+
+
+class TestASRBatcher(unittest.TestCase):
+    def test_split_buckets(self):
+        batcher = ASRBatcher(lambda audios, keys: keys, max_batch_size=2, bucket_ratio=1.5)
+        requests = [ASRRequest(speech_id=str(length), audio=np.zeros(length)) for length in [100, 30, 20, 120, 25]]
+        buckets = batcher.split_buckets(requests)
+        self.assertEqual([[request.speech_id for request in bucket] for bucket in buckets],
+                         [["20", "25"], ["30"], ["100", "120"]])
+
+    def test_route_results(self):
+        batch_sizes = []
+
+        def recognize(audios, speech_ids):
+            batch_sizes.append(len(audios))
+            return [f"{speech_id}:{audio.shape[0]}" for audio, speech_id in zip(audios, speech_ids)]
+
+        batcher = ASRBatcher(recognize, max_batch_size=8, max_wait=0.2)
+        session_num = 4
+        for _ in range(session_num):
+            batcher.add_session()
+        results = {}
+
+        def run_session(index):
+            results[index] = batcher.recognize(f"speech-{index}", np.zeros(1000 + index))
+
+        threads = [threading.Thread(target=run_session, args=(i,)) for i in range(session_num)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(results, {i: f"speech-{i}:{1000 + i}" for i in range(session_num)})
+        self.assertGreater(max(batch_sizes), 1)
+
+    def test_no_wait_by_default(self):
+        release = threading.Event()
+        batch_speech_ids = []
+
+        def recognize(audios, speech_ids):
+            batch_speech_ids.append(list(speech_ids))
+            if speech_ids[0] == "speech-0":
+                # hold the model, so the others queue up meanwhile
+                release.wait(5)
+            return list(speech_ids)
+
+        batcher = ASRBatcher(recognize, max_batch_size=8)
+        for _ in range(4):
+            batcher.add_session()
+        # other sessions are connected but silent, a lone request is dispatched right away
+        start = time.monotonic()
+        threads = [threading.Thread(target=batcher.recognize, args=("speech-0", np.zeros(1000)))]
+        threads[0].start()
+        while len(batch_speech_ids) == 0:
+            self.assertLess(time.monotonic() - start, 1)
+            time.sleep(0.001)
+        self.assertLess(time.monotonic() - start, 0.02)
+        for index in [1, 2]:
+            threads.append(threading.Thread(target=batcher.recognize, args=(f"speech-{index}", np.zeros(1000))))
+            threads[-1].start()
+        while batcher.request_queue.qsize() < 2:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(batch_speech_ids, [["speech-0"], ["speech-1", "speech-2"]])
+
+
+if __name__ == '__main__':
+    unittest.main()
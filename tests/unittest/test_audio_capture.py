@@ -0,0 +1,52 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from scipy.signal import resample_poly
+
+from engine_utils.audio_capture import AudioCapture, AudioCaptureConfig
+
+
+class TestAudioCapture(unittest.TestCase):
+    def test_disabled_by_default(self):
+        self.assertIsNone(AudioCapture.create(AudioCaptureConfig(), "test"))
+
+    def test_write_file(self):
+        with tempfile.TemporaryDirectory() as dump_dir:
+            capture = AudioCapture.create(AudioCaptureConfig(enabled=True, dump_dir=dump_dir), "session_a")
+            capture.capture(np.arange(4, dtype=np.float32))
+            capture.capture(np.arange(4, 8, dtype=np.float64))
+            capture.close()
+            capture.writer.flush()
+            self.assertTrue(os.path.dirname(capture.file_path) == dump_dir)
+            with open(capture.file_path, "rb") as f:
+                data = np.frombuffer(f.read(), dtype=np.float32)
+            np.testing.assert_array_equal(data, np.arange(8))
+
+    def test_ring_buffer(self):
+        config = AudioCaptureConfig(enabled=True, write_file=False, ring_buffer_seconds=1, sample_rate=10)
+        capture = AudioCapture.create(config, "session_b")
+        capture.capture(np.arange(6))
+        capture.writer.flush()
+        np.testing.assert_array_equal(capture.get_recent(), np.arange(6))
+        capture.capture(np.arange(6, 13))
+        capture.writer.flush()
+        np.testing.assert_array_equal(capture.get_recent(), np.arange(3, 13))
+        self.assertIsNone(capture.file_path)
+
+    def test_resample_stream(self):
+        with tempfile.TemporaryDirectory() as dump_dir:
+            capture = AudioCapture.create(AudioCaptureConfig(enabled=True, dump_dir=dump_dir), "session_c")
+            audio = np.sin(np.arange(24000) * 0.05).astype(np.float32)
+            for start in range(0, audio.shape[0], 2400):
+                capture.capture(audio[start:start + 2400], 24000)
+            capture.close()
+            capture.writer.flush()
+            with open(capture.file_path, "rb") as f:
+                data = np.frombuffer(f.read(), dtype=np.float32)
+            np.testing.assert_allclose(data, resample_poly(audio, 2, 3), atol=1e-5)
+
+
+if __name__ == '__main__':
+    unittest.main()
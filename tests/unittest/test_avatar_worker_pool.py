@@ -0,0 +1,157 @@
+import multiprocessing
+import queue
+import threading
+import unittest
+
+import av
+import numpy as np
+
+from handlers.avatar.liteavatar.avatar_worker_pool import AvatarWorker, AvatarWorkerPool, Tts2FaceEvent
+from handlers.avatar.liteavatar.model.algo_model import AudioResult, AvatarStatus
+
+
+def make_audio_frame(value):
+    return av.AudioFrame.from_ndarray(np.full([1, 2], value, dtype=np.int16), format="s16", layout="mono")
+
+
+class FakeProcessor:
+    """
+    Answers every audio with one audio frame holding its value, and goes back to listening on the end of speech.
+    """
+
+    def __init__(self):
+        self.output_handlers = []
+        self.started = 0
+        self.stopped = 0
+
+    def start(self):
+        self.started += 1
+
+    def stop(self):
+        self.stopped += 1
+
+    def register_output_handler(self, output_handler):
+        self.output_handlers.append(output_handler)
+
+    def clear_output_handlers(self):
+        self.output_handlers.clear()
+
+    def add_audio(self, speech_audio):
+        value, end_of_speech = speech_audio
+        for output_handler in self.output_handlers:
+            output_handler.on_audio(AudioResult(speech_id=value, audio_frame=make_audio_frame(value)))
+            if end_of_speech:
+                output_handler.on_avatar_status_change(value, AvatarStatus.LISTENING)
+
+
+def get_output(output_queue, timeout=5.0):
+    session_key, data = output_queue.get(timeout=timeout)
+    return session_key, data
+
+
+def get_session_output(output_queue, session_key, timeout=5.0):
+    # as the handler context reads, leftovers of an earlier session of the slot are skipped
+    while True:
+        item_key, data = output_queue.get(timeout=timeout)
+        if item_key == session_key:
+            return data
+
+
+class TestAvatarWorkerPool(unittest.TestCase):
+    def setUp(self):
+        self.processors = []
+
+    def create_processor(self):
+        processor = FakeProcessor()
+        self.processors.append(processor)
+        return processor
+
+    def start_workers(self, pool: AvatarWorkerPool):
+        # workers run in threads of the test on the queues the pool would hand to its processes
+        threads = []
+        for worker_index in range(pool.worker_num):
+            worker = AvatarWorker(self.create_processor, pool.command_queues[worker_index],
+                                  pool.slot_queues[worker_index])
+            thread = threading.Thread(target=worker.run, daemon=True)
+            thread.start()
+            threads.append(thread)
+        return threads
+
+    def test_assign_by_load(self):
+        pool = AvatarWorkerPool(self.create_processor, worker_num=2, max_sessions_per_worker=2,
+                                mp_context=multiprocessing.get_context("spawn"))
+        self.assertEqual(pool.capacity, 4)
+        sessions = [pool.acquire(f"session_{i}") for i in range(4)]
+        self.assertEqual([(s.worker_index, s.slot_index) for s in sessions], [(0, 0), (1, 0), (0, 1), (1, 1)])
+        self.assertEqual(len({s.session_key for s in sessions}), 4)
+        self.assertIsNone(pool.acquire("session_4"))
+
+        pool.release(sessions[2])
+        # releasing twice is harmless
+        pool.release(sessions[2])
+        reused = pool.acquire("session_5")
+        self.assertEqual((reused.worker_index, reused.slot_index), (0, 1))
+        self.assertIs(reused.queues, sessions[2].queues)
+        self.assertNotEqual(reused.session_key, sessions[2].session_key)
+        commands = []
+        while not pool.command_queues[0].empty() or len(commands) < 4:
+            commands.append(pool.command_queues[0].get(timeout=1))
+        self.assertEqual([command[0] for command in commands],
+                         [Tts2FaceEvent.START, Tts2FaceEvent.START, Tts2FaceEvent.STOP, Tts2FaceEvent.START])
+
+    def test_sessions_routed_to_own_slot(self):
+        pool = AvatarWorkerPool(self.create_processor, worker_num=1, max_sessions_per_worker=2,
+                                mp_context=multiprocessing.get_context("spawn"))
+        threads = self.start_workers(pool)
+        first = pool.acquire("first")
+        second = pool.acquire("second")
+        first.queues.audio_in_queue.put((first.session_key, (1, False)))
+        second.queues.audio_in_queue.put((second.session_key, (2, True)))
+        first.queues.audio_in_queue.put((first.session_key, (3, True)))
+
+        key, audio = get_output(first.queues.audio_out_queue)
+        self.assertEqual((key, audio.flat[0]), (first.session_key, 1))
+        key, audio = get_output(first.queues.audio_out_queue)
+        self.assertEqual((key, audio.flat[0]), (first.session_key, 3))
+        self.assertEqual(get_output(first.queues.event_out_queue),
+                         (first.session_key, Tts2FaceEvent.SPEAKING_TO_LISTENING))
+        key, audio = get_output(second.queues.audio_out_queue)
+        self.assertEqual((key, audio.flat[0]), (second.session_key, 2))
+        self.assertEqual(get_output(second.queues.event_out_queue),
+                         (second.session_key, Tts2FaceEvent.SPEAKING_TO_LISTENING))
+        self.assertEqual(len(self.processors), 2)
+        self.assertEqual([p.started for p in self.processors], [1, 1])
+
+        pool.stop()
+        for thread in threads:
+            thread.join(timeout=5)
+            self.assertFalse(thread.is_alive())
+        self.assertEqual([p.stopped for p in self.processors], [1, 1])
+
+    def test_stale_output_skipped_on_reuse(self):
+        pool = AvatarWorkerPool(self.create_processor, worker_num=1, max_sessions_per_worker=1,
+                                mp_context=multiprocessing.get_context("spawn"))
+        threads = self.start_workers(pool)
+        old = pool.acquire("old")
+        old.queues.audio_in_queue.put((old.session_key, (1, False)))
+        self.assertEqual(get_session_output(old.queues.audio_out_queue, old.session_key).flat[0], 1)
+        # audio and output of the old session still queued when the slot is handed over
+        old.queues.audio_in_queue.put((old.session_key, (2, False)))
+        pool.release(old)
+        old.queues.audio_in_queue.put((old.session_key, (4, False)))
+        new = pool.acquire("new")
+        self.assertIs(new.queues, old.queues)
+        new.queues.audio_in_queue.put((new.session_key, (3, False)))
+        self.assertEqual(get_session_output(new.queues.audio_out_queue, new.session_key).flat[0], 3)
+        with self.assertRaises(queue.Empty):
+            get_session_output(new.queues.audio_out_queue, new.session_key, timeout=0.3)
+        self.assertEqual(self.processors[0].started, 2)
+        self.assertEqual(self.processors[0].stopped, 1)
+
+        pool.stop()
+        for thread in threads:
+            thread.join(timeout=5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,247 @@
+import base64
+import hashlib
+import importlib.util
+import json
+import socketserver
+import struct
+import threading
+import time
+import unittest
+
+import numpy as np
+
+from handlers.tts.bailian_tts.bailian_tts_pool import PcmFrameBuffer, SynthesizerPool, can_start_synthesizer_stream, \
+    start_synthesizer_stream
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError("condition not met")
+        time.sleep(0.01)
+
+
+class TestPcmFrameBuffer(unittest.TestCase):
+    def test_fixed_frames(self):
+        pcm = np.random.default_rng(0).integers(-32768, 32767, 10000, dtype=np.int16).tobytes()
+        frame_buffer = PcmFrameBuffer(1000)
+        frames = []
+        start = 0
+        # odd piece sizes split samples across messages, the large one holds several frames
+        for size in [1, 333, 2999, 7001, 4, 9662]:
+            frames.extend(frame_buffer.push(pcm[start:start + size]))
+            start += size
+        self.assertTrue(all(frame.shape == (1, 1000) for frame in frames))
+        self.assertEqual(len(frames), 10)
+        self.assertIsNone(frame_buffer.flush())
+        expected = np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32767
+        np.testing.assert_array_equal(np.concatenate(frames, axis=-1)[0], expected)
+
+    def test_flush_partial_frame(self):
+        frame_buffer = PcmFrameBuffer(1000)
+        self.assertEqual(frame_buffer.push(np.arange(300, dtype=np.int16).tobytes() + b"\x01"), [])
+        np.testing.assert_array_equal(frame_buffer.flush()[0], np.arange(300, dtype=np.float32) / 32767)
+        self.assertIsNone(frame_buffer.flush())
+
+
+class FakeSynthesizer:
+    def __init__(self, index):
+        self.index = index
+        self.open = True
+
+
+class TestSynthesizerPool(unittest.TestCase):
+    def setUp(self):
+        self.opened = []
+        self.closed = []
+
+    def open_synthesizer(self):
+        synthesizer = FakeSynthesizer(len(self.opened))
+        self.opened.append(synthesizer)
+        return synthesizer
+
+    def close_synthesizer(self, synthesizer):
+        self.closed.append(synthesizer)
+
+    def test_lease_and_refill(self):
+        pool = SynthesizerPool(self.open_synthesizer, self.close_synthesizer, size=2,
+                               is_open=lambda synthesizer: synthesizer.open)
+        pool.start()
+        wait_until(lambda: pool.idle_num == 2)
+        self.assertIs(pool.lease(), self.opened[0])
+        wait_until(lambda: len(self.opened) == 3 and pool.idle_num == 2)
+        # dropped by the server while idle
+        self.opened[1].open = False
+        self.assertIs(pool.lease(), self.opened[2])
+        self.assertEqual(self.closed, [self.opened[1]])
+        wait_until(lambda: pool.idle_num == 2)
+        pool.stop()
+        self.assertEqual(self.closed[1:], self.opened[3:])
+        # nothing pre opened once stopped, a reply still gets a synthesizer
+        self.assertIs(pool.lease(), self.opened[-1])
+
+    def test_lazy_start_without_sdk_support(self):
+        # stand-in for a dashscope release without the private start method
+        synthesizer = FakeSynthesizer(0)
+        synthesizer._is_first = True
+        self.assertFalse(can_start_synthesizer_stream(FakeSynthesizer))
+        self.assertIs(start_synthesizer_stream(synthesizer), synthesizer)
+        self.assertTrue(synthesizer._is_first)
+
+    def test_reopen_idle(self):
+        pool = SynthesizerPool(self.open_synthesizer, self.close_synthesizer, size=1, max_idle_seconds=0.1)
+        pool.start()
+        wait_until(lambda: len(self.closed) >= 2)
+        pool.stop()
+        self.assertEqual(self.closed, self.opened[:len(self.closed)])
+        self.assertEqual(len(self.opened), len(self.closed))
+
+
+class StandInHandler(socketserver.BaseRequestHandler):
+    """
+    Speaks the duplex tts protocol of dashscope over a bare websocket: every continue-task text is answered with
+    pcm of 100 samples per character, sent in pieces of odd size.
+    """
+
+    def handle(self):
+        server = self.server
+        request = b""
+        while b"\r\n\r\n" not in request:
+            request += self.request.recv(4096)
+        key = [line.split(b":", 1)[1].strip() for line in request.split(b"\r\n")
+               if line.lower().startswith(b"sec-websocket-key")][0]
+        accept = base64.b64encode(hashlib.sha1(key + b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11").digest())
+        self.request.sendall(b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                             b"Sec-WebSocket-Accept: " + accept + b"\r\n\r\n")
+        with server.lock:
+            server.connections += 1
+        while True:
+            opcode, payload = self.read_frame()
+            if opcode is None or opcode == 8:
+                return
+            message = json.loads(payload)
+            action = message["header"]["action"]
+            with server.lock:
+                server.actions.append(action)
+            task_id = message["header"]["task_id"]
+            if action == "run-task":
+                self.send_event("task-started", task_id)
+            elif action == "continue-task":
+                pcm = server.make_pcm(message["payload"]["input"]["text"]).tobytes()
+                for start in range(0, len(pcm), 777):
+                    self.send_frame(2, pcm[start:start + 777])
+            elif action == "finish-task":
+                self.send_event("task-finished", task_id)
+
+    def read_exact(self, size):
+        data = b""
+        while len(data) < size:
+            piece = self.request.recv(size - len(data))
+            if not piece:
+                return None
+            data += piece
+        return data
+
+    def read_frame(self):
+        header = self.read_exact(2)
+        if header is None:
+            return None, None
+        length = header[1] & 0x7f
+        if length == 126:
+            length = struct.unpack(">H", self.read_exact(2))[0]
+        elif length == 127:
+            length = struct.unpack(">Q", self.read_exact(8))[0]
+        mask = self.read_exact(4)
+        payload = bytes(b ^ mask[i % 4] for i, b in enumerate(self.read_exact(length)))
+        return header[0] & 0x0f, payload
+
+    def send_frame(self, opcode, payload):
+        if len(payload) < 126:
+            header = struct.pack(">BB", 0x80 | opcode, len(payload))
+        else:
+            header = struct.pack(">BBH", 0x80 | opcode, 126, len(payload))
+        self.request.sendall(header + payload)
+
+    def send_event(self, event, task_id):
+        self.send_frame(1, json.dumps({"header": {"event": event, "task_id": task_id}, "payload": {}}).encode())
+
+
+class StandInServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.actions = []
+
+    @classmethod
+    def make_pcm(cls, text):
+        return (np.sin(np.arange(len(text) * 100) * 0.1) * 10000).astype(np.int16)
+
+
+@unittest.skipUnless(importlib.util.find_spec("dashscope"), "dashscope is not installed")
+class TestPooledSpeechSynthesizer(unittest.TestCase):
+    def setUp(self):
+        import dashscope
+        dashscope.api_key = "test"
+        self.server = StandInServer()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"ws://127.0.0.1:{self.server.server_address[1]}/"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_reply_on_pre_opened_connection(self):
+        from dashscope.audio.tts_v2 import AudioFormat, ResultCallback, SpeechSynthesizer
+
+        class FrameCallback(ResultCallback):
+            def __init__(self):
+                super().__init__()
+                self.frame_buffer = PcmFrameBuffer(1000)
+                self.frames = []
+
+            def on_data(self, data: bytes) -> None:
+                self.frames.extend(self.frame_buffer.push(data))
+
+            def on_complete(self) -> None:
+                frame = self.frame_buffer.flush()
+                if frame is not None:
+                    self.frames.append(frame)
+
+        def open_synthesizer():
+            synthesizer = SpeechSynthesizer(model="cosyvoice-v1", voice="voice", callback=ResultCallback(),
+                                            format=AudioFormat.PCM_24000HZ_MONO_16BIT, url=self.url)
+            return start_synthesizer_stream(synthesizer)
+
+        pool = SynthesizerPool(open_synthesizer, lambda synthesizer: synthesizer.streaming_cancel(), size=2)
+        pool.start()
+        wait_until(lambda: pool.idle_num == 2)
+        # connected and task started before any text
+        self.assertEqual(self.server.connections, 2)
+        self.assertEqual(self.server.actions, ["run-task", "run-task"])
+
+        synthesizer = pool.lease()
+        callback = FrameCallback()
+        synthesizer.callback = callback
+        start = time.monotonic()
+        synthesizer.streaming_call("hello ")
+        self.assertLess(time.monotonic() - start, 0.1)
+        synthesizer.streaming_call("world")
+        synthesizer.streaming_complete()
+        self.assertTrue(all(frame.shape == (1, 1000) for frame in callback.frames[:-1]))
+        expected = StandInServer.make_pcm("hello ").astype(np.float32) / 32767
+        expected = np.concatenate([expected, StandInServer.make_pcm("world").astype(np.float32) / 32767])
+        np.testing.assert_array_equal(np.concatenate(callback.frames, axis=-1)[0], expected)
+
+        wait_until(lambda: pool.idle_num == 2)
+        self.assertEqual(self.server.connections, 3)
+        pool.stop()
+        wait_until(lambda: self.server.actions.count("finish-task") == 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
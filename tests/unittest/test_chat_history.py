@@ -0,0 +1,66 @@
+import threading
+import unittest
+
+from handlers.llm.openai_compatible.chat_history_manager import ChatHistory, HistoryMessage, estimate_tokens
+
+
+class TestChatHistory(unittest.TestCase):
+    def add_turns(self, history: ChatHistory, turn_num: int, text="hello there"):
+        for index in range(turn_num):
+            history.add_message(HistoryMessage(role="human", content=f"{text} {index}"))
+            history.add_message(HistoryMessage(role="avatar", content=f"answer {index}"))
+
+    def test_messages_are_filtered_once(self):
+        history = ChatHistory()
+        history.add_message(HistoryMessage(role="avatar", content="hi <b>there</b>"))
+        messages = history.generate_next_messages("how are you#", [])
+        self.assertEqual(messages[0], {"role": "assistant", "content": "hi bthereb"})
+        self.assertEqual(messages[1]["content"][0]["text"], "how are you")
+        self.assertEqual(history.message_cache[-1], {"role": "user", "content": "how are you"})
+
+    def test_trim_by_tokens(self):
+        history = ChatHistory(max_history_length=0, max_history_tokens=100, trim_ratio=0.5)
+        self.add_turns(history, 20)
+        self.assertLessEqual(history.token_num, 100)
+        self.assertEqual(history.token_num, sum(history.token_counts))
+        self.assertEqual(len(history.message_cache), len(history.message_history))
+        self.assertEqual(history.message_history[0].role, "human")
+
+    def test_prefix_stable_between_trims(self):
+        history = ChatHistory(max_history_length=0, max_history_tokens=200, trim_ratio=0.5)
+        prefixes = []
+        for index in range(30):
+            messages = history.generate_next_messages(f"question {index}", [])
+            history.add_message(HistoryMessage(role="avatar", content=f"answer {index}"))
+            prefixes.append(str(messages[0]["content"]))
+        # first message only changes when history is trimmed
+        self.assertLess(len(set(prefixes)), 10)
+
+    def test_trim_by_length(self):
+        history = ChatHistory(max_history_length=20, trim_ratio=1.0)
+        self.add_turns(history, 20)
+        self.assertEqual(len(history.message_history), 18)
+
+    def test_summary(self):
+        summarized = threading.Event()
+        dropped_num = []
+
+        def summarize(summary, messages):
+            dropped_num.append(len(messages))
+            summarized.set()
+            return summary + "s"
+
+        history = ChatHistory(max_history_length=6, summarize_func=summarize)
+        self.add_turns(history, 3)
+        self.assertTrue(summarized.wait(1))
+        messages = history.generate_next_messages("next", [])
+        self.assertEqual(messages[0], {"role": "system", "content": ChatHistory.summary_prefix + "s"})
+        self.assertEqual(dropped_num, [4])
+
+    def test_estimate_tokens(self):
+        self.assertEqual(estimate_tokens("你好"), 2 + 4)
+        self.assertEqual(estimate_tokens("abcdefgh"), 2 + 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
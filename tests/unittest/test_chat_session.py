@@ -0,0 +1,193 @@
+import queue
+import unittest
+from typing import Dict
+
+import numpy as np
+
+from chat_engine.common.handler_base import HandlerBase, HandlerBaseInfo, HandlerDataInfo, HandlerDetail
+from chat_engine.contexts.handler_context import HandlerContext
+from chat_engine.contexts.session_context import SessionContext
+from chat_engine.core.chat_session import ChatSession, DataSink, LatestInputSlot
+from chat_engine.core.handler_worker_pool import HandlerWorkerPool
+from chat_engine.core.session_event_loop import SessionEventLoop
+from chat_engine.data_models.chat_data.chat_data_model import ChatData
+from chat_engine.data_models.chat_data_type import ChatDataType
+from chat_engine.data_models.chat_engine_config_data import ChatEngineConfigModel, HandlerBaseConfigModel, \
+    SessionPumpMode
+from chat_engine.data_models.chat_signal import ChatSignal
+from chat_engine.data_models.chat_signal_type import ChatSignalSourceType, ChatSignalType
+from chat_engine.data_models.runtime_data.data_bundle import DataBundle, DataBundleDefinition, DataBundleEntry
+from chat_engine.data_models.session_info_data import SessionInfoData
+
+
+def create_audio_definition(name: str):
+    definition = DataBundleDefinition()
+    definition.add_entry(DataBundleEntry.create_audio_entry(name, 1, 16000))
+    return definition
+
+
+class RelayHandler(HandlerBase):
+    def __init__(self, input_type: ChatDataType, output_type: ChatDataType = None):
+        super().__init__()
+        self.input_type = input_type
+        self.output_type = output_type
+        self.received = queue.Queue()
+        self.signals = []
+
+    def get_handler_info(self) -> HandlerBaseInfo:
+        return HandlerBaseInfo(config_model=HandlerBaseConfigModel)
+
+    def load(self, engine_config, handler_config=None):
+        pass
+
+    def create_context(self, session_context, handler_config=None) -> HandlerContext:
+        return HandlerContext(session_context.session_info.session_id)
+
+    def start_context(self, session_context, handler_context):
+        pass
+
+    def get_handler_detail(self, session_context, context) -> HandlerDetail:
+        outputs = {}
+        if self.output_type is not None:
+            outputs[self.output_type] = HandlerDataInfo(type=self.output_type,
+                                                        definition=create_audio_definition(self.output_type.value))
+        return HandlerDetail(inputs={self.input_type: HandlerDataInfo(type=self.input_type)}, outputs=outputs)
+
+    def handle(self, context, inputs: ChatData, output_definitions: Dict[ChatDataType, HandlerDataInfo]):
+        self.received.put(inputs)
+        if self.output_type is None:
+            return
+        output = DataBundle(output_definitions[self.output_type].definition)
+        output.set_main_data(inputs.data.get_main_data())
+        output.add_meta("seq", inputs.data.get_meta("seq"))
+        yield output
+
+    def destroy_context(self, context):
+        pass
+
+    def on_signal(self, context, signal: ChatSignal):
+        self.signals.append((context.owner, signal.type))
+
+
+class TestChatSession(unittest.TestCase):
+    def run_relay(self, pump_mode: SessionPumpMode, event_loop=None, worker_pool=None):
+        session_context = SessionContext(SessionInfoData(session_id="test"), {}, {})
+        session = ChatSession(session_context, ChatEngineConfigModel(pump_mode=pump_mode), event_loop)
+        source_env = session.prepare_handler(RelayHandler(ChatDataType.NONE, ChatDataType.MIC_AUDIO),
+                                             HandlerBaseInfo(name="source"), HandlerBaseConfigModel(), worker_pool)
+        session.prepare_handler(RelayHandler(ChatDataType.MIC_AUDIO, ChatDataType.HUMAN_AUDIO),
+                                HandlerBaseInfo(name="relay"), HandlerBaseConfigModel(), worker_pool)
+        sink = RelayHandler(ChatDataType.HUMAN_AUDIO)
+        session.prepare_handler(sink, HandlerBaseInfo(name="sink"), HandlerBaseConfigModel(), worker_pool)
+        session.start()
+        definition = create_audio_definition("mic_audio")
+        for seq in range(10):
+            bundle = DataBundle(definition)
+            bundle.set_main_data(np.zeros((1, 16), dtype=np.float32))
+            bundle.add_meta("seq", seq)
+            source_env.context.submit_data(bundle)
+        received = [sink.received.get(timeout=2).data.get_meta("seq") for _ in range(10)]
+        session.stop()
+        return received
+
+    def test_blocking_mode(self):
+        self.assertEqual(self.run_relay(SessionPumpMode.BLOCKING), list(range(10)))
+
+    def test_polling_mode(self):
+        self.assertEqual(self.run_relay(SessionPumpMode.POLLING), list(range(10)))
+
+    def test_asyncio_mode(self):
+        event_loop = SessionEventLoop(max_workers=2)
+        event_loop.start()
+        try:
+            self.assertEqual(self.run_relay(SessionPumpMode.ASYNCIO, event_loop), list(range(10)))
+        finally:
+            event_loop.stop()
+
+    def test_worker_pool_mode(self):
+        worker_pool = HandlerWorkerPool("test", 2)
+        try:
+            self.assertEqual(self.run_relay(SessionPumpMode.WORKER_POOL, worker_pool=worker_pool), list(range(10)))
+        finally:
+            worker_pool.shutdown()
+
+    def test_signal_forwarded(self):
+        session_context = SessionContext(SessionInfoData(session_id="test"), {}, {})
+        session = ChatSession(session_context, ChatEngineConfigModel())
+        handler = RelayHandler(ChatDataType.HUMAN_AUDIO)
+        session.prepare_handler(handler, HandlerBaseInfo(name="sink"), HandlerBaseConfigModel())
+        session_context.shared_states.enable_vad = False
+        # client delegates emit signals through the session context
+        session_context.signal_emitter(ChatSignal(type=ChatSignalType.INTERRUPT,
+                                                  source_type=ChatSignalSourceType.CLIENT))
+        session_context.signal_emitter(ChatSignal(type=ChatSignalType.END, source_type=ChatSignalSourceType.CLIENT))
+        self.assertEqual(handler.signals, [("sink", ChatSignalType.INTERRUPT), ("sink", ChatSignalType.END)])
+        self.assertTrue(session_context.shared_states.enable_vad)
+
+    def test_asyncio_mode_requires_loop(self):
+        session_context = SessionContext(SessionInfoData(session_id="test"), {}, {})
+        with self.assertRaises(ValueError):
+            ChatSession(session_context, ChatEngineConfigModel(pump_mode=SessionPumpMode.ASYNCIO))
+
+
+class TestDataDelivery(unittest.TestCase):
+    def create_data(self, seq: int):
+        bundle = DataBundle(create_audio_definition("mic_audio"))
+        bundle.set_main_data(np.zeros((1, 160), dtype=np.float32))
+        bundle.add_meta("seq", seq)
+        chat_data = ChatData(type=ChatDataType.MIC_AUDIO, data=bundle)
+        chat_data.source = "source"
+        return chat_data
+
+    def test_max_rate(self):
+        limited_queue = queue.Queue()
+        full_queue = queue.Queue()
+        sinks = {ChatDataType.MIC_AUDIO: [
+            DataSink(owner="limited", sink_queue=limited_queue,
+                     consume_info=HandlerDataInfo(type=ChatDataType.MIC_AUDIO, max_rate=1)),
+            DataSink(owner="full", sink_queue=full_queue, consume_info=HandlerDataInfo(type=ChatDataType.MIC_AUDIO)),
+        ]}
+        for seq in range(10):
+            ChatSession.distribute_data(self.create_data(seq), sinks, {})
+        self.assertEqual(limited_queue.qsize(), 1)
+        self.assertEqual(limited_queue.get().data.get_meta("seq"), 0)
+        self.assertEqual(full_queue.qsize(), 10)
+
+    def distribute(self, consume_info: HandlerDataInfo, data_list):
+        sink_queue = queue.Queue()
+        sinks = {ChatDataType.MIC_AUDIO: [DataSink(owner="sink", sink_queue=sink_queue, consume_info=consume_info)]}
+        for chat_data in data_list:
+            ChatSession.distribute_data(chat_data, sinks, {})
+        return [sink_queue.get_nowait() for _ in range(sink_queue.qsize())]
+
+    def test_decimation(self):
+        delivered = self.distribute(HandlerDataInfo(type=ChatDataType.MIC_AUDIO, decimation=3),
+                                    [self.create_data(seq) for seq in range(10)])
+        self.assertEqual([chat_data.data.get_meta("seq") for chat_data in delivered], [0, 3, 6, 9])
+
+    def test_meta_predicate(self):
+        data_list = [self.create_data(seq) for seq in range(5)]
+        data_list[3].data.add_meta("human_speech_end", True)
+        delivered = self.distribute(
+            HandlerDataInfo(type=ChatDataType.MIC_AUDIO,
+                            meta_predicate=lambda meta: meta.get("human_speech_end", False)),
+            data_list)
+        self.assertEqual([chat_data.data.get_meta("seq") for chat_data in delivered], [3])
+
+    def test_latest_only(self):
+        consume_info = HandlerDataInfo(type=ChatDataType.MIC_AUDIO, latest_only=True)
+        sink_queue = queue.Queue()
+        sinks = {ChatDataType.MIC_AUDIO: [DataSink(owner="sink", sink_queue=sink_queue, consume_info=consume_info)]}
+        for seq in range(5):
+            ChatSession.distribute_data(self.create_data(seq), sinks, {})
+        self.assertEqual(sink_queue.qsize(), 1)
+        slot = sink_queue.get_nowait()
+        self.assertIsInstance(slot, LatestInputSlot)
+        self.assertEqual(slot.take().data.get_meta("seq"), 4)
+        # slot is queued again once its input is taken
+        ChatSession.distribute_data(self.create_data(5), sinks, {})
+        self.assertEqual(sink_queue.get_nowait().take().data.get_meta("seq"), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+
+import numpy as np
+
+from engine_utils.clip_ring_buffer import ClipRingBuffer
+
+
+class TestClipRingBuffer(unittest.TestCase):
+    def test_latest_without_wrap(self):
+        ring_buffer = ClipRingBuffer(4, 2)
+        ring_buffer.append(np.array([1, 2]), 0)
+        ring_buffer.append(np.array([3, 4]), 2)
+        audio, timestamp = ring_buffer.get_latest(4, pre_padding=1)
+        np.testing.assert_array_equal(audio, [0, 1, 2, 3, 4])
+        self.assertEqual(timestamp, 0)
+
+    def test_latest_with_wrap(self):
+        ring_buffer = ClipRingBuffer(3, 2)
+        for i in range(5):
+            ring_buffer.append(np.array([i, i]), i * 2)
+        self.assertEqual(len(ring_buffer), 3)
+        audio, timestamp = ring_buffer.get_latest(3)
+        np.testing.assert_array_equal(audio, [2, 2, 3, 3, 4, 4])
+        self.assertEqual(timestamp, 4)
+        audio, timestamp = ring_buffer.get_latest(2)
+        np.testing.assert_array_equal(audio, [3, 3, 4, 4])
+        self.assertEqual(timestamp, 6)
+
+    def test_result_does_not_alias_buffer(self):
+        ring_buffer = ClipRingBuffer(2, 2)
+        ring_buffer.append(np.array([1, 1]))
+        audio, timestamp = ring_buffer.get_latest(1)
+        self.assertIsNone(timestamp)
+        ring_buffer.append(np.array([2, 2]))
+        ring_buffer.append(np.array([3, 3]))
+        np.testing.assert_array_equal(audio, [1, 1])
+
+    def test_clear(self):
+        ring_buffer = ClipRingBuffer(2, 2)
+        ring_buffer.append(np.array([1, 1]), 0)
+        ring_buffer.clear()
+        audio, timestamp = ring_buffer.get_latest(2, pre_padding=2)
+        np.testing.assert_array_equal(audio, [0, 0])
+        self.assertIsNone(timestamp)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from handlers.tts.cosyvoice.cosyvoice_api_client import CosyVoiceApiClient
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    pcm = (np.sin(np.arange(22050) / 10) * 10000).astype(np.int16).tobytes()
+    ports = []
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.ports.append(self.client_address[1])
+        self.send_response(200)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        # odd sized pieces split samples
+        for start in range(0, len(self.pcm), 1001):
+            piece = self.pcm[start:start + 1001]
+            self.wfile.write(f"{len(piece):x}\r\n".encode() + piece + b"\r\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, *args):
+        pass
+
+
+class TestCosyVoiceApiClient(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_synthesize(self):
+        StandInHandler.ports.clear()
+        client = CosyVoiceApiClient(f"http://127.0.0.1:{self.server.server_port}/", None, "prompt", 24000)
+        for _ in range(2):
+            chunks = list(client.synthesize("你好"))
+            self.assertGreater(len(chunks), 1)
+            self.assertTrue(all(chunk.shape[0] == 1 and chunk.dtype == np.float32 for chunk in chunks))
+            audio = np.concatenate(chunks, axis=-1)[0]
+            self.assertEqual(audio.shape[0], 24000)
+            expected = np.sin(np.arange(24000) * 22050 / 24000 / 10) * 10000 / 32767
+            np.testing.assert_allclose(audio[100:-100], expected[100:-100], atol=0.01)
+        # connection is reused
+        self.assertEqual(len(set(StandInHandler.ports)), 1)
+        client.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
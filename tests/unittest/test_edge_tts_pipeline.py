@@ -0,0 +1,105 @@
+import asyncio
+import io
+import time
+import unittest
+
+import numpy as np
+import soundfile
+
+from chat_engine.core.session_event_loop import SessionEventLoop
+from engine_utils.tts_audio_cache import TTSAudioCache
+from handlers.tts.edgetts.edge_tts_pipeline import EdgeTTSPipeline, Mp3StreamDecoder, SentenceJob
+
+
+def encode_mp3(seconds: float, frequency: float) -> bytes:
+    audio = (np.sin(np.arange(int(24000 * seconds)) * 2 * np.pi * frequency / 24000) * 0.5).astype(np.float32)
+    buffer = io.BytesIO()
+    soundfile.write(buffer, audio, 24000, format="MP3")
+    return buffer.getvalue()
+
+
+def drain(job: SentenceJob):
+    audios = []
+    while True:
+        audio = job.result_queue.get(timeout=5)
+        if audio is None:
+            return audios
+        audios.append(audio)
+
+
+class TestMp3StreamDecoder(unittest.TestCase):
+    def test_same_as_whole_decode(self):
+        data = encode_mp3(2, 440)
+        expected, _ = soundfile.read(io.BytesIO(data), dtype="float32")
+        decoder = Mp3StreamDecoder()
+        outputs = [decoder.push(data[start:start + 700]) for start in range(0, len(data), 700)]
+        self.assertGreater(sum(output.shape[0] > 0 for output in outputs), 3)
+        outputs.append(decoder.flush())
+        np.testing.assert_allclose(np.concatenate(outputs), expected, atol=1e-4)
+        self.assertEqual(decoder.sample_rate, 24000)
+
+
+class TestEdgeTTSPipeline(unittest.TestCase):
+    def setUp(self):
+        self.event_loop = SessionEventLoop(max_workers=1)
+        self.event_loop.start()
+        self.mp3 = {"first": encode_mp3(1, 300), "second": encode_mp3(1, 500), "third": encode_mp3(1, 700)}
+        self.stream_times = {}
+
+    def tearDown(self):
+        self.event_loop.stop()
+
+    async def create_stream(self, text: str):
+        # stand-in for edge tts websocket, sends mp3 in pieces while synthesizing
+        data = self.mp3[text]
+        self.stream_times[text] = [time.monotonic()]
+        for start in range(0, len(data), 500):
+            await asyncio.sleep(0.01)
+            yield data[start:start + 500]
+        self.stream_times[text].append(time.monotonic())
+
+    def test_pipelined_and_ordered(self):
+        pipeline = EdgeTTSPipeline(self.event_loop.loop, self.create_stream, max_concurrency=2)
+        limiter = pipeline.create_limiter()
+        jobs = [SentenceJob(speech_id="speech", text=text) for text in ["first", "second", "third"]]
+        for job in jobs:
+            pipeline.submit(job, limiter)
+        first_audio = jobs[0].result_queue.get(timeout=5)
+        first_audio_time = time.monotonic()
+        results = [[first_audio] + drain(jobs[0])] + [drain(job) for job in jobs[1:]]
+        # audio flows before the sentence is fully synthesized
+        self.assertLess(first_audio_time, self.stream_times["first"][1])
+        # second sentence synthesized together with the first, third waits for a free slot
+        self.assertLess(self.stream_times["second"][0], self.stream_times["first"][1])
+        self.assertGreaterEqual(self.stream_times["third"][0],
+                                min(self.stream_times["first"][1], self.stream_times["second"][1]))
+        for text, audios in zip(["first", "second", "third"], results):
+            expected, _ = soundfile.read(io.BytesIO(self.mp3[text]), dtype="float32")
+            np.testing.assert_allclose(np.concatenate(audios, axis=-1)[0], expected, atol=1e-4)
+
+    def test_cache_and_cancel(self):
+        audio_cache = TTSAudioCache()
+        pipeline = EdgeTTSPipeline(self.event_loop.loop, self.create_stream, min_chunk_samples=2400,
+                                   audio_cache=audio_cache, cache_voice="voice")
+        limiter = pipeline.create_limiter()
+        job = SentenceJob(speech_id="speech", text="first")
+        pipeline.submit(job, limiter)
+        audios = drain(job)
+        self.assertTrue(all(audio.shape[1] >= 2400 for audio in audios[1:-1]))
+        self.assertEqual(len(audio_cache), 1)
+        del self.stream_times["first"]
+        cached_job = SentenceJob(speech_id="speech", text="first")
+        pipeline.submit(cached_job, limiter)
+        np.testing.assert_array_equal(drain(cached_job)[0], np.concatenate(audios, axis=-1))
+        self.assertNotIn("first", self.stream_times)
+        cancelled_job = SentenceJob(speech_id="speech", text="second")
+        pipeline.submit(cancelled_job, limiter)
+        pipeline.cancel(cancelled_job)
+        self.assertTrue(cancelled_job.cancelled)
+        self.assertIsNone(cancelled_job.result_queue.get(timeout=5))
+        # let the loop take the cancelled coroutine before it is stopped, or the coroutine is never awaited
+        asyncio.run_coroutine_threadsafe(asyncio.sleep(0.05), self.event_loop.loop).result(timeout=5)
+
+
+if __name__ == '__main__':
+    unittest.main()
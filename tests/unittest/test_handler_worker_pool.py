@@ -0,0 +1,98 @@
+import threading
+import time
+import unittest
+
+from chat_engine.core.handler_worker_pool import HandlerWorkerPool
+
+
+class TestHandlerWorkerPool(unittest.TestCase):
+    def setUp(self):
+        self.pool = HandlerWorkerPool("test", 4, lane_batch_size=2)
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def test_lane_keeps_order(self):
+        results = {name: [] for name in ["a", "b", "c"]}
+        done = threading.Semaphore(0)
+
+        def make_process(name):
+            def process(data):
+                results[name].append(data)
+                done.release()
+            return process
+
+        lanes = [self.pool.create_lane(make_process(name), name) for name in results.keys()]
+        for i in range(50):
+            for lane in lanes:
+                lane.put_nowait(i)
+        for _ in range(150):
+            self.assertTrue(done.acquire(timeout=2))
+        for values in results.values():
+            self.assertEqual(values, list(range(50)))
+
+    def test_lane_runs_serially(self):
+        running = []
+        overlapped = []
+        done = threading.Semaphore(0)
+
+        def process(_data):
+            running.append(1)
+            if len(running) > 1:
+                overlapped.append(1)
+            time.sleep(0.001)
+            running.pop()
+            done.release()
+
+        lane = self.pool.create_lane(process)
+        for i in range(20):
+            lane.put_nowait(i)
+        for _ in range(20):
+            self.assertTrue(done.acquire(timeout=2))
+        self.assertEqual(overlapped, [])
+
+    def test_max_concurrency(self):
+        pool = HandlerWorkerPool("single", 1)
+        lock = threading.Lock()
+        state = {"running": 0, "peak": 0}
+        done = threading.Semaphore(0)
+
+        def process(_data):
+            with lock:
+                state["running"] += 1
+                state["peak"] = max(state["peak"], state["running"])
+            time.sleep(0.005)
+            with lock:
+                state["running"] -= 1
+            done.release()
+
+        lanes = [pool.create_lane(process) for _ in range(4)]
+        for lane in lanes:
+            lane.put_nowait(0)
+        for _ in range(4):
+            self.assertTrue(done.acquire(timeout=2))
+        pool.shutdown()
+        self.assertEqual(state["peak"], 1)
+
+    def test_close_drops_pending(self):
+        started = threading.Event()
+        release = threading.Event()
+        handled = []
+
+        def process(data):
+            started.set()
+            release.wait(2)
+            handled.append(data)
+
+        lane = self.pool.create_lane(process)
+        lane.put_nowait(0)
+        lane.put_nowait(1)
+        self.assertTrue(started.wait(2))
+        threading.Timer(0.05, release.set).start()
+        lane.close(timeout=2)
+        lane.put_nowait(2)
+        self.assertEqual(handled, [0])
+
+
+if __name__ == '__main__':
+    unittest.main()
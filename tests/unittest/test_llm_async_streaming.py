@@ -0,0 +1,90 @@
+import asyncio
+import threading
+import unittest
+from types import SimpleNamespace
+
+from chat_engine.contexts.session_context import SessionContext
+from chat_engine.data_models.chat_data.chat_data_model import ChatData
+from chat_engine.data_models.chat_data_type import ChatDataType
+from chat_engine.data_models.runtime_data.data_bundle import DataBundle, DataBundleDefinition, DataBundleEntry
+from chat_engine.data_models.session_info_data import SessionInfoData
+from handlers.llm.openai_compatible.llm_handler_openai_compatible import HandlerLLM, LLMConfig
+
+
+class SlowAsyncCompletions:
+    """
+    Streams "reply <n>" for the n-th request, after a delay, so later turns arrive while it is in flight.
+    """
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.requests = []
+
+    async def create(self, model, messages, stream, stream_options):
+        self.requests.append(messages)
+        reply = f"reply {len(self.requests)}"
+
+        async def stream_chunks():
+            await asyncio.sleep(self.delay)
+            for text in [reply[:3], reply[3:]]:
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+        return stream_chunks()
+
+
+class CollectingSubmitter:
+    def __init__(self):
+        self.outputs = []
+        self.turn_ends = threading.Semaphore(0)
+
+    def submit(self, data):
+        self.outputs.append((data.get_main_data(), data.get_meta("avatar_text_end")))
+        if data.get_meta("avatar_text_end"):
+            self.turn_ends.release()
+
+
+class TestAsyncStreaming(unittest.TestCase):
+    def setUp(self):
+        self.handler = HandlerLLM()
+        config = LLMConfig(api_key="test", async_streaming=True)
+        self.handler.load(None, config)
+        self.completions = SlowAsyncCompletions(delay=0.1)
+        self.handler.async_client = SimpleNamespace(chat=SimpleNamespace(completions=self.completions))
+        self.session_context = SessionContext(SessionInfoData(session_id="test"), {}, {})
+        self.context = self.handler.create_context(self.session_context, config)
+        self.submitter = CollectingSubmitter()
+        self.context.data_submitter = self.submitter
+        self.output_definitions = self.handler.get_handler_detail(self.session_context, self.context).outputs
+        self.input_definition = DataBundleDefinition()
+        self.input_definition.add_entry(DataBundleEntry.create_text_entry("human_text"))
+
+    def tearDown(self):
+        self.handler.event_loop.stop()
+
+    def feed_turn(self, text: str, speech_id: str):
+        bundle = DataBundle(self.input_definition)
+        bundle.set_main_data(text)
+        bundle.add_meta("speech_id", speech_id)
+        bundle.add_meta("human_text_end", True)
+        chat_data = ChatData(type=ChatDataType.HUMAN_TEXT, data=bundle)
+        list(self.handler.handle(self.context, chat_data, self.output_definitions) or [])
+
+    def test_next_turn_built_on_previous_reply(self):
+        # second turn ends while the first reply still streams
+        self.feed_turn("first question", "speech-1")
+        self.feed_turn("second question", "speech-2")
+        for _ in range(2):
+            self.assertTrue(self.submitter.turn_ends.acquire(timeout=5))
+        self.assertEqual([message.role for message in self.context.history.message_history],
+                         ["human", "avatar", "human", "avatar"])
+        self.assertEqual([message.content for message in self.context.history.message_history],
+                         ["first question", "reply 1", "second question", "reply 2"])
+        second_request = self.completions.requests[1]
+        self.assertEqual([message["role"] for message in second_request], ["system", "user", "assistant", "user"])
+        self.assertEqual(second_request[2]["content"], "reply 1")
+        self.assertEqual(self.submitter.outputs, [("rep", False), ("ly 1", False), ("", True),
+                                                  ("rep", False), ("ly 2", False), ("", True)])
+
+
+if __name__ == '__main__':
+    unittest.main()
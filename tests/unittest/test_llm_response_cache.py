@@ -0,0 +1,101 @@
+import os
+import tempfile
+import time
+import unittest
+from types import SimpleNamespace
+
+from chat_engine.contexts.session_context import SessionContext
+from chat_engine.data_models.chat_data.chat_data_model import ChatData
+from chat_engine.data_models.chat_data_type import ChatDataType
+from chat_engine.data_models.runtime_data.data_bundle import DataBundle, DataBundleDefinition, DataBundleEntry
+from chat_engine.data_models.session_info_data import SessionInfoData
+from handlers.llm.openai_compatible.llm_handler_openai_compatible import HandlerLLM, LLMConfig
+from handlers.llm.openai_compatible.response_cache import ResponseCache
+
+
+class TestResponseCache(unittest.TestCase):
+    def test_key_normalized(self):
+        key = ResponseCache.make_key("model", "prompt", [{"role": "user", "content": "hi"}], "Hello, there!")
+        self.assertEqual(key, ResponseCache.make_key("model", "prompt", [{"role": "user", "content": "Hi."}],
+                                                     "hello there"))
+        self.assertNotEqual(key, ResponseCache.make_key("other", "prompt", [{"role": "user", "content": "hi"}],
+                                                        "hello there"))
+        self.assertNotEqual(key, ResponseCache.make_key("model", "prompt", [], "hello there"))
+
+    def test_lru(self):
+        cache = ResponseCache(max_size=2)
+        cache.put("a", ["1"])
+        cache.put("b", ["2"])
+        self.assertEqual(cache.get("a"), ["1"])
+        cache.put("c", ["3"])
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), ["1"])
+        self.assertEqual(cache.get("c"), ["3"])
+
+    def test_ttl(self):
+        cache = ResponseCache(ttl=0.01)
+        cache.put("a", ["1"])
+        time.sleep(0.02)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
+
+    def test_persistence(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "cache", "responses.jsonl")
+            cache = ResponseCache(max_size=2, persist_path=path)
+            for key in ["a", "b", "a", "c"]:
+                cache.put(key, [key, "!"])
+            loaded = ResponseCache(max_size=2, persist_path=path)
+            self.assertEqual(loaded.get("a"), ["a", "!"])
+            self.assertEqual(loaded.get("c"), ["c", "!"])
+            self.assertIsNone(loaded.get("b"))
+            with open(path) as f:
+                self.assertEqual(len(f.readlines()), 2)
+
+
+class CountingCompletions:
+    def __init__(self):
+        self.request_num = 0
+
+    def create(self, model, messages, stream, stream_options):
+        self.request_num += 1
+        return [SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+                for text in ["Hi", ", how can", " I help?"]]
+
+
+class TestHandlerResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.handler = HandlerLLM()
+        config = LLMConfig(api_key="test", response_cache=True, response_cache_history=0)
+        self.handler.load(None, config)
+        self.completions = CountingCompletions()
+        self.session_context = SessionContext(SessionInfoData(session_id="test"), {}, {})
+        self.context = self.handler.create_context(self.session_context, config)
+        self.context.client = SimpleNamespace(chat=SimpleNamespace(completions=self.completions))
+        self.output_definitions = self.handler.get_handler_detail(self.session_context, self.context).outputs
+        self.input_definition = DataBundleDefinition()
+        self.input_definition.add_entry(DataBundleEntry.create_text_entry("human_text"))
+
+    def feed(self, text: str, text_end=False):
+        bundle = DataBundle(self.input_definition)
+        bundle.set_main_data(text)
+        bundle.add_meta("speech_id", "speech-1")
+        bundle.add_meta("human_text_end", text_end)
+        chat_data = ChatData(type=ChatDataType.HUMAN_TEXT, data=bundle)
+        return [(output.get_main_data(), output.get_meta("avatar_text_end"))
+                for output in self.handler.handle(self.context, chat_data, self.output_definitions)]
+
+    def test_replay(self):
+        self.feed("Hello!")
+        first = self.feed("", text_end=True)
+        self.feed("hello")
+        second = self.feed("", text_end=True)
+        self.assertEqual(first, [("Hi", False), (", how can", False), (" I help?", False), ("", True)])
+        self.assertEqual(second, first)
+        self.assertEqual(self.completions.request_num, 1)
+        self.assertEqual([message.role for message in self.context.history.message_history],
+                         ["human", "avatar", "human", "avatar"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import threading
+import unittest
+from types import SimpleNamespace
+
+from chat_engine.contexts.session_context import SessionContext
+from chat_engine.data_models.chat_data.chat_data_model import ChatData
+from chat_engine.data_models.chat_data_type import ChatDataType
+from chat_engine.data_models.runtime_data.data_bundle import DataBundle, DataBundleDefinition, DataBundleEntry
+from chat_engine.data_models.session_info_data import SessionInfoData
+from handlers.llm.openai_compatible.llm_handler_openai_compatible import HandlerLLM, LLMConfig
+from handlers.llm.openai_compatible.speculative_completion import normalize_transcript
+
+
+class FakeCompletions:
+    """Stands in for client.chat.completions, it streams the user text back word by word."""
+
+    def __init__(self):
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def create(self, model, messages, stream, stream_options):
+        with self.lock:
+            self.requests.append(messages)
+        text = messages[-1]["content"][0]["text"]
+        return [SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=f"re:{word} "))])
+                for word in text.split()]
+
+
+class TestSpeculativeStart(unittest.TestCase):
+    def setUp(self):
+        self.handler = HandlerLLM()
+        self.completions = FakeCompletions()
+        self.session_context = SessionContext(SessionInfoData(session_id="test"), {}, {})
+        self.context = self.handler.create_context(self.session_context,
+                                                   LLMConfig(api_key="test", speculative_start=True))
+        self.context.client = SimpleNamespace(chat=SimpleNamespace(completions=self.completions))
+        self.output_definitions = self.handler.get_handler_detail(self.session_context, self.context).outputs
+        self.input_definition = DataBundleDefinition()
+        self.input_definition.add_entry(DataBundleEntry.create_text_entry("human_text"))
+
+    def feed(self, text: str, speech_id="speech-1", partial=False, text_end=False):
+        bundle = DataBundle(self.input_definition)
+        bundle.set_main_data(text)
+        bundle.add_meta("speech_id", speech_id)
+        bundle.add_meta("human_text_end", text_end)
+        if partial:
+            bundle.add_meta("human_text_partial", True)
+        chat_data = ChatData(type=ChatDataType.HUMAN_TEXT, data=bundle)
+        outputs = self.handler.handle(self.context, chat_data, self.output_definitions)
+        return [output.get_main_data() for output in outputs or []]
+
+    def finish_turn(self, text: str, speech_id="speech-1"):
+        self.assertEqual(self.feed(text, speech_id), [])
+        return self.feed("", speech_id, text_end=True)
+
+    def test_confirmed_speculation_is_used(self):
+        self.assertEqual(self.feed("hello there", partial=True), [])
+        self.context.speculation.thread.join()
+        outputs = self.finish_turn("Hello, there.")
+        self.assertEqual(outputs, ["re:hello ", "re:there ", ""])
+        self.assertEqual(len(self.completions.requests), 1)
+        self.assertIsNone(self.context.speculation)
+        self.assertEqual([message.role for message in self.context.history.message_history], ["human", "avatar"])
+
+    def test_changed_transcript_restarts(self):
+        self.feed("hello", partial=True)
+        speculation = self.context.speculation
+        self.feed("hello world", partial=True)
+        self.assertTrue(speculation.cancelled.is_set())
+        outputs = self.finish_turn("hello world again")
+        self.assertEqual(outputs, ["re:hello ", "re:world ", "re:again ", ""])
+        self.assertEqual(len(self.completions.requests), 3)
+        # speculative requests do not leave human messages in history
+        self.assertEqual(len(self.context.history.message_history), 2)
+
+    def test_short_partial_ignored(self):
+        self.feed("a", partial=True)
+        self.assertIsNone(self.context.speculation)
+
+    def test_normalize_transcript(self):
+        self.assertEqual(normalize_transcript("<|zh|>你好，世界。"), "你好世界")
+        self.assertEqual(normalize_transcript("Hello, World!"), "helloworld")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import random
+import re
+import unittest
+
+from engine_utils.sentence_segmenter import SentenceSegmenter, filter_text
+
+
+def split_by_regex(tokens):
+    """Segmentation the tts handlers did before, by splitting the accumulated text on every token."""
+    segments = []
+    input_text = ""
+    for token in tokens:
+        input_text += token
+        sentences = re.split(r'(?<=[,.~!?，。！？])', input_text)
+        if len(sentences) > 1:
+            input_text = sentences[-1]
+            segments.extend(sentence for sentence in sentences[:-1] if len(sentence.strip()) > 0)
+    return segments, input_text
+
+
+def tokenize(text, seed=0):
+    rng = random.Random(seed)
+    tokens = []
+    index = 0
+    while index < len(text):
+        size = rng.randint(1, 4)
+        tokens.append(text[index:index + size])
+        index += size
+    return tokens
+
+
+class TestSentenceSegmenter(unittest.TestCase):
+    text = "你好，我是你的数字人助手。今天天气不错！Would you like to go out, or stay home? 好的，那我们出发吧。剩下的"
+
+    def push_all(self, segmenter, tokens):
+        segments = []
+        for token in tokens:
+            segments.extend(segmenter.push(token))
+        return segments
+
+    def test_same_as_regex_split(self):
+        for seed in range(5):
+            tokens = tokenize(self.text, seed)
+            expected, expected_rest = split_by_regex(tokens)
+            segmenter = SentenceSegmenter()
+            self.assertEqual(self.push_all(segmenter, tokens), expected)
+            self.assertEqual(segmenter.flush(), expected_rest)
+
+    def test_short_segments_merged(self):
+        segmenter = SentenceSegmenter(min_chars=5)
+        segments = self.push_all(segmenter, tokenize("嗯，好的。对，是的，我知道了。", 1))
+        # first segment is never merged
+        self.assertEqual(segments, ["嗯，", "好的。对，", "是的，我知道了。"])
+        self.assertIsNone(segmenter.flush())
+
+    def test_punctuation_only_merged(self):
+        segmenter = SentenceSegmenter()
+        self.assertEqual(self.push_all(segmenter, ["你好", "！", "！", "再见", "。"]), ["你好！", "！再见。"])
+
+    def test_first_segment_early(self):
+        segmenter = SentenceSegmenter(first_max_chars=8)
+        segments = self.push_all(segmenter, tokenize("一二三四五六七八九十一二三四五，后面。", 2))
+        self.assertEqual(segments, ["一二三四五六七八", "九十一二三四五，", "后面。"])
+        segmenter = SentenceSegmenter(first_max_chars=12)
+        segments = self.push_all(segmenter, tokenize("hello there my friend, bye.", 3))
+        self.assertEqual(segments[0], "hello there ")
+
+    def test_flush_with_text(self):
+        segmenter = SentenceSegmenter()
+        self.assertEqual(segmenter.push("好的，最后"), ["好的，"])
+        self.assertEqual(segmenter.flush("一句"), "最后一句")
+        self.assertEqual(segmenter.push("新的。"), ["新的。"])
+
+    def test_filter_text(self):
+        self.assertEqual(filter_text("你好*world#，ok~"), "你好world，ok~")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import multiprocessing
+import queue
+import unittest
+
+import numpy as np
+
+from handlers.tts.cosyvoice.shared_audio_ring import AudioChunkReceiver, AudioChunkSender, SharedAudioRing
+
+
+def send_chunks(output_queue, ring_args, chunk_num):
+    sender = AudioChunkSender(output_queue, *ring_args)
+    for i in range(chunk_num):
+        sender.send(i, "session", np.full((1, 300), i, dtype=np.float32))
+    sender.send(chunk_num, "session", None)
+
+
+class TestSharedAudioRing(unittest.TestCase):
+    def test_wrap_around(self):
+        ring = SharedAudioRing(10)
+        try:
+            reader = SharedAudioRing(10, ring.name)
+            first = ring.write(np.arange(7, dtype=np.float32))
+            np.testing.assert_array_equal(reader.read(first, 7), np.arange(7))
+            # chunk crosses the end of the ring
+            second = ring.write(np.arange(6, dtype=np.float32) + 10)
+            np.testing.assert_array_equal(reader.read(second, 6), np.arange(6) + 10)
+            reader.close()
+        finally:
+            ring.close()
+
+    def test_full_ring(self):
+        ring = SharedAudioRing(10)
+        try:
+            self.assertEqual(ring.write(np.zeros(8, dtype=np.float32)), 0)
+            # not read yet, no space left
+            self.assertIsNone(ring.write(np.zeros(4, dtype=np.float32), timeout=0.01))
+            self.assertIsNone(ring.write(np.zeros(11, dtype=np.float32)))
+            ring.read(0, 8)
+            self.assertEqual(ring.write(np.zeros(4, dtype=np.float32), timeout=0.01), 8)
+        finally:
+            ring.close()
+
+    def test_inline_fallback(self):
+        output_queue = queue.Queue()
+        receiver = AudioChunkReceiver(output_queue, 1, 100)
+        try:
+            sender = AudioChunkSender(output_queue, *receiver.create_sender_args(0))
+            small = np.ones((1, 50), dtype=np.float32)
+            large = np.ones((1, 200), dtype=np.float32)
+            sender.send("a", "session", small)
+            sender.send("b", "session", large)
+            sender.send("b", "session", None)
+            self.assertIn('ring', output_queue.queue[0])
+            self.assertIsNotNone(output_queue.queue[1]['tts_speech'])
+            for key, expected in [("a", small), ("b", large), ("b", None)]:
+                output = receiver.receive(timeout=1)
+                self.assertEqual(output['key'], key)
+                if expected is None:
+                    self.assertIsNone(output['tts_speech'])
+                else:
+                    np.testing.assert_array_equal(output['tts_speech'], expected)
+            sender.ring.close()
+        finally:
+            receiver.close()
+
+    def test_worker_process(self):
+        context = multiprocessing.get_context('spawn')
+        output_queue = context.Queue()
+        # ring holds fewer samples than the worker sends, worker waits for reader
+        receiver = AudioChunkReceiver(output_queue, 1, 1000)
+        try:
+            process = context.Process(target=send_chunks, args=(output_queue, receiver.create_sender_args(0), 20))
+            process.start()
+            for i in range(20):
+                output = receiver.receive(timeout=30)
+                self.assertEqual(output['key'], i)
+                self.assertEqual(output['tts_speech'].shape, (1, 300))
+                self.assertTrue(np.all(output['tts_speech'] == i))
+            self.assertIsNone(receiver.receive(timeout=30)['tts_speech'])
+            process.join(30)
+        finally:
+            receiver.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
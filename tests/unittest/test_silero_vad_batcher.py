@@ -0,0 +1,54 @@
+import threading
+import unittest
+
+import numpy as np
+
+from handlers.vad.silerovad.silero_vad_batcher import SileroVADBatcher
+
+
+class SumModel:
+    """Stands in for the onnx session, prob is the clip mean and state accumulates the clip sum."""
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def run(self, _output_names, inputs):
+        clips = inputs["input"]
+        self.batch_sizes.append(clips.shape[0])
+        probs = clips.mean(axis=1, keepdims=True)
+        states = inputs["state"] + clips.sum(axis=1)[np.newaxis, :, np.newaxis]
+        return probs, states
+
+
+class TestSileroVADBatcher(unittest.TestCase):
+    def test_scatter_results(self):
+        model = SumModel()
+        batcher = SileroVADBatcher(model, max_batch_size=8, max_wait=0.05)
+        session_num = 4
+        for _ in range(session_num):
+            batcher.add_session()
+        results = {}
+
+        def run_session(index):
+            state = np.zeros((2, 1, 128), dtype=np.float32)
+            probs = []
+            for step in range(5):
+                prob, state = batcher.infer(np.full(512, index + step, dtype=np.float32), state)
+                probs.append(prob)
+            results[index] = (probs, state)
+
+        threads = [threading.Thread(target=run_session, args=(i,)) for i in range(session_num)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        for index in range(session_num):
+            probs, state = results[index]
+            self.assertEqual(probs, [index + step for step in range(5)])
+            self.assertEqual(state.shape, (2, 1, 128))
+            self.assertEqual(state[0, 0, 0], sum(512 * (index + step) for step in range(5)))
+        self.assertGreater(max(model.batch_sizes), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
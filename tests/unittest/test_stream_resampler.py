@@ -0,0 +1,87 @@
+import unittest
+
+import numpy as np
+from scipy.signal import resample_poly
+
+from engine_utils.stream_resampler import StreamResampler
+from handlers.avatar.liteavatar.media.speech_audio_processor import SpeechAudioProcessor
+from handlers.avatar.liteavatar.model.audio_input import SpeechAudio
+
+
+class TestStreamResampler(unittest.TestCase):
+    def stream(self, resampler, audio, seed=0):
+        rng = np.random.default_rng(seed)
+        outputs = []
+        index = 0
+        while index < audio.shape[0]:
+            size = int(rng.integers(1, 5000))
+            outputs.append(resampler.process(audio[index:index + size]))
+            index += size
+        outputs.append(resampler.flush())
+        return np.concatenate(outputs)
+
+    def test_same_as_whole_signal(self):
+        audio = np.random.default_rng(0).standard_normal(30000).astype(np.float32)
+        for orig_sr, target_sr in [(22050, 24000), (48000, 16000), (16000, 24000)]:
+            resampler = StreamResampler(orig_sr, target_sr)
+            expected = resample_poly(audio, resampler.up, resampler.down)
+            output = self.stream(resampler, audio)
+            self.assertEqual(output.dtype, np.float32)
+            self.assertEqual(output.shape, expected.shape)
+            np.testing.assert_allclose(output, expected, atol=1e-5)
+            # flush starts a new stream
+            np.testing.assert_allclose(self.stream(resampler, audio, 1), expected, atol=1e-5)
+
+    def test_int16(self):
+        audio = (np.random.default_rng(0).standard_normal(30000) * 3000).astype(np.int16)
+        resampler = StreamResampler(24000, 16000)
+        outputs = [resampler.process_int16(audio[:10001].tobytes()), resampler.process_int16(audio[10001:]),
+                   resampler.flush_int16()]
+        output = np.concatenate(outputs)
+        self.assertEqual(output.dtype, np.int16)
+        expected = resample_poly(audio.astype(np.float32) / 32767, 2, 3) * 32767
+        self.assertLessEqual(np.abs(output - expected).max(), 0.51)
+
+    def test_filter_shared_and_delay(self):
+        resampler = StreamResampler(22050, 24000)
+        self.assertIs(resampler.filter_bank, StreamResampler(44100, 48000).filter_bank)
+        input_num = 0
+        output_num = 0
+        rng = np.random.default_rng(0)
+        for _ in range(200):
+            size = int(rng.integers(1, 3000))
+            output_num += resampler.process(np.zeros(size, dtype=np.float32)).shape[0]
+            input_num += size
+            lag = -(-input_num * resampler.up // resampler.down) - output_num
+            self.assertTrue(0 <= lag <= resampler.delay)
+
+    def test_passthrough(self):
+        resampler = StreamResampler(16000, 16000)
+        audio = np.arange(10, dtype=np.float32)
+        np.testing.assert_array_equal(resampler.process(audio), audio)
+        self.assertEqual(resampler.flush().shape, (0,))
+
+
+class TestSpeechAudioSliceResampling(unittest.TestCase):
+    def test_slices_continuous(self):
+        audio = (np.sin(np.arange(24000 * 3 + 5000) * 0.05) * 10000).astype(np.int16)
+        processor = SpeechAudioProcessor(24000, 16000, 1)
+        slices = []
+        for start in range(0, audio.shape[0], 7000):
+            end_of_speech = start + 7000 >= audio.shape[0]
+            speech_audio = SpeechAudio(speech_id="speech", end_of_speech=end_of_speech, sample_rate=24000,
+                                       audio_data=audio[start:start + 7000].tobytes())
+            slices.extend(processor.get_speech_audio_slice(speech_audio))
+        self.assertEqual(len(slices), 4)
+        algo_audios = [np.frombuffer(audio_slice.algo_audio_data, dtype=np.int16) for audio_slice in slices]
+        self.assertTrue(all(algo_audio.shape[0] == 16000 for algo_audio in algo_audios))
+        # same as the whole speech resampled at once, delayed by the resampler lag
+        delay = StreamResampler(24000, 16000).delay
+        expected = resample_poly(audio.astype(np.float32) / 32767, 2, 3) * 32767
+        output = np.concatenate(algo_audios)
+        self.assertTrue(np.all(output[:delay] == 0))
+        self.assertLessEqual(np.abs(output[delay:delay + expected.shape[0]] - expected).max(), 0.51)
+
+
+if __name__ == '__main__':
+    unittest.main()
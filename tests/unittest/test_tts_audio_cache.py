@@ -0,0 +1,143 @@
+import importlib.util
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from chat_engine.contexts.session_context import SessionContext
+from chat_engine.data_models.chat_data.chat_data_model import ChatData
+from chat_engine.data_models.chat_data_type import ChatDataType
+from chat_engine.data_models.runtime_data.data_bundle import DataBundle, DataBundleDefinition, DataBundleEntry
+from chat_engine.data_models.session_info_data import SessionInfoData
+from engine_utils.tts_audio_cache import TTSAudioCache
+
+
+class TestTTSAudioCache(unittest.TestCase):
+    def test_key(self):
+        cache = TTSAudioCache(max_text_chars=10)
+        key = cache.make_key("edgetts", "voice", " 好的。 ", 24000)
+        self.assertEqual(key, cache.make_key("edgetts", "voice", "好的。", 24000))
+        self.assertNotEqual(key, cache.make_key("edgetts", "voice", "好的！", 24000))
+        self.assertNotEqual(key, cache.make_key("edgetts", "other", "好的。", 24000))
+        self.assertNotEqual(key, cache.make_key("edgetts", "voice", "好的。", 16000))
+        self.assertIsNone(cache.make_key("edgetts", "voice", "这句话太长了不值得缓存起来", 24000))
+        self.assertIsNone(cache.make_key("edgetts", "voice", " ", 24000))
+
+    def test_lru(self):
+        cache = TTSAudioCache(max_size=2)
+        for i in range(3):
+            cache.put(str(i), np.full((1, 4), i, dtype=np.float32))
+        self.assertIsNone(cache.get("0"))
+        audio = cache.get("1")
+        np.testing.assert_array_equal(audio, np.full((1, 4), 1))
+        # returned audio is a copy
+        audio[:] = 0
+        np.testing.assert_array_equal(cache.get("1"), np.full((1, 4), 1))
+        cache.put("3", np.zeros((1, 4), dtype=np.float32))
+        self.assertIsNone(cache.get("2"))
+        self.assertIsNone(cache.get(None))
+
+    def test_store_dir(self):
+        with tempfile.TemporaryDirectory() as store_dir:
+            cache = TTSAudioCache(store_dir=store_dir)
+            key = cache.make_key("cosyvoice", "spk", "你好。", 24000)
+            cache.put(key, np.arange(8, dtype=np.float32).reshape(1, 8))
+            self.assertTrue(os.path.isfile(os.path.join(store_dir, f"{key}.npy")))
+            # new process starts with empty memory and loads from store
+            cache = TTSAudioCache(store_dir=store_dir)
+            audio = cache.get(key)
+            np.testing.assert_array_equal(audio, np.arange(8).reshape(1, 8))
+            self.assertEqual(audio.dtype, np.float32)
+            self.assertEqual(len(cache), 1)
+            self.assertIsNone(cache.get(cache.make_key("cosyvoice", "spk", "再见。", 24000)))
+
+
+class FakeSynthesizer:
+    """
+    Answers the text of a reply with 100 samples of pcm per character once the reply is completed.
+    """
+
+    def __init__(self):
+        self.callback = None
+        self.texts = []
+
+    def streaming_call(self, text):
+        self.texts.append(text)
+
+    def streaming_complete(self):
+        text = "".join(self.texts)
+        self.callback.on_data((np.arange(len(text) * 100) % 1000).astype(np.int16).tobytes())
+        self.callback.on_complete()
+
+
+class FakeSynthesizerPool:
+    def __init__(self):
+        self.leased = []
+
+    def lease(self):
+        self.leased.append(FakeSynthesizer())
+        return self.leased[-1]
+
+
+class CollectingSubmitter:
+    def __init__(self):
+        self.outputs = []
+
+    def submit(self, data):
+        self.outputs.append(data)
+
+
+@unittest.skipUnless(importlib.util.find_spec("dashscope"), "dashscope is not installed")
+class TestBailianHandlerCache(unittest.TestCase):
+    def setUp(self):
+        from handlers.tts.bailian_tts.tts_handler_cosyvoice_bailian import HandlerTTS, TTSConfig
+        self.handler = HandlerTTS()
+        config = TTSConfig(api_key="test", voice="voice", connection_pool_size=0, audio_cache_max_chars=20)
+        self.handler.load(None, config)
+        self.handler.synthesizer_pool = FakeSynthesizerPool()
+        session_context = SessionContext(SessionInfoData(session_id="test"), {}, {})
+        self.context = self.handler.create_context(session_context, config)
+        self.submitter = CollectingSubmitter()
+        self.context.data_submitter = self.submitter
+        self.output_definitions = self.handler.get_handler_detail(session_context, self.context).outputs
+        self.input_definition = DataBundleDefinition()
+        self.input_definition.add_entry(DataBundleEntry.create_text_entry("avatar_text"))
+
+    def feed(self, text: str, text_end=False):
+        bundle = DataBundle(self.input_definition)
+        bundle.set_main_data(text)
+        bundle.add_meta("speech_id", "speech-1")
+        bundle.add_meta("avatar_text_end", text_end)
+        self.handler.handle(self.context, ChatData(type=ChatDataType.AVATAR_TEXT, data=bundle),
+                            self.output_definitions)
+
+    def feed_reply(self, chunks):
+        # as the llm handler sends a reply: streamed chunks, then an empty bundle ending it
+        self.submitter.outputs = []
+        for chunk in chunks:
+            self.feed(chunk)
+        self.feed("", text_end=True)
+        return [(output.get_main_data(), output.get_meta("avatar_speech_end")) for output in self.submitter.outputs]
+
+    def test_short_reply_replayed(self):
+        first = self.feed_reply(["Hi", ", how can", " I help?"])
+        self.assertEqual(len(self.handler.synthesizer_pool.leased), 1)
+        self.assertEqual(self.handler.synthesizer_pool.leased[0].texts, ["Hi, how can I help?"])
+        second = self.feed_reply(["Hi", ", how can", " I help?"])
+        self.assertEqual(len(self.handler.synthesizer_pool.leased), 1)
+        self.assertEqual([end for _, end in second], [False, True])
+        np.testing.assert_array_equal(second[0][0], np.concatenate([audio for audio, _ in first[:-1]], axis=-1))
+
+    def test_long_reply_streamed(self):
+        self.feed("This reply is far too long ")
+        # synthesis starts before the reply ends once it cannot be cached
+        self.assertEqual(self.handler.synthesizer_pool.leased[0].texts, ["This reply is far too long "])
+        self.feed("to be cached.")
+        self.feed("", text_end=True)
+        self.feed_reply(["This reply is far too long ", "to be cached."])
+        self.assertEqual(len(self.handler.synthesizer_pool.leased), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import importlib.util
+import queue
+import time
+import unittest
+
+import numpy as np
+
+from chat_engine.common.handler_base import HandlerBase, HandlerBaseInfo, HandlerDataInfo, HandlerDetail
+from chat_engine.contexts.handler_context import HandlerContext
+from chat_engine.contexts.session_context import SessionContext
+from chat_engine.core.chat_session import ChatSession
+from chat_engine.data_models.chat_data.chat_data_model import ChatData
+from chat_engine.data_models.chat_data_type import ChatDataType
+from chat_engine.data_models.chat_engine_config_data import ChatEngineConfigModel, HandlerBaseConfigModel
+from chat_engine.data_models.chat_signal import ChatSignal
+from chat_engine.data_models.chat_signal_type import ChatSignalSourceType, ChatSignalType
+from chat_engine.data_models.runtime_data.data_bundle import DataBundle, DataBundleDefinition, DataBundleEntry
+from chat_engine.data_models.session_info_data import SessionInfoData
+
+
+class PipelineEndHandler(HandlerBase):
+    """
+    Stands for the llm in front of tts and the avatar behind it: submits avatar text given by the test, and collects
+    avatar audio.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.received = queue.Queue()
+        self.text_definition = DataBundleDefinition()
+        self.text_definition.add_entry(DataBundleEntry.create_text_entry("avatar_text"))
+
+    def get_handler_info(self) -> HandlerBaseInfo:
+        return HandlerBaseInfo(config_model=HandlerBaseConfigModel)
+
+    def load(self, engine_config, handler_config=None):
+        pass
+
+    def create_context(self, session_context, handler_config=None) -> HandlerContext:
+        return HandlerContext(session_context.session_info.session_id)
+
+    def start_context(self, session_context, handler_context):
+        pass
+
+    def get_handler_detail(self, session_context, context) -> HandlerDetail:
+        inputs = {ChatDataType.AVATAR_AUDIO: HandlerDataInfo(type=ChatDataType.AVATAR_AUDIO)}
+        outputs = {
+            ChatDataType.AVATAR_TEXT: HandlerDataInfo(type=ChatDataType.AVATAR_TEXT, definition=self.text_definition),
+        }
+        return HandlerDetail(inputs=inputs, outputs=outputs)
+
+    def handle(self, context, inputs: ChatData, output_definitions):
+        self.received.put((inputs.data.get_meta("speech_id"), inputs.data.get_meta("avatar_speech_end")))
+
+    def destroy_context(self, context):
+        pass
+
+
+@unittest.skipUnless(importlib.util.find_spec("torch") and importlib.util.find_spec("modelscope"),
+                     "torch or modelscope is not installed")
+class TestCosyVoiceHandlerInterrupt(unittest.TestCase):
+    def setUp(self):
+        from handlers.tts.cosyvoice.tts_handler_cosyvoice import HandlerTTS, TTSConfig
+        from handlers.tts.cosyvoice.tts_task_scheduler import TTSTaskScheduler
+        self.handler = HandlerTTS()
+        self.handler.sample_rate = 24000
+        # workers are not started, dispatched sentences are answered by the test
+        self.dispatched = []
+        self.handler.task_scheduler = TTSTaskScheduler(self.dispatched.append, worker_num=1, session_concurrency=2)
+        self.session_context = SessionContext(SessionInfoData(session_id="test"), {}, {})
+        self.session = ChatSession(self.session_context, ChatEngineConfigModel())
+        self.pipeline_end = PipelineEndHandler()
+        self.pipeline_end_env = self.session.prepare_handler(self.pipeline_end, HandlerBaseInfo(name="pipeline_end"),
+                                                             HandlerBaseConfigModel())
+        self.session.prepare_handler(self.handler, HandlerBaseInfo(name="tts"), TTSConfig(segment_min_chars=0))
+        self.session.start()
+
+    def tearDown(self):
+        self.session.stop()
+
+    def submit_text(self, text: str, speech_id: str, text_end=False):
+        bundle = DataBundle(self.pipeline_end.text_definition)
+        bundle.set_main_data(text)
+        bundle.add_meta("speech_id", speech_id)
+        bundle.add_meta("avatar_text_end", text_end)
+        self.pipeline_end_env.context.submit_data(bundle)
+
+    def wait_dispatched(self, num: int):
+        deadline = time.monotonic() + 5
+        while len(self.dispatched) < num and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return [tts_info["text"] for tts_info in self.dispatched]
+
+    def test_speech_start_only_delivered(self):
+        tts_sink = [sink for sink in self.session.data_sinks[ChatDataType.HUMAN_AUDIO] if sink.owner == "tts"][0]
+        definition = DataBundleDefinition()
+        definition.add_entry(DataBundleEntry.create_audio_entry("human_audio", 1, 16000))
+        bundle = DataBundle(definition)
+        bundle.set_main_data(np.zeros((1, 512), dtype=np.float32))
+        self.assertFalse(tts_sink.accept(ChatData(type=ChatDataType.HUMAN_AUDIO, data=bundle)))
+        bundle.add_meta("human_speech_start", True)
+        self.assertTrue(tts_sink.accept(ChatData(type=ChatDataType.HUMAN_AUDIO, data=bundle)))
+
+    def test_cancel_on_client_interrupt(self):
+        self.submit_text("First one. Second one. Third", "speech-1")
+        self.assertEqual(self.wait_dispatched(1), ["First one.。"])
+        self.assertEqual(self.handler.task_scheduler.pending_num, 1)
+
+        # as the rtc client delegate emits the stop_chat message of the client
+        self.session_context.signal_emitter(ChatSignal(type=ChatSignalType.INTERRUPT,
+                                                       source_type=ChatSignalSourceType.CLIENT, source_name="rtc"))
+        self.assertEqual(self.handler.task_scheduler.pending_num, 0)
+        self.assertEqual(len(self.handler.task_router), 0)
+        # audio of the sentence being synthesized is dropped, as the audio consumer does for worker output
+        key = self.dispatched[0]["key"]
+        self.assertFalse(self.handler.task_router.route(key, np.ones((1, 4), dtype=np.float32)))
+        self.handler.task_scheduler.finish(key)
+
+        # rest of the interrupted reply is not synthesized, its end is still delivered
+        self.submit_text(" one. Fourth one.", "speech-1")
+        self.submit_text("", "speech-1", text_end=True)
+        self.assertEqual(self.pipeline_end.received.get(timeout=5), ("speech-1", True))
+        self.assertTrue(self.pipeline_end.received.empty())
+
+        self.submit_text("New reply.", "speech-2")
+        self.assertEqual(self.wait_dispatched(2), ["First one.。", "New reply.。"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import threading
+import unittest
+
+import numpy as np
+
+from handlers.tts.cosyvoice.tts_task_router import HandlerTask, TTSTaskRouter
+
+
+def drain(task: HandlerTask):
+    results = []
+    while True:
+        audio = task.result_queue.get(timeout=1)
+        if audio is None:
+            return results
+        results.append(audio)
+
+
+class TestTTSTaskRouter(unittest.TestCase):
+    def test_route_and_complete(self):
+        router = TTSTaskRouter()
+        tasks = [HandlerTask(speech_id="speech-1", session_id="a") for _ in range(3)]
+        for task in tasks:
+            router.register(task)
+        # workers finish out of order, every chunk lands on its own task
+        for index in [2, 0, 1, 0]:
+            self.assertTrue(router.route(tasks[index].id, np.full(4, index)))
+        for task in tasks:
+            self.assertTrue(router.route(task.id, None))
+            self.assertTrue(task.done.is_set())
+        self.assertEqual(len(router), 0)
+        self.assertEqual([len(drain(task)) for task in tasks], [2, 1, 1])
+        self.assertFalse(router.route(tasks[0].id, np.zeros(4)))
+
+    def test_cancel_session(self):
+        router = TTSTaskRouter()
+        first = HandlerTask(speech_id="speech-1", session_id="a")
+        second = HandlerTask(speech_id="speech-2", session_id="a")
+        other = HandlerTask(speech_id="speech-1", session_id="b")
+        for task in [first, second, other]:
+            router.register(task)
+        router.route(first.id, np.zeros(4))
+        self.assertEqual(router.cancel_session("a", "speech-1"), [first])
+        self.assertTrue(first.cancelled)
+        self.assertEqual(len(drain(first)), 1)
+        # audio arriving after cancellation is dropped
+        self.assertFalse(router.route(first.id, np.zeros(4)))
+        self.assertEqual(router.cancel_session("a"), [second])
+        self.assertFalse(other.cancelled)
+        self.assertEqual(len(router), 1)
+
+    def test_consumer_wakes_on_audio(self):
+        router = TTSTaskRouter()
+        task = HandlerTask(session_id="a")
+        router.register(task)
+        results = []
+        consumer = threading.Thread(target=lambda: results.extend(drain(task)))
+        consumer.start()
+        router.route(task.id, np.ones(4))
+        router.complete(task.id)
+        consumer.join(1)
+        self.assertFalse(consumer.is_alive())
+        self.assertEqual(len(results), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+import uuid
+
+from handlers.tts.cosyvoice.tts_task_scheduler import ScheduledTask, TTSTaskScheduler
+
+
+def create_task(session_id, speech_id, text, first=False):
+    key = uuid.uuid4()
+    return ScheduledTask(key=key, session_id=session_id, speech_id=speech_id, first=first,
+                         tts_info={"text": text, "key": key, "session_id": session_id})
+
+
+class TestTTSTaskScheduler(unittest.TestCase):
+    def setUp(self):
+        self.dispatched = []
+
+    def texts(self):
+        return [tts_info["text"] for tts_info in self.dispatched]
+
+    def test_worker_bound(self):
+        scheduler = TTSTaskScheduler(self.dispatched.append, worker_num=2, session_concurrency=4)
+        for i in range(4):
+            scheduler.submit(create_task("a", "s1", f"a{i}"))
+        self.assertEqual(self.texts(), ["a0", "a1"])
+        self.assertEqual(scheduler.pending_num, 2)
+        self.assertTrue(scheduler.finish(self.dispatched[0]["key"]))
+        self.assertFalse(scheduler.finish(self.dispatched[0]["key"]))
+        self.assertEqual(self.texts(), ["a0", "a1", "a2"])
+
+    def test_round_robin_and_session_bound(self):
+        scheduler = TTSTaskScheduler(self.dispatched.append, worker_num=1, session_concurrency=1)
+        for i in range(3):
+            scheduler.submit(create_task("a", "s1", f"a{i}"))
+        for i in range(2):
+            scheduler.submit(create_task("b", "s2", f"b{i}"))
+        while len(self.dispatched) < 5:
+            scheduler.finish(self.dispatched[-1]["key"])
+        self.assertEqual(self.texts(), ["a0", "b0", "a1", "b1", "a2"])
+        # one worker per session, second worker stays idle while only one session has work
+        scheduler = TTSTaskScheduler(self.dispatched.append, worker_num=2, session_concurrency=1)
+        self.dispatched.clear()
+        scheduler.submit(create_task("a", "s1", "a0"))
+        scheduler.submit(create_task("a", "s1", "a1"))
+        self.assertEqual(self.texts(), ["a0"])
+
+    def test_first_sentence_goes_first(self):
+        scheduler = TTSTaskScheduler(self.dispatched.append, worker_num=1, session_concurrency=2)
+        scheduler.submit(create_task("a", "s1", "a0", first=True))
+        for i in range(1, 4):
+            scheduler.submit(create_task("a", "s1", f"a{i}"))
+        scheduler.submit(create_task("b", "s2", "b0", first=True))
+        scheduler.finish(self.dispatched[-1]["key"])
+        self.assertEqual(self.texts(), ["a0", "b0"])
+
+    def test_cancel_speech(self):
+        scheduler = TTSTaskScheduler(self.dispatched.append, worker_num=1, session_concurrency=1)
+        scheduler.submit(create_task("a", "s1", "a0"))
+        scheduler.submit(create_task("a", "s1", "a1"))
+        scheduler.submit(create_task("a", "s2", "a2", first=True))
+        scheduler.submit(create_task("b", "s3", "b0"))
+        cancelled = scheduler.cancel("a", "s1")
+        self.assertEqual([task.tts_info["text"] for task in cancelled], ["a1"])
+        scheduler.finish(self.dispatched[0]["key"])
+        scheduler.finish(self.dispatched[1]["key"])
+        self.assertEqual(self.texts(), ["a0", "a2", "b0"])
+        self.assertEqual(scheduler.cancel("b"), [])
+        self.assertEqual(scheduler.pending_num, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+
+import numpy as np
+
+from chat_engine.contexts.session_context import SessionContext
+from chat_engine.data_models.chat_data.chat_data_model import ChatData
+from chat_engine.data_models.chat_data_type import ChatDataType
+from chat_engine.data_models.runtime_data.data_bundle import DataBundle, DataBundleDefinition, DataBundleEntry
+from chat_engine.data_models.session_info_data import SessionInfoData
+from engine_utils.general_slicer import SliceContext, slice_data, slice_data_stacked
+from handlers.vad.silerovad.vad_handler_silero import HandlerAudioVAD, SileroVADConfigModel
+
+
+class LoudnessModel:
+    """Stands in for the onnx session, clips with positive samples are speech."""
+
+    def run(self, _output_names, inputs):
+        probs = (inputs["input"].mean(axis=1, keepdims=True) > 0).astype(np.float32)
+        return probs, inputs["state"]
+
+
+class TestSliceDataStacked(unittest.TestCase):
+    def test_same_as_slice_data(self):
+        context = SliceContext.create_numpy_slice_context(4, 0)
+        stacked_context = SliceContext.create_numpy_slice_context(4, 0)
+        data = np.arange(50)
+        for chunk in np.split(data, [3, 10, 11, 30]):
+            expected = list(slice_data(context, chunk))
+            start_id = stacked_context.get_next_slice_start_index()
+            result = slice_data_stacked(stacked_context, chunk)
+            self.assertEqual(len(result), len(expected))
+            for row, clip in zip(result, expected):
+                np.testing.assert_array_equal(row, clip)
+            self.assertEqual(stacked_context.next_slice_start_id, context.next_slice_start_id)
+            self.assertEqual(start_id + len(result) * 4, stacked_context.next_slice_start_id)
+        np.testing.assert_array_equal(stacked_context.last_remainder, context.last_remainder)
+
+
+class TestHandlerAudioVAD(unittest.TestCase):
+    def setUp(self):
+        self.handler = HandlerAudioVAD()
+        self.handler.model = LoudnessModel()
+        self.config = SileroVADConfigModel(start_delay=1024, end_delay=1024, buffer_look_back=512,
+                                           speech_padding=512, batch_inference=False)
+        self.session_context = SessionContext(SessionInfoData(session_id="test"), {}, {})
+        self.context = self.handler.create_context(self.session_context, self.config)
+        self.output_definitions = self.handler.get_handler_detail(self.session_context, self.context).outputs
+        self.input_definition = DataBundleDefinition()
+        self.input_definition.add_entry(DataBundleEntry.create_audio_entry("mic_audio", 1, 16000))
+        self.sample_id = 0
+
+    def feed(self, audio: np.ndarray):
+        bundle = DataBundle(self.input_definition)
+        bundle.set_main_data(audio[np.newaxis, :].astype(np.float32))
+        chat_data = ChatData(type=ChatDataType.MIC_AUDIO, data=bundle, timestamp=(self.sample_id, 16000))
+        self.sample_id += audio.shape[0]
+        return list(self.handler.handle(self.context, chat_data, self.output_definitions))
+
+    def test_speech_clips_coalesced(self):
+        silence = np.full(512 * 4, -0.1)
+        speech = np.full(512 * 10, 0.1)
+        self.assertEqual(self.feed(silence), [])
+        outputs = self.feed(speech)
+        # start of speech with look back, then one bundle with the rest of speech clips
+        self.assertEqual(len(outputs), 2)
+        self.assertTrue(outputs[0].data.get_meta("human_speech_start"))
+        self.assertEqual(outputs[1].data.get_main_data().shape, (1, 512 * 8))
+        self.assertEqual(outputs[1].timestamp[0], 512 * 6)
+        speech_id = outputs[0].data.get_meta("speech_id")
+        self.assertEqual(outputs[1].data.get_meta("speech_id"), speech_id)
+
+        outputs = self.feed(np.concatenate([speech[:512 * 3], silence]))
+        self.assertEqual(len(outputs), 2)
+        self.assertEqual(outputs[0].data.get_main_data().shape, (1, 512 * 4))
+        self.assertTrue(outputs[1].data.get_meta("human_speech_end"))
+        self.assertEqual(outputs[1].data.get_meta("speech_id"), speech_id)
+        self.assertFalse(self.session_context.shared_states.enable_vad)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import base64
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from handlers.llm.openai_compatible.vision_frame_sampler import VisionFrameSampler
+
+
+class CountingSampler(VisionFrameSampler):
+    encode_num = 0
+
+    @classmethod
+    def encode(cls, frame: np.ndarray, jpeg_quality: int) -> str:
+        cls.encode_num += 1
+        return super().encode(frame, jpeg_quality)
+
+
+class TestVisionFrameSampler(unittest.TestCase):
+    def setUp(self):
+        CountingSampler.encode_num = 0
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def test_downscale_and_encode(self):
+        sampler = VisionFrameSampler(self.executor, max_size=64)
+        frame = np.random.randint(0, 255, (1, 480, 640, 3), dtype=np.uint8)
+        sampler.update(frame)
+        self.assertEqual(sampler.frame.shape, (48, 64, 3))
+        image_url = sampler.get_image_url()
+        self.assertTrue(image_url.startswith("data:image/jpeg;base64,"))
+        decoded = cv2.imdecode(np.frombuffer(base64.b64decode(image_url.split(",", 1)[1]), dtype=np.uint8),
+                               cv2.IMREAD_COLOR)
+        self.assertEqual(decoded.shape, (48, 64, 3))
+        sampler.clear()
+        self.assertIsNone(sampler.get_image_url())
+
+    def test_latest_frame_kept(self):
+        # rate is limited by the camera subscription, every delivered frame replaces the previous one
+        sampler = VisionFrameSampler(None, max_size=64)
+        sampler.update(np.zeros((32, 32, 3), dtype=np.uint8))
+        latest = np.ones((32, 32, 3), dtype=np.uint8)
+        sampler.update(latest)
+        self.assertEqual(sampler.frame_version, 2)
+        np.testing.assert_array_equal(sampler.frame, latest)
+
+    def test_encode_reused(self):
+        sampler = CountingSampler(self.executor, max_size=64)
+        frame = np.full((32, 32, 3), 128, dtype=np.uint8)
+        sampler.update(frame)
+        first_url = sampler.get_image_url()
+        # same picture again, and url requested twice
+        time.sleep(0.001)
+        sampler.update(frame.copy())
+        self.assertEqual(sampler.get_image_url(), first_url)
+        self.assertEqual(sampler.get_image_url(), first_url)
+        self.assertEqual(CountingSampler.encode_num, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()